@@ -58,6 +58,41 @@ function gcbAssessmentAudit(data_dict) {
   gcbAudit(gcbCanRecordStudentEvents, data_dict, 'attempt-assessment', true);
 }
 
+// Asynchronous events are held briefly and sent together to the batch
+// endpoint; bursts (e.g., video or tag events) then cost a single POST.
+var gcbEventBatchDelayMs = 1000;
+var gcbEventBatchMaxSize = 50;
+var gcbPendingEvents = [];
+var gcbPendingEventsTimer = null;
+
+function gcbFlushEvents(is_async) {
+  if (gcbPendingEventsTimer) {
+    clearTimeout(gcbPendingEventsTimer);
+    gcbPendingEventsTimer = null;
+  }
+  if (gcbPendingEvents.length == 0) {
+    return;
+  }
+  var events = gcbPendingEvents;
+  gcbPendingEvents = [];
+  var url, request;
+  if (events.length == 1) {
+    url = 'rest/events';
+    request = $.extend({'xsrf_token': eventXsrfToken}, events[0]);
+  } else {
+    url = 'rest/events/batch';
+    request = {'events': events, 'xsrf_token': eventXsrfToken};
+  }
+  $.ajax({
+      url: url,
+      type: 'POST',
+      async: is_async,
+      data: {'request': JSON.stringify(request)},
+      success: function(){},
+      error: function(){}
+  });
+}
+
 function gcbAudit(can_post, data_dict, source, is_async) {
   // There may be a course-specific config to save $$ by preventing us
   // from emitting too much volume to AppEngine; respect that setting.
@@ -65,18 +100,18 @@ function gcbAudit(can_post, data_dict, source, is_async) {
     data_dict['location'] = '' + window.location;
     data_dict['loc'] = {}
     data_dict['loc']['page_locale'] = $('body').data('gcb-page-locale')
-    var request = {
+    gcbPendingEvents.push({
         'source': source,
-        'payload': JSON.stringify(data_dict),
-        'xsrf_token': eventXsrfToken};
-    $.ajax({
-        url: 'rest/events',
-        type: 'POST',
-        async: is_async,
-        data: {'request': JSON.stringify(request)},
-        success: function(){},
-        error: function(){}
-    });
+        'payload': JSON.stringify(data_dict)});
+    if (!is_async || gcbPendingEvents.length >= gcbEventBatchMaxSize) {
+      // Synchronous events must reach the server before we return; send any
+      // queued events along with them so that ordering is preserved.
+      gcbFlushEvents(is_async);
+    } else if (!gcbPendingEventsTimer) {
+      gcbPendingEventsTimer = setTimeout(function() {
+        gcbFlushEvents(true);
+      }, gcbEventBatchDelayMs);
+    }
   }
 
   // ----------------------------------------------------------------------
@@ -37,6 +37,9 @@ from models.counters import PerfCounter
 # max size for in-process jinja template cache
 MAX_GLOBAL_CACHE_SIZE_BYTES = 8 * 1024 * 1024
 
+# max number of configured jinja environments kept for reuse across requests
+MAX_POOLED_ENVIRONMENTS = 200
+
 # this cache used to be memcache based; now it's in-process
 CAN_USE_JINJA2_TEMPLATE_CACHE = config.ConfigProperty(
     'gcb_can_use_jinja2_template_cache', bool,
@@ -102,6 +105,40 @@ def get_gcb_tags_filter(handler):
     return gcb_tags
 
 
+# Name under which bind_template() passes the request's handler to templates.
+GCB_TAGS_HANDLER = 'gcb_tags_handler'
+
+
+@jinja2.contextfilter
+def _gcb_tags_for_context(context, data):
+    return get_gcb_tags_filter(context.get(GCB_TAGS_HANDLER))(data)
+
+
+def bind_template(template, handler=None, **values):
+    """Gets a copy of template rendering with request-specific values.
+
+    Environments are pooled and shared between requests, so nothing that
+    belongs to one request may be stored in their filters or globals.  The
+    copy made here carries such values as globals of its own instead; they
+    are seen by the template and by any template it extends or includes,
+    and are released with the copy when the request ends.
+
+    Args:
+      template: a jinja2.Template from any environment.
+      handler: the request handler custom tags in the template are rendered
+          for by the gcb_tags filter.
+      **values: other globals to make available while rendering.
+
+    Returns:
+      A jinja2.Template.
+    """
+    bound = object.__new__(template.__class__)
+    bound.__dict__.update(template.__dict__)
+    bound.globals = dict(template.globals, **values)
+    bound.globals[GCB_TAGS_HANDLER] = handler
+    return bound
+
+
 class ProcessScopedJinjaCache(caching.ProcessScopedSingleton):
     """This class holds in-process cache of Jinja compiled templates."""
 
@@ -151,6 +188,36 @@ JINJA_CACHE_LEN.poll_value = ProcessScopedJinjaCache.get_cache_len
 JINJA_CACHE_SIZE_BYTES.poll_value = ProcessScopedJinjaCache.get_cache_size
 
 
+class ProcessScopedJinjaEnvironmentPool(caching.ProcessScopedSingleton):
+    """This class holds in-process pool of configured Jinja environments.
+
+    Reusing an environment lets Jinja serve templates from its own cache of
+    compiled templates; the loader's uptodate callbacks decide when a template
+    must be reloaded.
+    """
+
+    @classmethod
+    def get_pool_len(cls):
+        return len(ProcessScopedJinjaEnvironmentPool.instance().cache.items)
+
+    def __init__(self):
+        self.cache = caching.LRUCache(max_item_count=MAX_POOLED_ENVIRONMENTS)
+
+
+JINJA_ENVIRONMENT_POOL_LEN = PerfCounter(
+    'gcb-models-JinjaEnvironmentPool-len',
+    'A total number of Jinja environments held for reuse.')
+JINJA_ENVIRONMENT_POOL_HIT = PerfCounter(
+    'gcb-models-JinjaEnvironmentPool-hit',
+    'A number of times a pooled Jinja environment was reused.')
+JINJA_ENVIRONMENT_POOL_MISS = PerfCounter(
+    'gcb-models-JinjaEnvironmentPool-miss',
+    'A number of times a new Jinja environment had to be created.')
+
+JINJA_ENVIRONMENT_POOL_LEN.poll_value = (
+    ProcessScopedJinjaEnvironmentPool.get_pool_len)
+
+
 def create_jinja_environment(loader, locale=None, autoescape=True):
     """Create proper jinja environment."""
 
@@ -165,10 +232,12 @@ def create_jinja_environment(loader, locale=None, autoescape=True):
 
     jinja_environment.filters['js_string'] = js_string
     jinja_environment.filters['to_json'] = _to_json_jinja
+    jinja_environment.filters['gcb_tags'] = _gcb_tags_for_context
 
     if locale:
         i18n.get_i18n().set_locale(locale)
-        jinja_environment.install_gettext_translations(i18n)
+    # The translations read the locale active for the request at render time.
+    jinja_environment.install_gettext_translations(i18n)
 
     old_handle_exception = jinja_environment.handle_exception
 
@@ -183,9 +252,58 @@ def create_jinja_environment(loader, locale=None, autoescape=True):
     return jinja_environment
 
 
+def get_jinja_environment(
+    loader_factory, dirs, locale=None, autoescape=True, owner=None):
+    """Gets a configured jinja environment, reusing one from the pool.
+
+    Environments are pooled by namespace, owner, template dirs, locale and
+    autoescape setting.  Pooling is turned off together with the template
+    cache; a new environment is then made on every call.
+
+    Args:
+      loader_factory: a callable that returns a new jinja2 loader; only called
+          when no pooled environment can be reused.
+      dirs: a list of template folders searched by the loader.
+      locale: a locale to install gettext translations for, or None.
+      autoescape: whether to autoescape rendered values.
+      owner: an optional object the loader reads templates through (e.g., a
+          file system); environments are never shared between owners.
+
+    Returns:
+      A jinja2.Environment.
+    """
+    if not CAN_USE_JINJA2_TEMPLATE_CACHE.value:
+        return create_jinja_environment(
+            loader_factory(), locale=locale, autoescape=autoescape)
+
+    key = (
+        models.MemcacheManager.get_namespace(),
+        id(owner) if owner is not None else None,
+        tuple(dirs), locale, autoescape)
+    pool = ProcessScopedJinjaEnvironmentPool.instance().cache
+    found, jinja_environment = pool.get(key)
+    if found:
+        JINJA_ENVIRONMENT_POOL_HIT.inc()
+        if locale:
+            # The active locale is held per request; the translations
+            # installed into the environment read it at render time.
+            i18n.get_i18n().set_locale(locale)
+        return jinja_environment
+
+    JINJA_ENVIRONMENT_POOL_MISS.inc()
+    jinja_environment = create_jinja_environment(
+        loader_factory(), locale=locale, autoescape=autoescape)
+    pool.put(key, jinja_environment)
+    return jinja_environment
+
+
 def create_and_configure_jinja_environment(
-    dirs, autoescape=True, handler=None, default_locale='en_US'):
-    """Sets up an environment and gets jinja template."""
+    dirs, autoescape=True, default_locale='en_US'):
+    """Sets up an environment for the current course's locale.
+
+    The environment may be shared with other requests; render its templates
+    through bind_template() to give them a handler for custom tags.
+    """
 
     # Defer to avoid circular import.
     from controllers import sites
@@ -199,18 +317,17 @@ def create_and_configure_jinja_environment(
     if not locale:
         locale = default_locale
 
-    jinja_environment = create_jinja_environment(
-        jinja2.FileSystemLoader(dirs), locale=locale, autoescape=autoescape)
-
-    jinja_environment.filters['gcb_tags'] = get_gcb_tags_filter(handler)
-
-    return jinja_environment
+    return get_jinja_environment(
+        lambda: jinja2.FileSystemLoader(dirs), dirs, locale=locale,
+        autoescape=autoescape)
 
 
 def get_template(
     template_name, dirs, autoescape=True, handler=None, default_locale='en_US'):
-    return create_and_configure_jinja_environment(
-        dirs, autoescape, handler, default_locale).get_template(template_name)
+    return bind_template(
+        create_and_configure_jinja_environment(
+            dirs, autoescape, default_locale).get_template(template_name),
+        handler=handler)
 
 
 def render_partial_template(name, dirs, values, **kwargs):
@@ -260,24 +260,6 @@ def validate_object_matches_json_schema(obj, schema, path='', complaints=None):
       validated without error.
     """
 
-    def is_valid_url(obj):
-        url = urlparse.urlparse(obj)
-        return url.scheme and url.netloc
-
-    def is_valid_date(obj):
-        try:
-            datetime.datetime.strptime(obj, ISO_8601_DATE_FORMAT)
-            return True
-        except ValueError:
-            return False
-
-    def is_valid_datetime(obj):
-        try:
-            datetime.datetime.strptime(obj, ISO_8601_DATETIME_FORMAT)
-            return True
-        except ValueError:
-            return False
-
     if complaints is None:
         complaints = []
     if 'properties' in schema or isinstance(obj, dict):
@@ -322,37 +304,181 @@ def validate_object_matches_json_schema(obj, schema, path='', complaints=None):
             if not schema.get('optional'):
                 complaints.append('Missing mandatory value at ' + path)
         else:
-            expected_type = None
-            validator = None
-            if schema['type'] in ('string', 'text', 'html', 'file'):
-                expected_type = basestring
-            elif schema['type'] == 'url':
-                expected_type = basestring
-                validator = is_valid_url
-            elif schema['type'] in ('integer', 'timestamp'):
-                expected_type = (int, long)
-            elif schema['type'] in 'number':
-                expected_type = float
-            elif schema['type'] in 'boolean':
-                expected_type = bool
-            elif schema['type'] == 'date':
-                expected_type = basestring
-                validator = is_valid_date
-            elif schema['type'] == 'datetime':
-                expected_type = basestring
-                validator = is_valid_datetime
-
-            if expected_type:
-                if not isinstance(obj, expected_type):
-                    complaints.append(
-                        'Expected %s at %s, but instead had %s' % (
-                            expected_type, path, type(obj)))
-                elif validator and not validator(obj):
-                    complaints.append(
-                        'Value "%s" is not well-formed according to %s' % (
-                            str(obj), validator.__name__))
-            else:
-                complaints.append(
-                    'Unrecognized schema scalar type "%s" at %s' % (
-                        schema['type'], path))
+            expected_type, validator = _get_scalar_type_and_validator(
+                schema['type'])
+            _validate_scalar(
+                obj, schema['type'], expected_type, validator, path,
+                complaints)
     return complaints
+
+
+def _get_scalar_type_and_validator(schema_type):
+    """Gives the Python type(s) and value check for a JSON schema type."""
+
+    def is_valid_url(obj):
+        url = urlparse.urlparse(obj)
+        return url.scheme and url.netloc
+
+    def is_valid_date(obj):
+        try:
+            datetime.datetime.strptime(obj, ISO_8601_DATE_FORMAT)
+            return True
+        except ValueError:
+            return False
+
+    def is_valid_datetime(obj):
+        try:
+            datetime.datetime.strptime(obj, ISO_8601_DATETIME_FORMAT)
+            return True
+        except ValueError:
+            return False
+
+    expected_type = None
+    validator = None
+    if schema_type in ('string', 'text', 'html', 'file'):
+        expected_type = basestring
+    elif schema_type == 'url':
+        expected_type = basestring
+        validator = is_valid_url
+    elif schema_type in ('integer', 'timestamp'):
+        expected_type = (int, long)
+    elif schema_type in 'number':
+        expected_type = float
+    elif schema_type in 'boolean':
+        expected_type = bool
+    elif schema_type == 'date':
+        expected_type = basestring
+        validator = is_valid_date
+    elif schema_type == 'datetime':
+        expected_type = basestring
+        validator = is_valid_datetime
+    return expected_type, validator
+
+
+def _validate_scalar(obj, schema_type, expected_type, validator, path,
+                     complaints):
+    if expected_type:
+        if not isinstance(obj, expected_type):
+            complaints.append(
+                'Expected %s at %s, but instead had %s' % (
+                    expected_type, path, type(obj)))
+        elif validator and not validator(obj):
+            complaints.append(
+                'Value "%s" is not well-formed according to %s' % (
+                    str(obj), validator.__name__))
+    else:
+        complaints.append(
+            'Unrecognized schema scalar type "%s" at %s' % (
+                schema_type, path))
+
+
+def compile_json_schema_validator(schema):
+    """Prepare a schema for checking many objects against it.
+
+    validate_object_matches_json_schema() walks the schema dict anew for each
+    object it checks.  This walks the schema once, up front, and returns a
+    function that takes an object and returns the same list of complaints
+    that validate_object_matches_json_schema() would have.
+
+    Args:
+      schema: A dict describing a schema, as for
+        validate_object_matches_json_schema().
+    Returns:
+      A function taking the object to check, and returning an array of
+      verbose complaint strings.
+    """
+    check = _compile_schema_node(schema)
+
+    def validate(obj):
+        complaints = []
+        check(obj, '', complaints)
+        return complaints
+    return validate
+
+
+def _compile_schema_node(schema):
+    """Builds a check(obj, path, complaints) function for a schema node."""
+
+    def check_generic(obj, path, complaints):
+        # Unusual combinations of object and schema; defer to the original.
+        validate_object_matches_json_schema(obj, schema, path, complaints)
+
+    if not isinstance(schema, dict):
+        return check_generic
+    if 'properties' in schema:
+        return _compile_object_node(schema, schema['properties'], None)
+    if 'items' in schema:
+        return _compile_array_node(schema, check_generic)
+    if isinstance(schema.get('type'), basestring):
+        return _compile_scalar_node(schema, check_generic)
+    # The 'properties' member of a schema, passed in on its own.
+    return _compile_object_node(schema, schema, check_generic)
+
+
+def _compile_object_node(schema, properties, check_non_dict):
+    root_path = schema['id'] if 'id' in schema else '(root)'
+    children = [
+        (name, '.' + name, _compile_schema_node(sub_schema))
+        for name, sub_schema in properties.iteritems()]
+
+    def check(obj, path, complaints):
+        if check_non_dict and not isinstance(obj, dict):
+            check_non_dict(obj, path, complaints)
+            return
+        if not path:
+            path = root_path
+        if obj is None:
+            pass
+        elif not isinstance(obj, dict):
+            complaints.append('Expected a dict at %s, but had %s' % (
+                path, type(obj)))
+        else:
+            for name, suffix, check_child in children:
+                check_child(obj.get(name), path + suffix, complaints)
+            for name in obj:
+                if name not in properties:
+                    complaints.append('Unexpected member "%s" in %s' % (
+                        name, path))
+    return check
+
+
+def _compile_array_node(schema, check_dict):
+    nested_array = 'items' in schema['items']
+    check_item = _compile_schema_node(schema['items'])
+
+    def check(obj, path, complaints):
+        if isinstance(obj, dict):
+            check_dict(obj, path, complaints)
+            return
+        if nested_array:
+            complaints.append('Unsupported: array-of-array at ' + path)
+        if obj is None:
+            pass
+        elif not isinstance(obj, (list, tuple)):
+            complaints.append('Expected a list or tuple at %s, but had %s' % (
+                path, type(obj)))
+        else:
+            for index, item in enumerate(obj):
+                item_path = path + '[%d]' % index
+                if item is None:
+                    complaints.append('Found None at %s' % item_path)
+                else:
+                    check_item(item, item_path, complaints)
+    return check
+
+
+def _compile_scalar_node(schema, check_dict):
+    schema_type = schema['type']
+    optional = schema.get('optional')
+    expected_type, validator = _get_scalar_type_and_validator(schema_type)
+
+    def check(obj, path, complaints):
+        if isinstance(obj, dict):
+            check_dict(obj, path, complaints)
+        elif obj is None:
+            if not optional:
+                complaints.append('Missing mandatory value at ' + path)
+        else:
+            _validate_scalar(
+                obj, schema_type, expected_type, validator, path, complaints)
+    return check
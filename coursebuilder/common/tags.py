@@ -17,10 +17,13 @@
 __author__ = 'John Orr (jorr@google.com)'
 
 
+import copy
+import hashlib
 import logging
 import mimetypes
 import os
 import re
+import sys
 from xml.etree import cElementTree
 
 import html5lib
@@ -29,18 +32,36 @@ import webapp2
 
 import appengine_config
 
+from common import caching
 from common import messages
 from common import schema_fields
 from models import config
+from models.counters import PerfCounter
 
 _LXML_AVAILABLE = False
 try:
+    import lxml.etree
     import lxml.html
     _LXML_AVAILABLE = True
 except ImportError:
     if appengine_config.PRODUCTION_MODE:
         raise
 
+# max number of parsed HTML fragments kept in-process
+MAX_PARSED_HTML_CACHE_ITEMS = 500
+
+# max total and per-fragment size of parsed HTML kept in-process
+MAX_PARSED_HTML_CACHE_SIZE_BYTES = 8 * 1024 * 1024
+MAX_PARSED_HTML_CACHE_ITEM_SIZE_BYTES = 256 * 1024
+
+# a parsed tree plus the rendered HTML of its static subtrees takes several
+# times the space of the source text; sizes are estimated from the source
+PARSED_HTML_SIZE_FACTOR = 8
+
+# lxml parses much faster than html5lib, but its tree can differ from the
+# html5lib one for malformed markup; off until content is known to agree.
+CAN_USE_LXML_TO_RENDER_TAGS = False
+
 
 CAN_USE_DYNAMIC_TAGS = config.ConfigProperty(
     'gcb_can_use_dynamic_tags', bool, messages.SITE_SETTINGS_DYNAMIC_TAGS,
@@ -352,7 +373,34 @@ def get_tag_bindings():
     return dict(Registry.get_all_tags().items())
 
 
-def html_string_to_element_tree(html_string, is_fragment=True):
+def _lxml_to_element_tree(lxml_elt):
+    """Copies an lxml tree into cElementTree elements expected by tags."""
+    if lxml_elt.tag is lxml.etree.Comment:
+        elt = cElementTree.Comment(lxml_elt.text)
+    else:
+        elt = cElementTree.Element(lxml_elt.tag, dict(lxml_elt.attrib))
+        elt.text = lxml_elt.text
+        for lxml_child in lxml_elt:
+            if isinstance(lxml_child.tag, basestring) or (
+                lxml_child.tag is lxml.etree.Comment):
+                elt.append(_lxml_to_element_tree(lxml_child))
+            elif lxml_child.tail:
+                # Drop processing instructions and entities; keep their tail.
+                if len(elt):
+                    elt[-1].tail = (elt[-1].tail or '') + lxml_child.tail
+                else:
+                    elt.text = (elt.text or '') + lxml_child.tail
+    elt.tail = lxml_elt.tail
+    return elt
+
+
+def html_string_to_element_tree(html_string, is_fragment=True, use_lxml=False):
+    if use_lxml and is_fragment:
+        if not isinstance(html_string, unicode):
+            html_string = html_string.decode('utf-8')
+        # This returns the <div> element we wrap around the content.
+        return _lxml_to_element_tree(
+            lxml.html.fromstring(u'<div>%s</div>' % html_string))
     parser = html5lib.HTMLParser(
         tree=html5lib.treebuilders.getTreeBuilder('etree', cElementTree),
         namespaceHTMLElements=False)
@@ -364,7 +412,106 @@ def html_string_to_element_tree(html_string, is_fragment=True):
         return parser.parse(html_string)
 
 
-def html_to_safe_dom(html_string, handler, render_custom_tags=True):
+class _ParsedHtml(object):
+    """A parsed HTML fragment and the rendered HTML of its static subtrees.
+
+    A subtree is static if it has no custom tags and no instance ids; its
+    rendering does not depend on the request, so it is sanitized once and
+    reused.  The tree itself must never be modified.
+    """
+
+    def __init__(self, root, size):
+        self.root = root
+        self.size = size
+        self.static_html = {}
+        self._tag_names = None
+        self._static_ids = set()
+
+    def get_static_ids(self, tag_names):
+        """Gets ids of the elements that root static subtrees."""
+        if tag_names != self._tag_names:
+            self._tag_names = tag_names
+            self._static_ids = set()
+            self.static_html = {}
+            self._find_static(self.root, tag_names)
+        return self._static_ids
+
+    def _find_static(self, elt, tag_names):
+        is_static = (
+            elt.tag not in tag_names and 'instanceid' not in elt.attrib)
+        for child in elt:
+            is_static = self._find_static(child, tag_names) and is_static
+        if is_static:
+            self._static_ids.add(id(elt))
+        return is_static
+
+
+class _SanitizedHtml(safe_dom.Node):
+    """Holds HTML text that was already sanitized by safe_dom."""
+
+    def __init__(self, sanitized_html):
+        super(_SanitizedHtml, self).__init__()
+        self._sanitized_html = sanitized_html
+
+    @property
+    def sanitized(self):
+        return self._sanitized_html
+
+
+class ProcessScopedParsedHtmlCache(caching.ProcessScopedSingleton):
+    """This class holds in-process cache of parsed HTML fragments."""
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(ProcessScopedParsedHtmlCache.instance().cache.items)
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_item_count=MAX_PARSED_HTML_CACHE_ITEMS,
+            max_size_bytes=MAX_PARSED_HTML_CACHE_SIZE_BYTES,
+            max_item_size_bytes=MAX_PARSED_HTML_CACHE_ITEM_SIZE_BYTES)
+        self.cache.get_entry_size = self._get_entry_size
+
+    def _get_entry_size(self, key, value):
+        # The size is fixed when the entry is created; static_html fills in
+        # later, so measuring it here would unbalance the cache total.
+        return sys.getsizeof(key) + value.size
+
+
+PARSED_HTML_CACHE_LEN = PerfCounter(
+    'gcb-common-ParsedHtmlCache-len',
+    'A total number of parsed HTML fragments held in-process.')
+PARSED_HTML_CACHE_HIT = PerfCounter(
+    'gcb-common-ParsedHtmlCache-hit',
+    'A number of times a parsed HTML fragment was reused.')
+PARSED_HTML_CACHE_MISS = PerfCounter(
+    'gcb-common-ParsedHtmlCache-miss',
+    'A number of times an HTML fragment had to be parsed.')
+
+PARSED_HTML_CACHE_LEN.poll_value = ProcessScopedParsedHtmlCache.get_cache_len
+
+
+def _get_parsed_html(html_string, use_lxml):
+    if isinstance(html_string, unicode):
+        html_bytes = html_string.encode('utf-8')
+    else:
+        html_bytes = html_string
+    key = '%s:%s' % (use_lxml, hashlib.sha1(html_bytes).hexdigest())
+    cache = ProcessScopedParsedHtmlCache.instance().cache
+    found, parsed = cache.get(key)
+    if found:
+        PARSED_HTML_CACHE_HIT.inc()
+        return parsed
+    PARSED_HTML_CACHE_MISS.inc()
+    parsed = _ParsedHtml(
+        html_string_to_element_tree(html_string, use_lxml=use_lxml),
+        PARSED_HTML_SIZE_FACTOR * len(html_bytes))
+    cache.put(key, parsed)
+    return parsed
+
+
+def html_to_safe_dom(
+    html_string, handler, render_custom_tags=True, use_lxml=None):
     """Render HTML text as a tree of safe_dom elements."""
 
     tag_bindings = get_tag_bindings()
@@ -373,6 +520,16 @@ def html_to_safe_dom(html_string, handler, render_custom_tags=True):
     if not html_string:
         return node_list
 
+    if use_lxml is None:
+        use_lxml = CAN_USE_LXML_TO_RENDER_TAGS and _LXML_AVAILABLE
+    parsed = _get_parsed_html(html_string, use_lxml)
+    if render_custom_tags:
+        static_ids = parsed.get_static_ids(frozenset(tag_bindings))
+    else:
+        # Callers not rendering tags may edit the tree we return, so every
+        # node is built fresh.
+        static_ids = frozenset()
+
     # Set of all instance id's used in this dom tree, used to detect duplication
     used_instance_ids = set([])
     # A dictionary of environments, one for each tag type which appears in the
@@ -399,8 +556,39 @@ def html_to_safe_dom(html_string, handler, render_custom_tags=True):
         #     {http://www.w3.org/2000/svg}svg
         return re.sub(r'^\{[^\}]+\}', '', tag_name, count=1)
 
+    def _element_to_node_list(elt, original_elt, process_child):
+        """Converts one element; its children go through process_child."""
+        if elt.tag == cElementTree.Comment:
+            out_elt = safe_dom.Comment()
+        elif elt.tag.lower() == 'script':
+            out_elt = safe_dom.ScriptElement()
+        else:
+            out_elt = safe_dom.Element(_remove_namespace(elt.tag))
+        out_elt.add_attribute(**elt.attrib)
+
+        if elt.text:
+            out_elt.add_text(elt.text)
+        for child in elt:
+            out_elt.add_children(process_child(child))
+
+        node_list = safe_dom.NodeList()
+        node_list.append(out_elt)
+        if original_elt.tail:
+            node_list.append(safe_dom.Text(original_elt.tail))
+        return node_list
+
+    def _process_static_tree(elt):
+        return _element_to_node_list(elt, elt, _process_static_tree)
+
     def _process_html_tree(elt):
         """Recursively parses an HTML tree into a safe_dom.NodeList()."""
+        if id(elt) in static_ids:
+            html = parsed.static_html.get(id(elt))
+            if html is None:
+                html = _process_static_tree(elt).sanitized
+                parsed.static_html[id(elt)] = html
+            return safe_dom.NodeList().append(_SanitizedHtml(html))
+
         # Return immediately with an error message if a duplicate instanceid is
         # detected.
         if 'instanceid' in elt.attrib:
@@ -414,6 +602,9 @@ def html_to_safe_dom(html_string, handler, render_custom_tags=True):
         original_elt = elt
         try:
             if render_custom_tags and elt.tag in tag_bindings:
+                # The parsed tree is shared between requests; tags get a copy
+                # they are free to modify.
+                elt = copy.deepcopy(elt)
                 tag = tag_bindings[elt.tag]()
                 if isinstance(tag, ContextAwareTag):
                     # Get or initialize a environment dict for this type of tag.
@@ -429,32 +620,14 @@ def html_to_safe_dom(html_string, handler, render_custom_tags=True):
                     # Render the tag
                     elt = tag.render(elt, handler)
 
-            if elt.tag == cElementTree.Comment:
-                out_elt = safe_dom.Comment()
-            elif elt.tag.lower() == 'script':
-                out_elt = safe_dom.ScriptElement()
-            else:
-                out_elt = safe_dom.Element(_remove_namespace(elt.tag))
-            out_elt.add_attribute(**elt.attrib)
-
-            if elt.text:
-                out_elt.add_text(elt.text)
-            for child in elt:
-                out_elt.add_children(
-                    _process_html_tree(child))
-
-            node_list = safe_dom.NodeList()
-            node_list.append(out_elt)
-            if original_elt.tail:
-                node_list.append(safe_dom.Text(original_elt.tail))
-            return node_list
+            return _element_to_node_list(elt, original_elt, _process_html_tree)
 
         except Exception as e:  # pylint: disable=broad-except
             logging.exception('Error handling tag: %s', elt.tag)
             return _generate_error_message_node_list(
                 original_elt, '%s: %s' % (INVALID_HTML_TAG_MESSAGE, e))
 
-    root = html_string_to_element_tree(html_string)
+    root = parsed.root
     if root.text:
         node_list.append(safe_dom.Text(root.text))
 
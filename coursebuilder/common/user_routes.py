@@ -163,6 +163,9 @@ def register_handler(handler, handler_id, title):
 
 
 def _get_handler_for_path(course, path):
+    if not USER_ROUTABLE_HANDLERS:
+        # Nothing can be routed; avoid loading course settings.
+        return None
     path = normalize_path(path)
     try:
         route = _get_user_route_for_path(course, path)
@@ -196,6 +196,13 @@ NO_HANDLER_COUNT = PerfCounter(
     'gcb-sites-handler-none',
     'A number of times request was not matched to any handler.')
 
+ROUTE_CACHE_HIT = PerfCounter(
+    'gcb-sites-route-cache-hit',
+    'A number of times a path was resolved to a handler from the route cache.')
+ROUTE_CACHE_MISS = PerfCounter(
+    'gcb-sites-route-cache-miss',
+    'A number of times a path had to be resolved using the route trie.')
+
 HTTP_BYTES_IN = PerfCounter(
     'gcb-sites-bytes-in',
     'A number of bytes received from clients by the handler.')
@@ -828,10 +835,11 @@ class ApplicationContext(object):
         dirs = [template_dir]
         if additional_dirs:
             dirs += additional_dirs
-        jinja_environment = self.fs.get_jinja_environ(dirs)
-
-        i18n.get_i18n().set_locale(locale)
-        jinja_environment.install_gettext_translations(i18n)
+        jinja_environment = self.fs.get_jinja_environ(dirs, locale=locale)
+        if not locale:
+            # Pooled environments set the locale only when one is known;
+            # without one, keep serving untranslated text.
+            i18n.get_i18n().set_locale(locale)
         return jinja_environment
 
     def is_editable_fs(self):
@@ -1226,6 +1234,115 @@ class _Route(object):
         self.handler_method = handler_method
 
 
+class _RouteTrie(object):
+    """Resolves paths against a fixed snapshot of the URL map.
+
+    Only star routes are placed in the trie; all other routes match in their
+    entirety and are found with a plain dict lookup. Each trie node is a dict
+    keyed by path segment; the handler of a star route ending at a node is
+    stored under the None key. The root star route '/' lives on the root node.
+    Resolved paths are memoized as the same paths are requested over and over.
+    """
+
+    MAX_RESOLVED_PATHS = 2000
+
+    def __init__(self, urls_map):
+        self._urls_map = dict(urls_map)
+        self._root = {}
+        self._resolved = caching.LRUCache(
+            max_item_count=self.MAX_RESOLVED_PATHS)
+        for path, handler in self._urls_map.iteritems():
+            if ApplicationRequestHandler.is_star_route(handler):
+                self._insert(path, handler)
+
+    def _insert(self, path, handler):
+        parts = [part for part in path.split('/') if part]
+        if path != '/' + '/'.join(parts):
+            # Paths with empty segments, a trailing '/', or no leading '/'
+            # can only ever match in their entirety.
+            return
+        node = self._root
+        for part in parts:
+            node = node.setdefault(part, {})
+        node[None] = handler
+
+    def _get_star_route(self, path):
+        node = self._root
+        candidate = node.get(None)
+        for part in path.split('/'):
+            if not part:
+                continue
+            node = node.get(part)
+            if node is None:
+                break
+            candidate = node.get(None, candidate)
+        return candidate
+
+    def _resolve(self, path):
+        if path in self._urls_map:
+            return self._urls_map[path]
+        return self._get_star_route(path)
+
+    def resolve(self, path):
+        if not path:
+            return self._resolve(path)
+        found, handler = self._resolved.get(path)
+        if found:
+            ROUTE_CACHE_HIT.inc()
+            return handler
+        ROUTE_CACHE_MISS.inc()
+        handler = self._resolve(path)
+        self._resolved.put(path, handler)
+        return handler
+
+
+class _RouteMap(dict):
+    """A URL map that lazily compiles itself into a _RouteTrie.
+
+    Tests and modules update the map in place after it was bound, so every
+    mutation drops the compiled trie; it is rebuilt on the next lookup.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_RouteMap, self).__init__(*args, **kwargs)
+        self._trie = None
+
+    def get_trie(self):
+        trie = self._trie
+        if trie is None:
+            trie = _RouteTrie(self)
+            self._trie = trie
+        return trie
+
+    def __setitem__(self, key, value):
+        self._trie = None
+        super(_RouteMap, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._trie = None
+        super(_RouteMap, self).__delitem__(key)
+
+    def clear(self):
+        self._trie = None
+        super(_RouteMap, self).clear()
+
+    def pop(self, *args):
+        self._trie = None
+        return super(_RouteMap, self).pop(*args)
+
+    def popitem(self):
+        self._trie = None
+        return super(_RouteMap, self).popitem()
+
+    def setdefault(self, key, default=None):
+        self._trie = None
+        return super(_RouteMap, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._trie = None
+        super(_RouteMap, self).update(*args, **kwargs)
+
+
 class ApplicationRequestHandler(webapp2.RequestHandler):
     """Handles dispatching of all URL's to proper handlers."""
 
@@ -1241,6 +1358,10 @@ class ApplicationRequestHandler(webapp2.RequestHandler):
     GLOBAL_ERROR_HANDLER = None
     NAMESPACED_ERROR_HANDLER = None
 
+    # resolve paths using a trie compiled from urls_map; when False, all
+    # prefixes of the path are looked up in urls_map on every request
+    CAN_USE_ROUTE_TRIE = True
+
     def dispatch(self):
         if self.CAN_IMPERSONATE:
             self.impersonate_and_dispatch()
@@ -1294,7 +1415,7 @@ class ApplicationRequestHandler(webapp2.RequestHandler):
 
     @classmethod
     def bind(cls, urls):
-        urls_map = {}
+        urls_map = _RouteMap()
         cls.bind_to(urls, urls_map)
         cls.urls_map = urls_map
 
@@ -1330,12 +1451,21 @@ class ApplicationRequestHandler(webapp2.RequestHandler):
                 or Roles.is_course_admin(context)
                 or Roles.in_any_role(context))
 
-    def is_star_route(self, handler):
+    @classmethod
+    def is_star_route(cls, handler):
         return isinstance(handler, utils.StarRouteHandlerMixin) or (
             issubclass(handler, utils.StarRouteHandlerMixin))
 
     def _get_handler_factory_for_path(self, path):
         """Picks a handler to handle the path."""
+        urls_map = ApplicationRequestHandler.urls_map
+        if (ApplicationRequestHandler.CAN_USE_ROUTE_TRIE and
+            isinstance(urls_map, _RouteMap)):
+            return urls_map.get_trie().resolve(path)
+        return self._get_handler_factory_for_path_linear(path)
+
+    def _get_handler_factory_for_path_linear(self, path):
+        """Picks a handler by checking every prefix of the path."""
         # Checks if path maps in its entirety.
         if path in ApplicationRequestHandler.urls_map:
             return ApplicationRequestHandler.urls_map[path]
@@ -1940,6 +2070,14 @@ def test_get_course_for_path():
 
 
 def test_url_to_handler_mapping_for_course_type():
+    """Tests linear and trie routing to make sure both work the same way."""
+    ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = False
+    test_url_to_handler_mapping_for_course_type_impl()
+    ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = True
+    test_url_to_handler_mapping_for_course_type_impl()
+
+
+def test_url_to_handler_mapping_for_course_type_impl():
     """Tests mapping of a URL to a handler for course type."""
 
     # setup rules
@@ -2081,6 +2219,14 @@ def test_path_construction():
 
 
 def test_star_handler():
+    """Tests star routes with both linear and trie routing."""
+    ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = False
+    test_star_handler_impl()
+    ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = True
+    test_star_handler_impl()
+
+
+def test_star_handler_impl():
     """Tests a handler that is mapped to a route with '*'."""
 
     class FakeHandler0(object):
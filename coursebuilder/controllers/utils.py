@@ -941,20 +941,16 @@ class CourseHandler(ApplicationHandler):
         self.init_template_values(_p, prefs=prefs)
         template_environ = self.app_context.get_template_environ(
             self.app_context.get_current_locale(), additional_dirs)
-        template_environ.filters[
-            'gcb_tags'] = jinja_utils.get_gcb_tags_filter(self)
         course = self.get_course()
-        template_environ.globals.update({
-            'display_unit_title': (
+        return jinja_utils.bind_template(
+            template_environ.get_template(template_file), handler=self,
+            display_unit_title=(
                 lambda unit: resources_display.display_unit_title(
                     unit, self.app_context)),
-            'display_short_unit_title': (
+            display_short_unit_title=(
                 lambda unit: resources_display.display_short_unit_title(
                     unit, self.app_context)),
-            'is_lesson_available': course.is_lesson_available,
-            })
-
-        return template_environ.get_template(template_file)
+            is_lesson_available=course.is_lesson_available)
 
     def can_record_student_events(self):
         settings = self.app_context.get_environ().get('course')
@@ -1315,8 +1311,8 @@ class LocalizedGlobalHandler(ApplicationHandler):
 
     @classmethod
     def _get_template_env(cls, templates_dirs, locale=None):
-        return jinja_utils.create_jinja_environment(
-            jinja2.FileSystemLoader(templates_dirs),
+        return jinja_utils.get_jinja_environment(
+            lambda: jinja2.FileSystemLoader(templates_dirs), templates_dirs,
             locale=locale if locale else cls._DEFAULT_LOCALE, autoescape=True)
 
 
@@ -25,6 +25,7 @@ import pickle
 import re
 import sys
 import threading
+import time
 import custom_units
 
 import messages
@@ -37,6 +38,7 @@ import vfs
 import yaml
 
 import appengine_config
+from common import caching
 from common import locales
 from common import safe_dom
 from common import schema_fields
@@ -47,6 +49,7 @@ import models
 from models import MemcacheManager
 from models import QuestionImporter
 from models import services
+from models.counters import PerfCounter
 from tools import verify
 
 from google.appengine.api import namespace_manager
@@ -130,6 +133,103 @@ def deep_dict_merge(*args):
     _deep_merge(result, default_values_dict)
     return result
 
+# Int. Max number of course settings (one per course and locale) in process.
+MAX_CACHED_ENVIRONS = 1000
+
+# Int. Seconds course settings are kept in process even if course.yaml is
+# unchanged; bounds staleness of post-load hook results (e.g., translations)
+# that were invalidated on another instance.
+ENVIRON_PROCESS_CACHE_TTL_SEC = 60
+
+# Settings leaves of these types are immutable and are shared among copies.
+_IMMUTABLE_SETTINGS_TYPES = (
+    basestring, bool, int, long, float, type(None), datetime)
+
+
+def _copy_settings(value):
+    """Faster copy.deepcopy() of settings: copies dicts and lists only."""
+    value_type = type(value)
+    if value_type is dict:
+        return {key: _copy_settings(item) for key, item in value.iteritems()}
+    if value_type is list:
+        return [_copy_settings(item) for item in value]
+    if isinstance(value, _IMMUTABLE_SETTINGS_TYPES):
+        return value
+    return copy.deepcopy(value)
+
+
+class ProcessScopedEnvironCache(caching.ProcessScopedSingleton):
+    """Holds in-process cache of course settings.
+
+    Entries are keyed by course and locale and are revalidated against the
+    updated_on stamp of course.yaml. Cached settings are shared and must never
+    be modified; Course.get_environ() hands out copies.
+    """
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(cls.instance().cache.items.keys())
+
+    def __init__(self):
+        self.cache = caching.LRUCache(max_item_count=MAX_CACHED_ENVIRONS)
+
+    @classmethod
+    def _make_key(cls, app_context, locale):
+        return (
+            app_context.get_namespace_name(),
+            app_context.get_config_filename(), locale)
+
+    @classmethod
+    def is_enabled(cls):
+        # Follows memcache so that development setups see changes right away.
+        return models.CAN_USE_MEMCACHE.value
+
+    def get(self, app_context, locale):
+        """Returns (stamp, env, changed); pass the stamp to put() after a miss.
+
+        The stamp is taken before any load, so a course.yaml written while
+        the settings are being loaded is picked up by the next lookup. The
+        changed flag tells that course.yaml was written since the settings
+        were cached, so copies of them in memcache must not be trusted either.
+        """
+        if not self.is_enabled():
+            return None, None, False
+        stamp = app_context.fs.get_updated_on(app_context.get_config_filename())
+        found, entry = self.cache.get(self._make_key(app_context, locale))
+        if found:
+            entry_stamp, created_on, env = entry
+            if entry_stamp != stamp:
+                ENVIRON_CACHE_MISS.inc()
+                return stamp, None, True
+            if time.time() - created_on < ENVIRON_PROCESS_CACHE_TTL_SEC:
+                ENVIRON_CACHE_HIT.inc()
+                return stamp, env, False
+        ENVIRON_CACHE_MISS.inc()
+        return stamp, None, False
+
+    def put(self, app_context, locale, stamp, env):
+        if self.is_enabled():
+            self.cache.put(
+                self._make_key(app_context, locale), (stamp, time.time(), env))
+
+    def delete(self, app_context, locales):
+        for locale in locales:
+            self.cache.delete(self._make_key(app_context, locale))
+
+
+ENVIRON_CACHE_LEN = PerfCounter(
+    'gcb-models-EnvironCache-len',
+    'A total number of course settings in the in-process cache.')
+ENVIRON_CACHE_HIT = PerfCounter(
+    'gcb-models-EnvironCache-hit',
+    'A number of times course settings were found in the in-process cache.')
+ENVIRON_CACHE_MISS = PerfCounter(
+    'gcb-models-EnvironCache-miss',
+    'A number of times course settings were not found in the in-process '
+    'cache or were out of date.')
+
+ENVIRON_CACHE_LEN.poll_value = ProcessScopedEnvironCache.get_cache_len
+
 # The template dict for all courses
 yaml_path = os.path.join(appengine_config.BUNDLE_ROOT, 'course_template.yaml')
 with open(yaml_path) as course_template_yaml:
@@ -1380,6 +1480,8 @@ class CourseModel13(object):
             for locale in [None] + self.app_context.get_all_locales()]
         models.MemcacheManager.delete_multi(
             keys, namespace=self.app_context.get_namespace_name())
+        ProcessScopedEnvironCache.instance().delete(
+            self.app_context, [None] + self.app_context.get_all_locales())
 
         self._app_context.clear_per_request_cache()
 
@@ -2422,7 +2524,7 @@ class Course(object):
 
     @classmethod
     def _run_env_post_copy_hooks(cls, app_context, env):
-        env = copy.deepcopy(env)
+        env = _copy_settings(env)
 
         # Monkey patch to defend against infinite recursion. Downstream
         # calls do not reload the env but just return the copy we have here.
@@ -2451,20 +2553,44 @@ class Course(object):
     @classmethod
     def get_environ(cls, app_context):
         """Returns currently defined course settings as a dictionary."""
+        return cls._run_env_post_copy_hooks(
+            app_context, cls._get_shared_environ(app_context))
+
+    @classmethod
+    def get_environ_without_post_copy_hooks(cls, app_context):
+        """Returns a copy of course settings before per-user overrides.
+
+        COURSE_ENV_POST_COPY_HOOKS are not run; callers that keep the result
+        for several users must run them for each user themselves.
+        """
+        return _copy_settings(cls._get_shared_environ(app_context))
+
+    @classmethod
+    def _get_shared_environ(cls, app_context):
+        """Returns cached course settings; these must never be modified."""
         # pylint: disable=protected-access
 
         # get from local cache
         env = app_context._cached_environ
         if env:
-            return cls._run_env_post_copy_hooks(app_context, env)
+            return env
 
-        # get from global cache
+        # get from in-process cache
         _locale = app_context.get_current_locale()
+        _process_cache = ProcessScopedEnvironCache.instance()
+        _stamp, env, _changed = _process_cache.get(app_context, _locale)
+        if env:
+            app_context._cached_environ = env
+            return env
+
+        # get from global cache
         _key = cls.make_locale_environ_key(_locale)
-        env = models.MemcacheManager.get(
-            _key, namespace=app_context.get_namespace_name())
+        if not _changed:
+            env = models.MemcacheManager.get(
+                _key, namespace=app_context.get_namespace_name())
         if env:
-            return cls._run_env_post_copy_hooks(app_context, env)
+            _process_cache.put(app_context, _locale, _stamp, env)
+            return env
 
         models.MemcacheManager.begin_readonly()
         try:
@@ -2472,14 +2598,15 @@ class Course(object):
             env = cls._load_environ(app_context)
             cls._run_env_post_load_hooks(env)
 
-            # put into local and global cache
+            # put into local, in-process and global cache
             app_context._cached_environ = env
+            _process_cache.put(app_context, _locale, _stamp, env)
             models.MemcacheManager.set(
                 _key, env, namespace=app_context.get_namespace_name())
         finally:
             models.MemcacheManager.end_readonly()
 
-        return cls._run_env_post_copy_hooks(app_context, env)
+        return env
 
 
     @classmethod
@@ -3190,11 +3317,38 @@ class Course(object):
         # string.
         return 'pass' if score >= 70 else 'fail'
 
-    def get_all_scores(self, student):
+    def get_graded_units(self):
+        """Gets the units that count towards a student's scores.
+
+        Returns:
+            A list of (unit, weight) 2-tuples, in course order, for the
+            assessments and graded custom units of the course.
+        """
+        graded_units = []
+        for unit in self.get_units():
+            if unit.is_custom_unit():
+                cu = custom_units.UnitTypeRegistry.get(unit.custom_unit_type)
+                if not cu or not cu.is_graded:
+                    continue
+            elif not unit.is_assessment():
+                continue
+            # Compute the weight for this assessment.
+            weight = 0
+            if hasattr(unit, 'weight'):
+                weight = unit.weight
+            elif unit.unit_id in DEFAULT_LEGACY_ASSESSMENT_WEIGHTS:
+                weight = DEFAULT_LEGACY_ASSESSMENT_WEIGHTS[unit.unit_id]
+            graded_units.append((unit, weight))
+        return graded_units
+
+    def get_all_scores(self, student, progress=None, graded_units=None):
         """Gets all score data for a student.
 
         Args:
             student: the student whose scores should be retrieved.
+            progress: the student's progress entity, if already loaded.
+            graded_units: the result of get_graded_units(), if already
+                computed; callers scoring many students compute it once.
 
         Returns:
             an array of dicts, each representing an assessment. Each dict has
@@ -3203,34 +3357,23 @@ class Course(object):
             contributed by the assessment to the final score, and the
             assessment score.
         """
-        unit_list = self.get_units()
+        if graded_units is None:
+            graded_units = self.get_graded_units()
         scores = transforms.loads(student.scores) if student.scores else {}
 
         progress_tracker = self.get_progress_tracker()
-        student_progress = progress_tracker.get_or_create_progress(student)
+        if progress is None:
+            progress = progress_tracker.get_or_create_progress(student)
 
         assessment_score_list = []
-        for unit in unit_list:
-            if unit.is_custom_unit():
-                cu = custom_units.UnitTypeRegistry.get(unit.custom_unit_type)
-                if not cu or not cu.is_graded:
-                    continue
-            elif not unit.is_assessment():
-                continue
-            # Compute the weight for this assessment.
-            weight = 0
-            if hasattr(unit, 'weight'):
-                weight = unit.weight
-            elif unit.unit_id in DEFAULT_LEGACY_ASSESSMENT_WEIGHTS:
-                weight = DEFAULT_LEGACY_ASSESSMENT_WEIGHTS[unit.unit_id]
-
+        for unit, weight in graded_units:
             completed = False
             if unit.is_assessment():
                 completed = progress_tracker.is_assessment_completed(
-                    student_progress, unit.unit_id)
+                    progress, unit.unit_id)
             else:
                 completed = progress_tracker.is_custom_unit_completed(
-                    student_progress, unit.unit_id)
+                    progress, unit.unit_id)
 
             # If a peer-reviewed assessment is completed, ensure that the
             # required reviews have also been completed.
@@ -3677,7 +3820,10 @@ course:
 
     @classmethod
     def get_whitelist(cls, app_context):
-        settings = app_context.get_environ()
+        return cls.get_whitelist_from_environ(app_context.get_environ())
+
+    @classmethod
+    def get_whitelist_from_environ(cls, settings):
         reg_form_whitelist = settings['reg_form'].get('whitelist', '')
         if reg_form_whitelist:
             return reg_form_whitelist
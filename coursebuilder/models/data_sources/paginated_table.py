@@ -18,17 +18,24 @@ __author__ = 'Mike Gainer (mgainer@google.com)'
 
 import copy
 import functools
+import hashlib
 import re
 
 from common import crypto
 from common.utils import Namespace
 from models import entity_transforms
+from models import models
 from models import transforms
 from models.data_sources import base_types
 from models.data_sources import utils as data_sources_utils
 
 from google.appengine.ext import db
 
+# Page cursors found for a query are shared in memcache by all clients paging
+# through the same data source with the same chunk size, filters and orderings.
+CURSORS_MEMCACHE_KEY_PREFIX = 'paginated-table-cursors:'
+CURSORS_MEMCACHE_TTL_SECS = 60 * 60
+
 
 # Package-protected pylint: disable=protected-access
 class _AbstractDbTableRestDataSource(base_types._AbstractRestDataSource):
@@ -63,6 +70,11 @@ class _AbstractDbTableRestDataSource(base_types._AbstractRestDataSource):
     def fetch_values(cls, app_context, source_context, schema, log,
                      sought_page_number, *unused_jobs):
         with Namespace(app_context.get_namespace_name()):
+            cursors_memcache_key = cls._get_cursors_memcache_key(
+                source_context)
+            num_cached_cursors = cls._add_cached_cursors(
+                source_context, cursors_memcache_key, log)
+
             stopped_early = False
             while len(source_context.cursors) < sought_page_number:
                 page_number = len(source_context.cursors)
@@ -95,10 +107,42 @@ class _AbstractDbTableRestDataSource(base_types._AbstractRestDataSource):
                     rows = cls._fetch_page(source_context, query,
                                            page_number, log)
 
+            if len(source_context.cursors) > num_cached_cursors:
+                models.MemcacheManager.set(
+                    cursors_memcache_key, source_context.cursors,
+                    ttl=CURSORS_MEMCACHE_TTL_SECS)
+
             return cls._postprocess_rows(
                 app_context, source_context, schema, log, page_number, rows
                 ), page_number
 
+    @classmethod
+    def _get_cursors_memcache_key(cls, source_context):
+        query_spec = transforms.dumps([
+            cls.get_name(), source_context.chunk_size,
+            source_context.filters, source_context.orderings])
+        return CURSORS_MEMCACHE_KEY_PREFIX + hashlib.md5(query_spec).hexdigest()
+
+    @classmethod
+    def _add_cached_cursors(cls, source_context, memcache_key, log):
+        """Adds cursors other requests found for this query to the context.
+
+        Cursors are only ever found for pages in order, so both the context's
+        and the cached cursors are for pages 1 to N, and the union of the two
+        is as well.  Thus the page-finding loop in fetch_values() need only
+        fetch pages beyond the last one any client has reached.
+
+        Returns:
+            The number of cursors in the cache; if the context holds more at
+            the end of the request, the cache is updated.
+        """
+        cached_cursors = models.MemcacheManager.get(memcache_key) or {}
+        if len(cached_cursors) > len(source_context.cursors):
+            log.info('using %d cached page cursors' % len(cached_cursors))
+            cached_cursors.update(source_context.cursors)
+            source_context.cursors = cached_cursors
+        return len(cached_cursors)
+
     @classmethod
     def _postprocess_rows(cls, unused_app_context, source_context,
                           schema, unused_log, unused_page_number,
@@ -500,6 +500,13 @@ courses for which she registered. This setting is only relevant if you have
 multiple courses on this instance.
 """
 
+SITE_SETTINGS_WRITE_LEGACY_ENROLLMENT_INFO = """
+If "True", a shared student profile records enrollment in its legacy JSON
+field as well as in its enrollment index, so that code which reads only the
+JSON field keeps working. Set to "False" once no such code is deployed; the
+JSON field then goes stale and must not be relied on again.
+"""
+
 SITE_SETTINGS_SITE_ADMIN_EMAILS = """
 This list of email addresses represents the super-administrators for the whole
 site. Super-admin users have the highest level of access to your Google App
@@ -75,6 +75,13 @@ class CacheFactory(object):
             'gcb_can_use_%s_in_process_cache' % name, bool, desc, label=label,
             default_value=True)
 
+        def make_dto(entity):
+            """Builds a DTO, noting the version of the entity it came from."""
+            dto = dao_class.DTO(
+                entity.key().id_or_name(), transforms.loads(entity.data))
+            dto.updated_on = getattr(entity, 'updated_on', None)
+            return dto
+
         class EntityCache(caching.ProcessScopedSingleton):
             """This class holds in-process global cache of objects."""
 
@@ -133,9 +140,7 @@ class CacheFactory(object):
                 entity = entry.entity
                 if not entity:
                     return None
-                return dao_class.DTO(
-                    entity.key().id_or_name(),
-                    transforms.loads(entity.data))
+                return make_dto(entity)
 
             @classmethod
             def internalize(cls, key, entity):
@@ -191,9 +196,7 @@ class CacheFactory(object):
                     dao_class.ENTITY, str(key))
                 if entity:
                     self._conn.put(key, entity)
-                    return dao_class.DTO(
-                        entity.key().id_or_name(),
-                        transforms.loads(entity.data))
+                    return make_dto(entity)
                 self._conn.CACHE_NOT_FOUND.inc()
                 self._conn.put(key, None)
                 return None
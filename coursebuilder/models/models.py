@@ -16,6 +16,7 @@
 
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
+import bisect
 import collections
 import copy
 import datetime
@@ -306,6 +307,28 @@ class MemcacheManager(object):
                 'Failed to set: %s, %s', key, cls._get_namespace(namespace))
             return None
 
+    @classmethod
+    def add(cls, key, value, ttl=DEFAULT_CACHE_TTL_SECS, namespace=None):
+        """Sets an item in memcache if memcache is enabled and it is absent.
+
+        Returns:
+            True if the item was added, False if it was already present,
+            memcache is disabled, or the add failed.
+        """
+        value = copy.deepcopy(value)
+
+        try:
+            if CAN_USE_MEMCACHE.value:
+                CACHE_PUT.inc()
+                _namespace = cls._get_namespace(namespace)
+                if memcache.add(key, value, ttl, namespace=_namespace):
+                    cls._local_cache_put(key, _namespace, value)
+                    return True
+        except:  # pylint: disable=bare-except
+            logging.exception(
+                'Failed to add: %s, %s', key, cls._get_namespace(namespace))
+        return False
+
     @classmethod
     def set_multi(cls, mapping, ttl=DEFAULT_CACHE_TTL_SECS, namespace=None):
         """Sets a dict of items in memcache if memcache is enabled."""
@@ -348,9 +371,14 @@ class MemcacheManager(object):
 
     @classmethod
     def incr(cls, key, delta, namespace=None):
-        """Incr an item in memcache if memcache is enabled."""
+        """Incr an item in memcache if memcache is enabled.
+
+        Returns:
+            The new value of the item, or None if memcache is disabled or
+            the increment failed.
+        """
         if CAN_USE_MEMCACHE.value:
-            memcache.incr(
+            return memcache.incr(
                 key, delta,
                 namespace=cls._get_namespace(namespace), initial_value=0)
 
@@ -386,6 +414,11 @@ CAN_SHARE_STUDENT_PROFILE = config.ConfigProperty(
     messages.SITE_SETTINGS_SHARE_STUDENT_PROFILE, default_value=False,
     label='Share Student Profile')
 
+CAN_WRITE_LEGACY_ENROLLMENT_INFO = config.ConfigProperty(
+    'gcb_can_write_legacy_enrollment_info', bool,
+    messages.SITE_SETTINGS_WRITE_LEGACY_ENROLLMENT_INFO, default_value=True,
+    label='Write Legacy Enrollment Info')
+
 
 class CollisionError(Exception):
     """Exception raised to show that a collision in a namespace has occurred."""
@@ -619,14 +652,31 @@ class ContentChunkDTO(object):
 
 
 class PersonalProfile(BaseEntity):
-    """Personal information not specific to any course instance."""
+    """Personal information not specific to any course instance.
+
+    Enrollment and completion are indexed by course namespace in
+    enrolled_courses and completed_courses. Profiles saved before an index
+    existed (enrollment_index_version is None, or 1 for completion) have that
+    state only in the enrollment_info or course_info JSON; they are migrated
+    on next update. While CAN_WRITE_LEGACY_ENROLLMENT_INFO is set,
+    enrollment_info is still written along with the index, so that the index
+    can be rolled back until it is proven. course_info keeps the final grade
+    and other per-course details.
+    """
+
+    # Int. Version of the enrollment index stored by this code; version 1 had
+    # enrolled_courses only.
+    ENROLLMENT_INDEX_VERSION = 2
 
     email = db.StringProperty(indexed=False)
     legal_name = db.StringProperty(indexed=False)
     nick_name = db.StringProperty(indexed=False)
     date_of_birth = db.DateProperty(indexed=False)
-    enrollment_info = db.TextProperty()
+    enrollment_info = db.TextProperty()  # Legacy; written with the index.
     course_info = db.TextProperty()
+    enrolled_courses = db.StringListProperty(indexed=False)
+    completed_courses = db.StringListProperty(indexed=False)
+    enrollment_index_version = db.IntegerProperty(indexed=False)
 
     _PROPERTY_EXPORT_BLACKLIST = [email, legal_name, nick_name, date_of_birth]
 
@@ -634,6 +684,49 @@ class PersonalProfile(BaseEntity):
     def user_id(self):
         return self.key().name()
 
+    @property
+    def has_enrollment_index(self):
+        return self.enrollment_index_version is not None
+
+    @property
+    def has_completion_index(self):
+        return (self.enrollment_index_version or 0) >= 2
+
+    def get_enrolled_courses(self):
+        """Returns a sorted list of namespaces of enrolled courses."""
+        if self.has_enrollment_index:
+            return self.enrolled_courses
+
+        enrollment_dict = {}
+        if self.enrollment_info:
+            enrollment_dict = transforms.loads(self.enrollment_info)
+        return sorted(
+            namespace for namespace, is_enrolled in enrollment_dict.iteritems()
+            if is_enrolled)
+
+    def get_completed_courses(self):
+        """Returns a sorted list of namespaces of completed courses."""
+        if self.has_completion_index:
+            return self.completed_courses
+
+        course_info_dict = {}
+        if self.course_info:
+            course_info_dict = transforms.loads(self.course_info)
+        return sorted(
+            namespace for namespace, info in course_info_dict.iteritems()
+            if 'final_grade' in info)
+
+    def migrate_enrollment_index(self):
+        """Builds the indexes from legacy JSON, if not yet built.
+
+        The legacy JSON is left in place.
+        """
+        if self.has_completion_index:
+            return
+        self.enrolled_courses = self.get_enrolled_courses()
+        self.completed_courses = self.get_completed_courses()
+        self.enrollment_index_version = self.ENROLLMENT_INDEX_VERSION
+
     @classmethod
     def safe_key(cls, db_key, transform_fn):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.name()))
@@ -645,6 +738,8 @@ class PersonalProfileDTO(object):
     def __init__(self, personal_profile=None):
         self.enrollment_info = '{}'
         self.course_info = '{}'
+        self.enrolled_courses = frozenset()
+        self.completed_courses = frozenset()
         if personal_profile:
             self.user_id = personal_profile.user_id
             self.email = personal_profile.email
@@ -653,6 +748,16 @@ class PersonalProfileDTO(object):
             self.date_of_birth = personal_profile.date_of_birth
             self.enrollment_info = personal_profile.enrollment_info
             self.course_info = personal_profile.course_info
+            self.enrolled_courses = frozenset(
+                personal_profile.get_enrolled_courses())
+            self.completed_courses = frozenset(
+                personal_profile.get_completed_courses())
+
+    def is_enrolled(self, namespace):
+        return namespace in self.enrolled_courses
+
+    def is_completed(self, namespace):
+        return namespace in self.completed_courses
 
 
 QUEUE_RETRIES_BEFORE_SENDING_MAIL = config.ConfigProperty(
@@ -913,7 +1018,10 @@ class StudentProfileDAO(object):
             namespace_manager.set_namespace(cls.TARGET_NAMESPACE)
             profile = PersonalProfile(key_name=user_id)
             profile.email = email
-            profile.enrollment_info = '{}'
+            if CAN_WRITE_LEGACY_ENROLLMENT_INFO.value:
+                profile.enrollment_info = '{}'
+            profile.enrollment_index_version = (
+                PersonalProfile.ENROLLMENT_INDEX_VERSION)
             profile.put()
             return profile
         finally:
@@ -946,10 +1054,21 @@ class StudentProfileDAO(object):
             course = sites.get_course_for_current_request()
             course_namespace = course.get_namespace_name()
 
+            profile.migrate_enrollment_index()
             if is_enrolled is not None:
-                enrollment_dict = transforms.loads(profile.enrollment_info)
-                enrollment_dict[course_namespace] = is_enrolled
-                profile.enrollment_info = transforms.dumps(enrollment_dict)
+                cls._set_in_index(
+                    profile.enrolled_courses, course_namespace, is_enrolled)
+                if CAN_WRITE_LEGACY_ENROLLMENT_INFO.value:
+                    enrollment_dict = {}
+                    if profile.enrollment_info:
+                        enrollment_dict = transforms.loads(
+                            profile.enrollment_info)
+                    enrollment_dict[course_namespace] = is_enrolled
+                    profile.enrollment_info = transforms.dumps(enrollment_dict)
+
+            if final_grade:
+                cls._set_in_index(
+                    profile.completed_courses, course_namespace, True)
 
             if final_grade is not None or course_info is not None:
                 course_info_dict = {}
@@ -966,6 +1085,16 @@ class StudentProfileDAO(object):
                 course_info_dict[course_namespace] = info
                 profile.course_info = transforms.dumps(course_info_dict)
 
+    @classmethod
+    def _set_in_index(cls, index, namespace, value):
+        """Adds or removes a namespace in a sorted enrollment index list."""
+        position = bisect.bisect_left(index, namespace)
+        present = position < len(index) and index[position] == namespace
+        if value and not present:
+            index.insert(position, namespace)
+        elif not value and present:
+            del index[position]
+
     @classmethod
     def _update_course_profile_attributes(
         cls, student, nick_name=None, is_enrolled=None, labels=None):
@@ -1684,17 +1813,32 @@ class EventEntity(BaseEntity):
                     source, user.user_id(), data_dict)
 
     @classmethod
-    def record(cls, source, user, data):
-        """Records new event into a datastore."""
-        data_dict = transforms.loads(data)
+    def _create(cls, source, user, data_dict):
         cls._run_record_hooks(source, user, data_dict)
-        data = transforms.dumps(data_dict)
-
         event = cls()
         event.source = source
         event.user_id = user.user_id()
-        event.data = data
-        event.put()
+        event.data = transforms.dumps(data_dict)
+        return event
+
+    @classmethod
+    def record(cls, source, user, data):
+        """Records new event into a datastore."""
+        cls._create(source, user, transforms.loads(data)).put()
+
+    @classmethod
+    def record_multi(cls, user, events):
+        """Records several events for one user with a single datastore put.
+
+        Args:
+          user: the user who triggered all of the events.
+          events: a list of (source, data_dict) tuples; data_dict is the
+              already-parsed event payload.
+        """
+        entities = [cls._create(source, user, data_dict)
+                    for source, data_dict in events]
+        if entities:
+            put(entities)
 
     def for_export(self, transform_fn):
         model = super(EventEntity, self).for_export(transform_fn)
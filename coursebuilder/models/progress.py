@@ -16,6 +16,7 @@
 
 __author__ = 'Sean Lip (sll@google.com)'
 
+import contextlib
 import datetime
 import logging
 import os
@@ -104,10 +105,58 @@ class UnitLessonCompletionTracker(object):
 
     def __init__(self, course):
         self._course = course
+        self._batch = None
 
     def _get_course(self):
         return self._course
 
+    @contextlib.contextmanager
+    def batch_updates(self, student):
+        """Defers writes of the student's progress until the block exits.
+
+        All put_*() calls made for this student inside the block share a
+        single read of the progress entity and a single put() at the end.
+        Nested calls join the outer batch.
+
+        Args:
+          student: the Student whose progress is being updated.
+
+        Yields:
+          Nothing; use as the target of a 'with' statement.
+        """
+        if self._batch is not None or student.is_transient:
+            yield
+            return
+
+        self._batch = {'student': student, 'progress': None, 'dirty': False}
+        try:
+            yield
+            batch = self._batch
+        finally:
+            self._batch = None
+        if batch['dirty']:
+            progress = batch['progress']
+            progress.updated_on = datetime.datetime.now()
+            progress.put()
+
+    def _get_progress_for_update(self, student):
+        """Gets the progress entity to modify, honoring any open batch."""
+        batch = self._batch
+        if batch is None or batch['student'] is not student:
+            return self.get_or_create_progress(student)
+        if batch['progress'] is None:
+            batch['progress'] = self.get_or_create_progress(student)
+        return batch['progress']
+
+    def _put_progress(self, progress):
+        """Saves modified progress, or defers the save to an open batch."""
+        batch = self._batch
+        if batch is not None and batch['progress'] is progress:
+            batch['dirty'] = True
+            return
+        progress.updated_on = datetime.datetime.now()
+        progress.put()
+
     def get_activity_as_python(self, unit_id, lesson_id):
         """Gets the corresponding activity as a Python object."""
         root_name = 'activity'
@@ -650,13 +699,12 @@ class UnitLessonCompletionTracker(object):
         """Update custom unit."""
         if student.is_transient:
             return
-        progress = self.get_or_create_progress(student)
+        progress = self._get_progress_for_update(student)
         current_state = self._get_entity_value(progress, event_key)
         if current_state == state or current_state == self.COMPLETED_STATE:
             return
         self._set_entity_value(progress, event_key, state)
-        progress.updated_on = datetime.datetime.now()
-        progress.put()
+        self._put_progress(progress)
 
     UPDATER_MAPPING = {
         'activity': _update_activity,
@@ -813,13 +861,12 @@ class UnitLessonCompletionTracker(object):
         if student.is_transient or event_entity not in self.EVENT_CODE_MAPPING:
             return
 
-        progress = self.get_or_create_progress(student)
+        progress = self._get_progress_for_update(student)
 
         self._update_event(
             student, progress, event_entity, event_key, direct_update=True)
 
-        progress.updated_on = datetime.datetime.now()
-        progress.put()
+        self._put_progress(progress)
 
     def _update_event(self, student, progress, event_entity, event_key,
                       direct_update=False):
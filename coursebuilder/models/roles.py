@@ -18,10 +18,15 @@ __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 import collections
 import config
+import hashlib
 import messages
+import sys
 
+from common import caching
 from common import utils
 from common import users
+from counters import PerfCounter
+from models import CAN_USE_MEMCACHE
 from models import MemcacheManager
 from models import RoleDAO
 
@@ -38,6 +43,115 @@ GCB_WHITELISTED_USERS = config.ConfigProperty(
 
 Permission = collections.namedtuple('Permission', ['name', 'description'])
 
+# Distinct admin lists and whitelists to keep parsed; roughly one per course.
+MAX_EMAIL_SET_CACHE_ITEMS = 128
+# Whitelists are unbounded text, so bound the cache by total size as well;
+# one parsed 50,000 address list takes about 5MB.
+MAX_EMAIL_SET_CACHE_SIZE_BYTES = 16 * 1024 * 1024
+
+
+class ProcessScopedEmailSetCache(caching.ProcessScopedSingleton):
+    """Holds in-process cache of parsed, lowercased sets of email addresses.
+
+    Entries are keyed by a digest of the text of the list, so an edit to a
+    site-wide or course-level admin list or whitelist simply produces a new
+    entry and the stale one ages out, without the cache holding the text.
+    """
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(cls.instance().cache.items)
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_item_count=MAX_EMAIL_SET_CACHE_ITEMS,
+            max_size_bytes=MAX_EMAIL_SET_CACHE_SIZE_BYTES)
+        self.cache.get_entry_size = self._get_entry_size
+
+    def _get_entry_size(self, key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + sum(
+            sys.getsizeof(email) for email in value)
+
+    @classmethod
+    def _get_key(cls, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return hashlib.sha1(text).hexdigest()
+
+    @classmethod
+    def get_email_set(cls, text):
+        cache = cls.instance().cache
+        key = cls._get_key(text)
+        found, email_set = cache.get(key)
+        if found:
+            EMAIL_SET_CACHE_HIT.inc()
+            return email_set
+        EMAIL_SET_CACHE_MISS.inc()
+        email_set = frozenset(email.lower() for email in utils.text_to_list(
+            text, utils.BACKWARD_COMPATIBLE_SPLITTER))
+        cache.put(key, email_set)
+        return email_set
+
+
+EMAIL_SET_CACHE_LEN = PerfCounter(
+    'gcb-models-EmailSetCache-len',
+    'A total number of parsed email lists held in-process.')
+EMAIL_SET_CACHE_HIT = PerfCounter(
+    'gcb-models-EmailSetCache-hit',
+    'A number of times a parsed email list was reused.')
+EMAIL_SET_CACHE_MISS = PerfCounter(
+    'gcb-models-EmailSetCache-miss',
+    'A number of times an email list had to be parsed.')
+
+EMAIL_SET_CACHE_LEN.poll_value = ProcessScopedEmailSetCache.get_cache_len
+
+
+class ProcessScopedPermissionsCache(caching.ProcessScopedSingleton):
+    """Holds in-process copies of the permissions map, one per namespace.
+
+    Each copy is tagged with the generation token that was in memcache when
+    it was loaded; Roles.update_permissions_map() writes a new token whenever
+    roles change. Cached maps are shared and must never be modified.
+    """
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(cls.instance().cache)
+
+    def __init__(self):
+        self.cache = {}
+
+    @classmethod
+    def is_enabled(cls):
+        # The generation token lives in memcache; without it there is no way
+        # to learn about role changes made in other processes.
+        return CAN_USE_MEMCACHE.value
+
+    def get(self, namespace, generation):
+        entry = self.cache.get(namespace)
+        if entry and generation and entry[0] == generation:
+            PERMISSIONS_CACHE_HIT.inc()
+            return entry[1]
+        PERMISSIONS_CACHE_MISS.inc()
+        return None
+
+    def put(self, namespace, generation, permissions_map):
+        if generation:
+            self.cache[namespace] = (generation, permissions_map)
+
+
+PERMISSIONS_CACHE_LEN = PerfCounter(
+    'gcb-models-PermissionsCache-len',
+    'A total number of namespaces with a permissions map held in-process.')
+PERMISSIONS_CACHE_HIT = PerfCounter(
+    'gcb-models-PermissionsCache-hit',
+    'A number of times an in-process permissions map was reused.')
+PERMISSIONS_CACHE_MISS = PerfCounter(
+    'gcb-models-PermissionsCache-miss',
+    'A number of times a permissions map had to be loaded.')
+
+PERMISSIONS_CACHE_LEN.poll_value = ProcessScopedPermissionsCache.get_cache_len
+
 
 class Roles(object):
     """A class that provides information about user roles."""
@@ -47,6 +161,7 @@ class Roles(object):
     _REGISTERED_PERMISSIONS = collections.OrderedDict()
 
     memcache_key = 'roles.Roles.users_to_permissions_map'
+    generation_memcache_key = 'roles.Roles.permissions_map_generation'
 
     @classmethod
     def is_direct_super_admin(cls):
@@ -68,19 +183,26 @@ class Roles(object):
             return True
 
         if KEY_COURSE in app_context.get_environ():
-            environ = app_context.get_environ()[KEY_COURSE]
-            if KEY_ADMIN_USER_EMAILS in environ:
-                allowed = environ[KEY_ADMIN_USER_EMAILS]
-                user = users.get_current_user()
-                if allowed and cls._user_email_in(user, allowed):
-                    return True
+            return cls.is_listed_course_admin(
+                users.get_current_user(), app_context.get_environ()[KEY_COURSE])
         return False
 
+    @classmethod
+    def is_listed_course_admin(cls, user, course_settings):
+        """Checks if a user is in the admin emails of the course settings."""
+        allowed = course_settings.get(KEY_ADMIN_USER_EMAILS)
+        return bool(allowed) and cls._user_email_in(user, allowed)
+
     @classmethod
     def is_user_whitelisted(cls, app_context):
-        user = users.get_current_user()
+        return cls.is_whitelisted(
+            users.get_current_user(), app_context.whitelist)
+
+    @classmethod
+    def is_whitelisted(cls, user, course_whitelist):
+        """Checks a user against a course whitelist, or else the global one."""
         global_whitelist = GCB_WHITELISTED_USERS.value.strip()
-        course_whitelist = app_context.whitelist.strip()
+        course_whitelist = course_whitelist.strip()
 
         # Most-specific whitelist used if present.
         if course_whitelist:
@@ -96,9 +218,10 @@ class Roles(object):
 
     @classmethod
     def _user_email_in(cls, user, text):
-        email_list = [email.lower() for email in utils.text_to_list(
-            text, utils.BACKWARD_COMPATIBLE_SPLITTER)]
-        return bool(user and user.email().lower() in email_list)
+        if not user or not text:
+            return False
+        return user.email().lower() in (
+            ProcessScopedEmailSetCache.get_email_set(text))
 
     @classmethod
     def update_permissions_map(cls):
@@ -106,7 +229,8 @@ class Roles(object):
 
         A dictionary is constructed, using roles information from the datastore,
         mapping user emails to dictionaries that map module names to
-        sets of permissions.
+        sets of permissions. A new generation token is written after the map,
+        so that processes holding an older copy of the map reload it.
 
         Returns:
             The created dictionary.
@@ -121,10 +245,44 @@ class Roles(object):
                     module_permissions.update(permissions)
 
         MemcacheManager.set(cls.memcache_key, permissions_map)
+        MemcacheManager.set(
+            cls.generation_memcache_key, utils.generate_instance_id())
         return permissions_map
 
     @classmethod
     def _load_permissions_map(cls):
+        """Loads the permissions map, preferring the in-process copy.
+
+        The returned map may be shared with other callers; do not modify it.
+        """
+        if not ProcessScopedPermissionsCache.is_enabled():
+            return cls._load_permissions_map_from_memcache()
+
+        # Read the token before the map; update_permissions_map() writes them
+        # in the opposite order, so a map is never tagged newer than it is.
+        namespace = MemcacheManager.get_namespace()
+        cache = ProcessScopedPermissionsCache.instance()
+        generation = MemcacheManager.get(cls.generation_memcache_key)
+        if generation is None:
+            # The token was evicted or never written. Seed one so the
+            # in-process copy can be used, and re-read it in case another
+            # request seeded or updated it first.
+            MemcacheManager.add(
+                cls.generation_memcache_key, utils.generate_instance_id())
+            generation = MemcacheManager.get(cls.generation_memcache_key)
+        permissions_map = cache.get(namespace, generation)
+        if permissions_map is None:
+            permissions_map = dict(
+                (user, dict(
+                    (module_name, frozenset(permissions))
+                    for module_name, permissions in modules.iteritems()))
+                for user, modules in
+                cls._load_permissions_map_from_memcache().iteritems())
+            cache.put(namespace, generation, permissions_map)
+        return permissions_map
+
+    @classmethod
+    def _load_permissions_map_from_memcache(cls):
         """Loads the permissions map from Memcache or creates it if needed."""
         permissions_map = MemcacheManager.get(cls.memcache_key)
         if permissions_map is None:  # As opposed to {}, which is valid.
@@ -121,9 +121,14 @@ class AbstractFileSystem(object):
         """Lists all files in a directory."""
         return self._impl.list(dir_name, include_inherited)
 
-    def get_jinja_environ(self, dir_names, autoescape=True):
+    def get_updated_on(self, filename):
+        """Returns last update time of a file, or None if it is absent."""
+        return self._impl.get_updated_on(filename)
+
+    def get_jinja_environ(self, dir_names, autoescape=True, locale=None):
         """Configures jinja environment loaders for this file system."""
-        return self._impl.get_jinja_environ(dir_names, autoescape=autoescape)
+        return self._impl.get_jinja_environ(
+            dir_names, autoescape=autoescape, locale=locale)
 
     def is_read_write(self):
         return self._impl.is_read_write()
@@ -180,6 +185,12 @@ class LocalReadOnlyFileSystem(object):
             return None
         return open(self._logical_to_physical(filename), 'rb')
 
+    def get_updated_on(self, filename):
+        if not self.isfile(filename):
+            return None
+        return datetime.datetime.utcfromtimestamp(
+            os.path.getmtime(self._logical_to_physical(filename)))
+
     def put(self, unused_filename, unused_stream):
         raise Exception('Not implemented.')
 
@@ -199,15 +210,15 @@ class LocalReadOnlyFileSystem(object):
                     self._physical_to_logical(os.path.join(dirname, filename)))
         return sorted(files)
 
-    def get_jinja_environ(self, dir_names, autoescape=True):
+    def get_jinja_environ(self, dir_names, autoescape=True, locale=None):
         """Configure the environment for Jinja templates."""
         physical_dir_names = []
         for dir_name in dir_names:
             physical_dir_names.append(self._logical_to_physical(dir_name))
 
-        return jinja_utils.create_jinja_environment(
-            loader=jinja2.FileSystemLoader(physical_dir_names),
-            autoescape=autoescape)
+        return jinja_utils.get_jinja_environment(
+            lambda: jinja2.FileSystemLoader(physical_dir_names),
+            physical_dir_names, locale=locale, autoescape=autoescape)
 
     def is_read_write(self):
         return False
@@ -284,13 +295,23 @@ class VirtualFileSystemTemplateLoader(jinja2.BaseLoader):
             for dir_name in dir_names:
                 self._dir_names.append(AbstractFileSystem.normpath(dir_name))
 
+    def _get_updated_on(self, filenames):
+        return [self._fs.get_updated_on(filename) for filename in filenames]
+
     def get_source(self, unused_environment, template):
+        filenames = []
         for dir_name in self._dir_names:
             filename = AbstractFileSystem.normpath(
                 os.path.join(dir_name, template))
+            filenames.append(filename)
             stream = self._fs.open(filename)
             if stream:
-                return stream.read().decode('utf-8'), filename, True
+                # The template stays current while neither this file nor any
+                # file that would shadow it has been written since loading.
+                updated_on = self._get_updated_on(filenames)
+                uptodate = (
+                    lambda: self._get_updated_on(filenames) == updated_on)
+                return stream.read().decode('utf-8'), filename, uptodate
         raise jinja2.TemplateNotFound(template)
 
     def list_templates(self):
@@ -588,6 +609,20 @@ class DatastoreBackedFileSystem(object):
         VfsCacheConnection.CACHE_NOT_FOUND.inc()
         return None
 
+    def get_updated_on(self, afilename):
+        """Gets last update time of a file in a datastore; None if absent."""
+        filename = self._logical_to_physical(afilename)
+        found, stream = self.cache.get(filename)
+        if found:
+            if stream and stream.metadata:
+                return stream.metadata.updated_on
+            return None
+        metadata = FileMetadataEntity.get_by_key_name(filename)
+        if metadata:
+            return metadata.updated_on
+        self.cache.put(filename, None, None)
+        return None
+
     def put(self, filename, stream, is_draft=False, metadata_only=False):
         """Puts a file stream to a database. Raw bytes stream, no encodings."""
         if stream:  # Must be outside the transactional operation
@@ -683,38 +718,49 @@ class DatastoreBackedFileSystem(object):
         has completed, but in any event, it MUST be called before the request
         handler can exit successfully.
 
+        Existing metadata for all the files is read with a single datastore
+        call, and files larger than one entity are sharded as in
+        non_transactional_put. As there, metadata is only written once the data
+        is, so a failed put never leaves metadata pointing at missing data.
+
         Args:
             filedata_list: list. A list of tuples. The first entry of each
                 tuple is the file name, the second is a filelike object holding
-                the file data.
+                the file data. An optional third entry is the is_draft flag
+                to store for the file; it defaults to False.
 
         Returns:
             callable. Returns a wait-and-finalize function. This function must
             be called at some point before the request handler exists, in order
             to confirm that the puts have succeeded.
         """
-        filename_list = []
+        filename_list = [
+            self._logical_to_physical(filedata[0])
+            for filedata in filedata_list]
         data_list = []
         metadata_list = []
 
-        for filename, stream in filedata_list:
-            filename = self._logical_to_physical(filename)
-            filename_list.append(filename)
-
-            metadata = FileMetadataEntity.get_by_key_name(filename)
+        existing_metadata = FileMetadataEntity.get_by_key_name(filename_list)
+        for filename, metadata, filedata in zip(
+                filename_list, existing_metadata, filedata_list):
             if not metadata:
                 metadata = FileMetadataEntity(key_name=filename)
             metadata_list.append(metadata)
             metadata.updated_on = datetime.datetime.utcnow()
+            metadata.is_draft = filedata[2] if len(filedata) > 2 else False
 
             # We operate with raw bytes. The consumer must deal with encoding.
-            raw_bytes = stream.read()
+            raw_bytes = filedata[1].read()
 
             metadata.size = len(raw_bytes)
 
-            data = FileDataEntity(key_name=filename)
-            data_list.append(data)
-            data.data = raw_bytes
+            key_names = self._generate_file_key_names(filename, metadata.size)
+            for index, key_name in enumerate(key_names):
+                data = FileDataEntity(key_name=key_name)
+                data_list.append(data)
+                data.data = raw_bytes[
+                    index * _MAX_VFS_SHARD_SIZE:
+                    (index + 1) * _MAX_VFS_SHARD_SIZE]
 
             # we do call delete here; so this instance will not increment EVICT
             # counter value, but the DELETE value; other instance will not
@@ -722,11 +768,10 @@ class DatastoreBackedFileSystem(object):
             self.cache.delete(filename)
 
         data_future = db.put_async(data_list)
-        metadata_future = db.put_async(metadata_list)
 
         def wait_and_finalize():
             data_future.check_success()
-            metadata_future.check_success()
+            entities_put(metadata_list)
 
         return wait_and_finalize
 
@@ -752,6 +797,28 @@ class DatastoreBackedFileSystem(object):
             result = self._inherits_from.isfile(afilename)
         return result
 
+    def isfile_multi(self, afilenames):
+        """Checks existence of many files with one datastore call.
+
+        Args:
+            afilenames: list of string. Logical names of the files to check.
+
+        Returns:
+            List of boolean, in the order of afilenames; see isfile().
+        """
+        filenames = [
+            self._logical_to_physical(afilename) for afilename in afilenames]
+        results = []
+        for afilename, filename, metadata in zip(
+                afilenames, filenames,
+                FileMetadataEntity.get_by_key_name(filenames)):
+            result = bool(metadata)
+            if not result and self._inherits_from and self._can_inherit(
+                    filename):
+                result = self._inherits_from.isfile(afilename)
+            results.append(result)
+        return results
+
     def list(self, dir_name, include_inherited=False):
         """Lists all files in a directory by using datastore query.
 
@@ -779,11 +846,11 @@ class DatastoreBackedFileSystem(object):
                     include_inherited)))
         return sorted(list(result))
 
-    def get_jinja_environ(self, dir_names, autoescape=True):
-        return jinja_utils.create_jinja_environment(
-            loader=VirtualFileSystemTemplateLoader(
+    def get_jinja_environ(self, dir_names, autoescape=True, locale=None):
+        return jinja_utils.get_jinja_environment(
+            lambda: VirtualFileSystemTemplateLoader(
                 self, self._logical_home_folder, dir_names),
-            autoescape=autoescape)
+            dir_names, locale=locale, autoescape=autoescape, owner=self)
 
     def is_read_write(self):
         return True
@@ -172,8 +172,14 @@ def register_module():
         description=services.help_urls.make_learn_more_message(
             messages.ANALYTICS_ENABLE_STUDENT_DESCRIPTION,
             can_record_student_events_name))
+    incremental_student_aggregate = schema_fields.SchemaField(
+        'course:' + student_aggregate.INCREMENTAL_AGGREGATION_SETTING,
+        'Incremental Student Aggregation', 'boolean', i18n=False,
+        optional=True,
+        description=messages.ANALYTICS_INCREMENTAL_AGGREGATION_DESCRIPTION)
     course_settings_fields = [
-        lambda course: can_record_student_events
+        lambda course: can_record_student_events,
+        lambda course: incremental_student_aggregate,
     ]
 
     def on_module_enabled():
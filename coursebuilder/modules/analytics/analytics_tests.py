@@ -21,9 +21,12 @@ import collections
 import copy
 import datetime
 import json
+import logging
 import os
 import pprint
+import random
 import tempfile
+import time
 import urllib
 import zlib
 
@@ -297,6 +300,69 @@ class StudentAggregateTest(AbstractModulesAnalyticsTest):
         # No sorting - items should be presented in order by time, video, etc.
         self.assertEqual(expected, actual['youtube'])
 
+    def test_incremental_aggregation(self):
+        self.load_course('simple_questions')
+        self.load_datastore('location_locale')
+        with actions.OverriddenEnvironment({'course': {
+                student_aggregate.INCREMENTAL_AGGREGATION_SETTING: True}}):
+            self.run_aggregator_job()
+
+            # Replace the aggregated events with a newer one.  Only the new
+            # event is mapped, and it is merged with the stored aggregate.
+            # Runs here are too close together to leave an event between
+            # their watermarks, so the stored watermark is moved back.
+            with common_utils.Namespace('ns_' + self.COURSE_NAME):
+                for event in models.EventEntity.all():
+                    event.delete()
+                watermark_class = (
+                    student_aggregate.StudentAggregateWatermarkEntity)
+                state = watermark_class.get_by_key_name(
+                    watermark_class.KEY_NAME)
+                self.assertIsNone(state.started)
+                state.watermark -= datetime.timedelta(seconds=10)
+                state.put()
+                models.EventEntity(
+                    recorded_on=(
+                        state.watermark + datetime.timedelta(seconds=5)),
+                    source='enter-page', user_id='124317316405206137111',
+                    data=transforms.dumps({
+                        'loc': {'country': 'US', 'locale': 'en_US'},
+                        'location': 'http://localhost:8081/test_course/unit',
+                        'user_agent': 'Test Browser'})).put()
+            self.run_aggregator_job()
+
+        actual = self.get_aggregated_data_by_email('foo@bar.com')
+        self.assertIn(
+            {'country': 'US', 'frequency': 5.0 / 9, 'count': 5},
+            actual['location_frequencies'])
+        self.assertIn(
+            {'locale': 'en_US', 'frequency': 5.0 / 9, 'count': 5},
+            actual['locale_frequencies'])
+        self.assertIn(
+            {'user_agent': 'Test Browser', 'frequency': 1.0 / 9, 'count': 1},
+            actual['user_agent_frequencies'])
+
+    def test_every_run_stores_watermark_with_clock_skew_margin(self):
+        self.load_course('simple_questions')
+        self.load_datastore('location_locale')
+        watermark_class = student_aggregate.StudentAggregateWatermarkEntity
+        skew = datetime.timedelta(
+            seconds=student_aggregate.WATERMARK_CLOCK_SKEW_SEC)
+
+        for incremental in (False, True):
+            with actions.OverriddenEnvironment({'course': {
+                    student_aggregate.INCREMENTAL_AGGREGATION_SETTING: (
+                        incremental)}}):
+                self.run_aggregator_job()
+            with common_utils.Namespace('ns_' + self.COURSE_NAME):
+                state = watermark_class.get_by_key_name(
+                    watermark_class.KEY_NAME)
+            self.assertLessEqual(
+                state.watermark, datetime.datetime.utcnow() - skew)
+            # A run that also counted events past its watermark cannot be
+            # continued incrementally.
+            self.assertEqual(incremental, state.signature is not None)
+
 
 class StudentAggregateSchemaRegistryTests(actions.TestBase):
 
@@ -1745,6 +1811,70 @@ class ClusteringGeneratorTests(actions.TestBase):
         ]
         self._check_hamming(cluster_vector, [], 1)
 
+    def _pairwise_distance(self, cluster_vector, student_vector):
+        """Distance as computed before clusters were compiled."""
+        distance = 0
+        for dim in cluster_vector:
+            value = clustering.StudentVector.get_dimension_value(
+                student_vector, dim[clustering.DIM_ID],
+                dim[clustering.DIM_TYPE]) or 0
+            if ((dim.get(clustering.DIM_LOW) not in (None, '') and
+                 dim[clustering.DIM_LOW] > value) or
+                (dim.get(clustering.DIM_HIGH) not in (None, '') and
+                 dim[clustering.DIM_HIGH] < value)):
+                distance += 1
+        return distance
+
+    def test_cluster_space_matches_pairwise_distance(self):
+        num_students = 1000
+        num_clusters = 50
+        max_distance = clustering.ClusteringGenerator.MAX_DISTANCE
+        rand = random.Random(0)
+
+        def make_dim(index, **kwargs):
+            kwargs.update({
+                clustering.DIM_TYPE: clustering.DIM_TYPE_QUESTION,
+                clustering.DIM_ID: str(index)})
+            return kwargs
+
+        clusters = []
+        for cluster_id in xrange(num_clusters):
+            vector = []
+            for index in rand.sample(xrange(self.dim_number), 5):
+                low = rand.choice([None, '', 0, 20, 40])
+                high = rand.choice([None, '', 60, 80, 100])
+                vector.append(make_dim(index, low=low, high=high))
+            clusters.append({'id': cluster_id, 'vector': vector})
+        students = [
+            [make_dim(index, value=rand.randint(0, 100))
+             for index in xrange(self.dim_number) if rand.random() < 0.8]
+            for _ in xrange(num_students)]
+
+        start = time.time()
+        expected = []
+        for student_vector in students:
+            distances = []
+            for cluster in clusters:
+                distance = self._pairwise_distance(
+                    cluster['vector'], student_vector)
+                if distance <= max_distance:
+                    distances.append((cluster['id'], distance))
+            expected.append(distances)
+        pairwise_sec = time.time() - start
+
+        start = time.time()
+        # pylint: disable=protected-access
+        space = clustering._ClusterSpace('test', clusters)
+        actual = [list(space.distances(student_vector, max_distance))
+                  for student_vector in students]
+        compiled_sec = time.time() - start
+
+        self.assertEqual(expected, actual)
+        logging.info(
+            'Clustered %s students x %s clusters; pairwise: %.3fs, '
+            'compiled: %.3fs', num_students, num_clusters, pairwise_sec,
+            compiled_sec)
+
 
 class TestClusterStatisticsDataSource(actions.TestBase):
 
@@ -2112,6 +2242,24 @@ class GradebookCsvTests(actions.TestBase):
         actions.login(self.ADMIN_EMAIL)
         self._verify(expected_scores, expected_questions)
 
+    def test_students_are_written_in_chunks_in_user_id_order(self):
+        # Answers from users with no Student record; these all share the
+        # placeholder email, but must still be kept as separate rows.
+        for user_id in ['5', '3', '1', '4', '2']:
+            answers = [[
+                self.unit_two.unit_id, self.u2_l1.lesson_id, 0, self.q_a_id,
+                None, None, 'x', 1, int(user_id), True]]
+            gradebook.QuestionAnswersEntity(
+                key_name=user_id, data=transforms.dumps(answers)).put()
+
+        generator = gradebook.GradebookGradedItemsCsvGenerator(
+            self.app_context)
+        generator.CHUNK_SIZE = 2
+        expected = self.expected_score_headers + ''.join(
+            '<unknown>,%s,0.0,0.0,0.0,0.0,0.0,0.0\r\n' % float(user_id)
+            for user_id in range(1, 6))
+        self.assertEquals(expected, generator.get_output())
+
     def test_commas_are_stripped(self):
         course_name = 'commas'
         with common_utils.Namespace('ns_' + course_name):
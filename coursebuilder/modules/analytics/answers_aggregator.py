@@ -181,6 +181,16 @@ class AnswersAggregator(student_aggregate.AbstractStudentAggregationComponent):
                     assessment['min_score'] = min_score
         return {'assessments': assessments}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        # Earlier assessments have the same shape as event items; their
+        # summary scores are recomputed along with the new submissions.
+        if aggregate:
+            event_items = aggregate['assessments'] + event_items
+        return cls.produce_aggregate(
+            course, student, static_params, event_items)
+
     @classmethod
     def get_schema(cls):
         answer = schema_fields.FieldRegistry('answer')
@@ -779,7 +779,74 @@ class StudentVectorGenerator(jobs.MapReduceJob):
         return 0
 
 
-def hamming_distance(vector, student_vector):
+class _ClusterSpace(object):
+    """Cluster vectors compiled over one indexed space of dimensions.
+
+    Each (type, id) dimension bounded by any cluster is given an index, and
+    each cluster keeps only its bounded dimensions as (index, low, high)
+    tuples, with None for a missing side.  A student vector is then read once
+    into a dense list of values, rather than being scanned for every
+    dimension of every cluster.
+    """
+
+    def __init__(self, mapreduce_id, clusters):
+        self.mapreduce_id = mapreduce_id
+        self._dim_index = {}
+        self._clusters = []
+        for cluster in clusters:
+            bounds = []
+            for dim in cluster['vector']:
+                low = dim[DIM_LOW] if _has_left_side(dim) else None
+                high = dim[DIM_HIGH] if _has_right_side(dim) else None
+                if low is None and high is None:
+                    continue  # Every value is in range.
+                key = (dim[DIM_TYPE], str(dim[DIM_ID]))
+                index = self._dim_index.setdefault(key, len(self._dim_index))
+                bounds.append((index, low, high))
+            self._clusters.append((cluster['id'], bounds))
+
+    def to_dense(self, student_vector):
+        """Returns the values of student_vector by dimension index.
+
+        Dimensions missing from the student vector, or having a false value,
+        get the value 0.  If a dimension appears more than once, the first
+        value is used.
+        """
+        values = [0] * len(self._dim_index)
+        seen = set()
+        for dim in student_vector:
+            index = self._dim_index.get((dim[DIM_TYPE], str(dim[DIM_ID])))
+            if index is not None and index not in seen:
+                seen.add(index)
+                values[index] = dim[DIM_VALUE] or 0
+        return values
+
+    @staticmethod
+    def _distance(bounds, values, max_distance):
+        distance = 0
+        for index, low, high in bounds:
+            value = values[index]
+            if ((low is not None and not low <= value) or
+                (high is not None and not high >= value)):
+                distance += 1
+                if max_distance is not None and distance > max_distance:
+                    break
+        return distance
+
+    def distances(self, student_vector, max_distance=None):
+        """Yields (cluster id, distance) for each cluster, in order.
+
+        If max_distance is given, clusters farther than that from the student
+        are skipped, and counting stops for a cluster once it is exceeded.
+        """
+        values = self.to_dense(student_vector)
+        for cluster_id, bounds in self._clusters:
+            distance = self._distance(bounds, values, max_distance)
+            if max_distance is None or distance <= max_distance:
+                yield cluster_id, distance
+
+
+def hamming_distance(vector, student_vector, max_distance=None):
     """Return the hamming distance between a ClusterEntity and a StudentVector.
 
     The hamming distance between an ClusterEntity and a StudentVector is the
@@ -791,27 +858,14 @@ def hamming_distance(vector, student_vector):
     Params:
         vector: the vector field of a ClusterEntity instance.
         student_vector: the vector field of a StudentVector instance.
+        max_distance: optional. If given, stop counting once the distance
+            exceeds this value, and return max_distance + 1.
     """
-    # TODO(milit): As we are discarding all distances greater than
-    # ClusteringGenerator.MAX_DISTANCE, add it as a parameter so we stop
-    # calculating the distance once this limit is reached.
-    def fits_left_side(dim, value):
-        """_has_left_side(dim) -> dim[DIM_LOW] <= value"""
-        return not _has_left_side(dim) or dim[DIM_LOW] <= value
-
-    def fits_right_side(dim, value):
-        """_has_right_side(dim) -> dim[DIM_HIGH] >= value"""
-        return not _has_right_side(dim) or dim[DIM_HIGH] >= value
-
-    distance = 0
-    for dim in vector:
-        value = StudentVector.get_dimension_value(student_vector,
-                                                  dim[DIM_ID], dim[DIM_TYPE])
-        if not value:
-            value = 0
-        if not fits_left_side(dim, value) or not fits_right_side(dim, value):
-            distance += 1
-    return distance
+    space = _ClusterSpace(None, [{'id': None, 'vector': vector}])
+    # pylint: disable=protected-access
+    bounds = space._clusters[0][1]
+    return space._distance(bounds, space.to_dense(student_vector),
+                           max_distance)
 
 
 class ClusteringGenerator(jobs.MapReduceJob):
@@ -832,6 +886,10 @@ class ClusteringGenerator(jobs.MapReduceJob):
     """
     MAX_DISTANCE = 2
 
+    # The _ClusterSpace for the clusters of the job being mapped; compiled
+    # by the first map() call of each job.
+    _cluster_space = None
+
     # TODO(milit): Add settings to disable heavy statistics.
     @staticmethod
     def get_description():
@@ -849,6 +907,16 @@ class ClusteringGenerator(jobs.MapReduceJob):
             'max_distance': getattr(self, 'MAX_DISTANCE', 2)
         }
 
+    @classmethod
+    def _get_cluster_space(cls):
+        spec = context.get().mapreduce_spec
+        space = cls._cluster_space
+        if not space or space.mapreduce_id != spec.mapreduce_id:
+            space = _ClusterSpace(
+                spec.mapreduce_id, spec.mapper.params['clusters'])
+            cls._cluster_space = space
+        return space
+
     @staticmethod
     def map(item):
         """Calculates the distance from the StudentVector to ClusterEntites.
@@ -875,17 +943,16 @@ class ClusteringGenerator(jobs.MapReduceJob):
             max_distance = mapper_params['max_distance']
             clusters = {}
             item_vector = transforms.loads(student.vector)
-            for cluster in mapper_params['clusters']:
-                distance = hamming_distance(cluster['vector'], item_vector)
-                if distance > max_distance:
-                    continue
+            space = ClusteringGenerator._get_cluster_space()
+            for cluster_id, distance in space.distances(
+                    item_vector, max_distance):
                 for cluster2_id, distance2 in clusters.items():
-                    key = transforms.dumps((cluster2_id, cluster['id']))
+                    key = transforms.dumps((cluster2_id, cluster_id))
                     value = (item.user_id, distance, distance2)
                     yield (key, transforms.dumps(value))
-                clusters[cluster['id']] = distance
+                clusters[cluster_id] = distance
                 to_yield = (item.user_id, distance)
-                yield(cluster['id'], transforms.dumps(to_yield))
+                yield(cluster_id, transforms.dumps(to_yield))
             clusters = transforms.dumps(clusters)
             StudentClusters(key_name=item.user_id, clusters=clusters).put()
         yield ('student_count', 1)
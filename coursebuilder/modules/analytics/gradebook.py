@@ -25,7 +25,6 @@ import StringIO
 
 from mapreduce import context
 
-from common import catch_and_log
 from common import crypto
 from common import schema_fields
 from common import tags
@@ -304,14 +303,8 @@ class RawAnswersDataSource(data_sources.SynchronousQuery,
         return reg.get_json_schema_dict()['properties']
 
     @classmethod
-    def _postprocess_rows(cls, app_context, source_context, schema, log,
-                          page_number, rows):
-        """Unpack all responses from single student into separate rows."""
-
-        # Fill in responses with actual student name, not just ID.
-        ids = []
-        for entity in rows:
-            ids.append(entity.key().id_or_name())
+    def _get_students(cls, ids):
+        """Returns Students for user IDs, with placeholders for unknown IDs."""
 
         # Chunkify student lookups; 'in' has max of 30
         students = []
@@ -329,46 +322,69 @@ class RawAnswersDataSource(data_sources.SynchronousQuery,
                 else:
                     students += [StudentPlaceholder(
                         student_id, '<unknown>', '<unknown>')]
+        return students
 
-        # Prepare to convert multiple-choice question indices to answer strings.
+    @classmethod
+    def _get_mc_choices(cls):
+        """Map question IDs to choice texts, for multiple-choice questions."""
         mc_choices = {}
         for question in models.QuestionDAO.get_all():
             if 'choices' in question.dict:
                 mc_choices[str(question.id)] = [
                     choice['text'] for choice in question.dict['choices']]
+        return mc_choices
+
+    @classmethod
+    def _unpack_answers(cls, entity, student, mc_choices):
+        """Unpack all responses from single student into separate rows."""
+        ret = []
+        raw_answers = transforms.loads(entity.data)
+        answers = [event_transforms.QuestionAnswerInfo(*parts)
+                   for parts in raw_answers]
+        for answer in answers:
+            if answer.question_id in mc_choices:
+                choices = mc_choices[answer.question_id]
+                given_answers = []
+                for i in answer.answers:
+                    given_answers.append(
+                        choices[i] if i < len(choices)
+                        else '[deleted choice]')
+            else:
+                given_answers = answer.answers
+                if not isinstance(given_answers, list):
+                    given_answers = [given_answers]
+            ret.append({
+                'user_id': student.user_id,
+                'user_name': student.name or '<blank>',
+                'user_email': student.email or '<blank>',
+                'unit_id': str(answer.unit_id),
+                'lesson_id': str(answer.lesson_id),
+                'sequence': answer.sequence,
+                'question_id': str(answer.question_id),
+                'question_type': answer.question_type,
+                'timestamp': answer.timestamp,
+                'answers': given_answers,
+                'score': float(answer.score),
+                'weighted_score': float(answer.weighted_score),
+                'tallied': answer.tallied,
+                })
+        return ret
+
+    @classmethod
+    def _postprocess_rows(cls, app_context, source_context, schema, log,
+                          page_number, rows):
+        """Unpack all responses from single student into separate rows."""
+
+        # Fill in responses with actual student name, not just ID.
+        students = cls._get_students(
+            [entity.key().id_or_name() for entity in rows])
+
+        # Prepare to convert multiple-choice question indices to answer strings.
+        mc_choices = cls._get_mc_choices()
 
         ret = []
         for entity, student in zip(rows, students):
-            raw_answers = transforms.loads(entity.data)
-            answers = [event_transforms.QuestionAnswerInfo(*parts)
-                       for parts in raw_answers]
-            for answer in answers:
-                if answer.question_id in mc_choices:
-                    choices = mc_choices[answer.question_id]
-                    given_answers = []
-                    for i in answer.answers:
-                        given_answers.append(
-                            choices[i] if i < len(choices)
-                            else '[deleted choice]')
-                else:
-                    given_answers = answer.answers
-                    if not isinstance(given_answers, list):
-                        given_answers = [given_answers]
-                ret.append({
-                    'user_id': student.user_id,
-                    'user_name': student.name or '<blank>',
-                    'user_email': student.email or '<blank>',
-                    'unit_id': str(answer.unit_id),
-                    'lesson_id': str(answer.lesson_id),
-                    'sequence': answer.sequence,
-                    'question_id': str(answer.question_id),
-                    'question_type': answer.question_type,
-                    'timestamp': answer.timestamp,
-                    'answers': given_answers,
-                    'score': float(answer.score),
-                    'weighted_score': float(answer.weighted_score),
-                    'tallied': answer.tallied,
-                    })
+            ret.extend(cls._unpack_answers(entity, student, mc_choices))
         return ret
 
 
@@ -597,45 +613,67 @@ class AbstractGradebookCsvGenerator(object):
         self._app_context = app_context
         self._source_context = source_context
 
-    def get_output(self):
-        student_question_answers = self._fetch_all_question_answers()
-        column_titles, ids_to_index = self._walk_course()
-        answer_rows = self._reduce_answers(
-            student_question_answers, ids_to_index)
+    # Number of QuestionAnswersEntity rows loaded from the datastore at once.
+    # Student lookups for a chunk are done with an 'in' filter, so this is
+    # bounded by the number of subqueries the datastore permits.
+    CHUNK_SIZE = datastore.MAX_ALLOWABLE_QUERIES
 
+    def get_output(self):
         stream = StringIO.StringIO()
+        self.write_csv(stream)
+        ret = stream.getvalue()
+        stream.close()
+        return ret
+
+    def write_csv(self, stream):
+        """Write the gradebook as CSV, one student at a time.
+
+        Args:
+          stream: Any object with a write() method; e.g., a response, a
+              local file, or a file opened with cloudstorage.open().
+        """
         csv_stream = csv.writer(stream, quoting=csv.QUOTE_MINIMAL)
-        for row in [column_titles] + answer_rows:
+        for row in self.iter_rows():
             row = [i.encode('utf-8') if isinstance(i, unicode) else str(i)
                    for i in row]
             csv_stream.writerow(row)
-        ret = stream.getvalue()
-        stream.close()
-        return ret
 
-    def _fetch_all_question_answers(self):
+    def iter_rows(self):
+        """Yield the column titles, then one row per student with answers."""
+        column_titles, ids_to_index = self._walk_course()
+        yield column_titles
+        for student_question_answers in self._iter_question_answers():
+            for row in self._reduce_answers(
+                    student_question_answers, ids_to_index):
+                yield row
+
+    def _iter_question_answers(self):
+        """Yield lists of the answers of each student, in user ID order.
+
+        Only one chunk of QuestionAnswersEntity rows is held at a time, so
+        memory use does not grow with the number of students.
+        """
+        # pylint: disable=protected-access
+        source_class = RawAnswersDataSource
+        mc_choices = source_class._get_mc_choices()
+        chunk = []
+        query = QuestionAnswersEntity.all().order('__key__')
+        for entity in query.run(batch_size=self.CHUNK_SIZE):
+            chunk.append(entity)
+            if len(chunk) == self.CHUNK_SIZE:
+                for answers in self._unpack_chunk(chunk, mc_choices):
+                    yield answers
+                chunk = []
+        for answers in self._unpack_chunk(chunk, mc_choices):
+            yield answers
+
+    def _unpack_chunk(self, entities, mc_choices):
+        # pylint: disable=protected-access
         source_class = RawAnswersDataSource
-        values = []
-        chunk_size = source_class.get_default_chunk_size()
-        context_class = source_class.get_context_class()
-        source_context = context_class.build_blank_default({}, chunk_size)
-        catch_and_log_ = catch_and_log.CatchAndLog()
-        sought_page_number = 0
-        with catch_and_log_.propagate_exceptions('Loading gradebook data'):
-            schema = source_class.get_schema(
-                self._app_context, catch_and_log, source_context)
-            while True:
-                data, actual_page_number = source_class.fetch_values(
-                    self._app_context, source_context, schema, catch_and_log_,
-                    sought_page_number)
-                if actual_page_number != sought_page_number:
-                    break
-                values.extend(data)
-                if len(data) < source_context.chunk_size:
-                    break
-                sought_page_number += 1
-        values.sort(key=lambda x: x['user_email'])
-        return values
+        students = source_class._get_students(
+            [entity.key().id_or_name() for entity in entities])
+        for entity, student in zip(entities, students):
+            yield source_class._unpack_answers(entity, student, mc_choices)
 
     def _walk_course(self):
         """Traverse course, producing helper items.
@@ -660,7 +698,7 @@ class AbstractGradebookCsvGenerator(object):
 
         Args:
           student_question_answers: Rows, as generated by
-              RawAnswersDataSource._postprocess_rows.  Each row corresponds to
+              RawAnswersDataSource._unpack_answers.  Each row corresponds to
               one answer to one question by one student.  All answers for each
               student are guaranteed to be adjacent.  This is not a complete
               Cartesian product of students X all possible questions; only the
@@ -774,16 +812,14 @@ class GradebookAllQuestionsCsvGenerator(AbstractGradebookCsvGenerator):
         return ret
 
 
-def _generate_csv(app_context, mode):
+def _get_csv_generator(app_context, mode):
     if mode == _MODE_SCORES:
         generator_class = GradebookGradedItemsCsvGenerator
     elif mode == _MODE_QUESTIONS:
         generator_class = GradebookAllQuestionsCsvGenerator
     else:
         raise ValueError('Mode "%s" not in %s' % (mode, ','.join(_MODES)))
-    generator = generator_class(app_context)
-    output = generator.get_output()
-    return output
+    return generator_class(app_context)
 
 
 class DownloadAsCsv(etl_lib.CourseJob):
@@ -811,9 +847,9 @@ class DownloadAsCsv(etl_lib.CourseJob):
     def main(self):
         app_context = self._get_app_context_or_die(
             self.etl_args.course_url_prefix)
-        output = _generate_csv(app_context, self.args.mode)
+        generator = _get_csv_generator(app_context, self.args.mode)
         with open(self.args.save_as, 'w') as fp:
-            fp.write(output)
+            generator.write_csv(fp)
 
 
 class CsvDownloadHandler(utils.BaseHandler):
@@ -824,7 +860,7 @@ class CsvDownloadHandler(utils.BaseHandler):
         if not roles.Roles.is_course_admin(self.app_context):
             self.error(401)
         mode = self.request.get(_MODE_ARG_NAME, _MODE_SCORES)
-        output = _generate_csv(self.app_context, mode)
+        generator = _get_csv_generator(self.app_context, mode)
         filename = '%s_%s.csv' % (self.app_context.get_title(), mode)
         safe_filename = re.sub(r'[\"\']', '_', filename.lower())
         if isinstance(safe_filename, unicode):
@@ -834,4 +870,4 @@ class CsvDownloadHandler(utils.BaseHandler):
         self.response.headers.add(
             'Content-Disposition',
             str('attachment; filename="%s"' % str(safe_filename)))
-        self.response.write(output)
+        generator.write_csv(self.response)
@@ -46,16 +46,22 @@ class LocationAggregator(student_aggregate.AbstractStudentAggregationComponent):
         return loc.get('country'), loc.get('region'), loc.get('city')
 
     @classmethod
-    def produce_aggregate(cls, course, student, static_params, event_items):
-        locations = collections.defaultdict(int)
+    def _count_locations(cls, locations, event_items):
+        # Empty parts are counted as missing ones.  The aggregate omits both
+        # alike, so counts merged back from it come keyed with None; without
+        # this, '' and None would be listed as two identical locations.
         for location in event_items:
-            locations[tuple(location)] += 1
+            locations[tuple(part or None for part in location)] += 1
 
+    @classmethod
+    def _build_aggregate(cls, locations):
+        total = sum(locations.itervalues())
         ret = []
         for location, count in locations.iteritems():
             country, region, city = location
             item = {
-                'frequency': float(count) / len(event_items),
+                'frequency': float(count) / total,
+                'count': count,
                 }
             if country:
                 item['country'] = country
@@ -66,6 +72,24 @@ class LocationAggregator(student_aggregate.AbstractStudentAggregationComponent):
             ret.append(item)
         return {'location_frequencies': ret}
 
+    @classmethod
+    def produce_aggregate(cls, course, student, static_params, event_items):
+        locations = collections.defaultdict(int)
+        cls._count_locations(locations, event_items)
+        return cls._build_aggregate(locations)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        locations = collections.defaultdict(int)
+        if aggregate:
+            for item in aggregate['location_frequencies']:
+                location = (
+                    item.get('country'), item.get('region'), item.get('city'))
+                locations[location] += item['count']
+        cls._count_locations(locations, event_items)
+        return cls._build_aggregate(locations)
+
     @classmethod
     def get_schema(cls):
         location_frequency = schema_fields.FieldRegistry('location_frequency')
@@ -91,6 +115,10 @@ class LocationAggregator(student_aggregate.AbstractStudentAggregationComponent):
             'location in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'location is listed first in the array.'))
+        location_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer',
+            description='The number of responses from this user that came '
+            'from the location.'))
         return schema_fields.FieldArray(
           'location_frequencies', 'Location Frequencies',
           item_type=location_frequency,
@@ -124,19 +152,35 @@ class LocaleAggregator(student_aggregate.AbstractStudentAggregationComponent):
         return locale
 
     @classmethod
-    def produce_aggregate(cls, course, student, static_params, event_items):
-        locales = collections.defaultdict(int)
-        for locale in event_items:
-            locales[locale] += 1
-
+    def _build_aggregate(cls, locales):
+        total = sum(locales.itervalues())
         ret = []
         for locale, count in locales.iteritems():
             ret.append({
                 'locale': locale,
-                'frequency': float(count) / len(event_items)
+                'frequency': float(count) / total,
+                'count': count,
                 })
         return {'locale_frequencies': ret}
 
+    @classmethod
+    def produce_aggregate(cls, course, student, static_params, event_items):
+        locales = collections.defaultdict(int)
+        for locale in event_items:
+            locales[locale] += 1
+        return cls._build_aggregate(locales)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        locales = collections.defaultdict(int)
+        if aggregate:
+            for item in aggregate['locale_frequencies']:
+                locales[item['locale']] += item['count']
+        for locale in event_items:
+            locales[locale] += 1
+        return cls._build_aggregate(locales)
+
     @classmethod
     def get_schema(cls):
         """Provide schema; override default schema generated from DB type."""
@@ -156,6 +200,10 @@ class LocaleAggregator(student_aggregate.AbstractStudentAggregationComponent):
             'locale in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'locale is listed first in the array.'))
+        locale_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer',
+            description='The number of responses from this user that were '
+            'in the locale.'))
         return schema_fields.FieldArray(
             'locale_frequencies', 'Language Frequencies',
             item_type=locale_frequency,
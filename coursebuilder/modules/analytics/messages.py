@@ -22,3 +22,10 @@ If checked, student events (e.g., page views and assessment answers) will be
 recorded. This enables analytics, but may increase App Engine quota usage.
 Analytics requires the use of the Google Cloud Storage default bucket.
 """
+
+ANALYTICS_INCREMENTAL_AGGREGATION_DESCRIPTION = """
+If checked, each run of the student aggregate job only processes events
+recorded since its last successful run, and updates only the students who
+have new events. All students are still reprocessed when the aggregated data
+changes shape.
+"""
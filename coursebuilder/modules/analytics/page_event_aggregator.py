@@ -266,6 +266,22 @@ class PageEventAggregator(
         page_views.sort(key=lambda v: v['start'])
         return {'page_views': page_views}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        # Recover the event items behind earlier page views, so that views
+        # still open at the last run can be closed by newer events.
+        if aggregate:
+            earlier_items = []
+            for view in aggregate['page_views']:
+                for activity in view['activities']:
+                    earlier_items.append([
+                        view['name'], view.get('item_id'),
+                        activity['timestamp'], activity['action']])
+            event_items = [earlier_items] + event_items
+        return cls.produce_aggregate(
+            course, student, static_params, event_items)
+
     @classmethod
     def get_schema(cls):
         activity = schema_fields.FieldRegistry('activity')
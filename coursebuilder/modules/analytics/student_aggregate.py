@@ -17,12 +17,17 @@
 __author__ = ['Michael Gainer (mgainer@google.com)']
 
 import collections
+import datetime
+import hashlib
 import logging
+import time
 import zlib
 
 from mapreduce import context
+from mapreduce import operation
 
 from common import schema_fields
+from common import schema_transforms
 from common import utils as common_utils
 from controllers import sites
 from models import courses
@@ -35,6 +40,16 @@ from models import transforms
 from google.appengine.api import datastore_types
 from google.appengine.ext import db
 
+# Name of the course setting that turns on incremental aggregation.
+INCREMENTAL_AGGREGATION_SETTING = 'incremental_student_aggregate'
+
+# Seconds subtracted from the start of a run to get the watermark it stores.
+# Events carry the clock of the instance that recorded them and may be
+# committed a little after that, so the next incremental run starts reading
+# this far back.
+WATERMARK_CLOCK_SKEW_SEC = 60
+
+
 class AbstractStudentAggregationComponent(object):
     """Allows modules to contribute to map/reduce on EventEntity by Student.
 
@@ -132,6 +147,35 @@ class AbstractStudentAggregationComponent(object):
         """
         raise NotImplementedError()
 
+    def merge_aggregate(self, course, student, static_params, aggregate,
+                        event_items):
+        """Fold new event-item outputs into an earlier aggregate.
+
+        When incremental aggregation is turned on for a course, the map phase
+        only sees events recorded since the last successful run, and this
+        function is called in place of produce_aggregate() for Students who
+        have new events.  Implementations must return the same value that
+        produce_aggregate() would have returned given all the event items
+        for the Student, old and new.
+
+        Optional; components that want events but do not override this
+        function cannot be updated incrementally, and their presence makes
+        every run a full rebuild.  Components wanting no events are never
+        merged; produce_aggregate() is called for them as usual.
+
+        Args:
+          course: The Course in which the student and the events are found.
+          student: the Student for which the events occurred.
+          static_params: the value from build_static_params(), if any.
+          aggregate: the dict this component produced for the Student on an
+              earlier run, or None if there was none.
+          event_items: a list of the items produced by process_event()
+              for events recorded since the earlier run.
+        Returns:
+          A dict corresponding to the declared schema.
+        """
+        raise NotImplementedError()
+
     def get_schema(self):
         """Provide the partial schema for results produced.
 
@@ -160,6 +204,60 @@ class StudentAggregateEntity(entities.BaseEntity):
         return db.Key.from_path(cls.kind(), transform_fn(db_key.id_or_name()))
 
 
+class StudentAggregateWatermarkEntity(entities.BaseEntity):
+    """Records how far student aggregation has progressed in a course.
+
+    There is at most one of these per course namespace.  The watermark is
+    the time at which the last successful StudentAggregateGenerator run
+    started, less WATERMARK_CLOCK_SKEW_SEC; all events recorded before it are
+    reflected in the stored StudentAggregateEntity rows.  The signature
+    identifies the components and schemas that produced those rows; it is
+    None if they may also reflect later events.  The watermark of a submitted
+    run is kept in started until that run completes; if it never does, the
+    next run cannot trust the stored aggregates and rebuilds them all.
+    """
+
+    KEY_NAME = 'watermark'
+
+    watermark = db.DateTimeProperty(indexed=False)
+    signature = db.StringProperty(indexed=False)
+    started = db.DateTimeProperty(indexed=False)
+
+    @classmethod
+    def get_or_create(cls):
+        return cls.get_or_insert(cls.KEY_NAME)
+
+    @classmethod
+    def mark_started(cls, watermark):
+        """Records the start of a submitted run; call in a transaction."""
+        state = cls.get_by_key_name(cls.KEY_NAME)
+        if not state:
+            state = cls(key_name=cls.KEY_NAME)
+        elif state.watermark == watermark:
+            # The run has already completed.
+            return
+        state.started = watermark
+        state.put()
+
+
+def _timestamp_to_datetime(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+class _ReduceState(object):
+    """Course-level objects shared by all reduce() calls of one job."""
+
+    def __init__(self, mapreduce_id, params):
+        self.mapreduce_id = mapreduce_id
+        ns = params['course_namespace']
+        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
+        self.course = courses.Course(None, app_context=app_context)
+        self.validators = {}
+        for component_name, schema in params['schemas'].iteritems():
+            self.validators[component_name] = (
+                schema_transforms.compile_json_schema_validator(schema))
+
+
 class StudentAggregateGenerator(jobs.MapReduceJob):
     """M/R job to aggregate data by student using registered plug-ins.
 
@@ -171,6 +269,9 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
 
     """
 
+    # Reused across the keys handled by reduce(); replaced for a new job.
+    _reduce_state = None
+
     @staticmethod
     def get_description():
         return 'student_aggregate'
@@ -179,13 +280,39 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
     def entity_class():
         return models.EventEntity
 
+    @staticmethod
+    def can_merge(component):
+        """Whether a component overrides merge_aggregate()."""
+        base = AbstractStudentAggregationComponent.merge_aggregate.im_func
+        return component.merge_aggregate.im_func is not base
+
+    @classmethod
+    def _can_run_incrementally(cls, app_context):
+        settings = app_context.get_environ().get('course', {})
+        if not settings.get(INCREMENTAL_AGGREGATION_SETTING):
+            return False
+        for component in StudentAggregateComponentRegistry.get_components():
+            if (component.get_event_sources_wanted() and
+                not cls.can_merge(component)):
+                return False
+        return True
+
     def build_additional_mapper_params(self, app_context):
         schemas = {}
         schema_names = {}
+        can_run_incrementally = self._can_run_incrementally(app_context)
+        now = int(time.time())
+        watermark = now - WATERMARK_CLOCK_SKEW_SEC
         ret = {
             'course_namespace': app_context.get_namespace_name(),
             'schemas': schemas,
             'schema_names': schema_names,
+            'watermark': watermark,
+            # Events from here on are left to the next run.  That is only
+            # sure to be incremental, and so to pick them up, if this run
+            # could have been.
+            'upper': watermark if can_run_incrementally else now,
+            'incremental': False,
             }
         for component in StudentAggregateComponentRegistry.get_components():
             component_name = component.get_name()
@@ -199,14 +326,44 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                 schema_name = schema.name
             schema_names[component_name] = schema_name
             schemas[component_name] = schema.get_json_schema_dict()
+        signature = hashlib.md5(
+            transforms.dumps(schemas, sort_keys=True)).hexdigest()
+        # A run that counts events past its watermark must not be continued
+        # incrementally; those events would be counted again.
+        ret['signature'] = signature if can_run_incrementally else None
+
+        # Guard against a stored watermark later than this run's, e.g. after
+        # the clock has been set back.
+        state = StudentAggregateWatermarkEntity.get_by_key_name(
+            StudentAggregateWatermarkEntity.KEY_NAME)
+        upper = _timestamp_to_datetime(watermark)
+        if (state and state.watermark and not state.started and
+            state.watermark <= upper and state.signature == signature and
+            can_run_incrementally):
+            ret['incremental'] = True
+            ret['filters'] = [
+                ('recorded_on', '>=', state.watermark),
+                ('recorded_on', '<', upper)]
         return ret
 
+    def submit(self):
+        sequence_num = super(StudentAggregateGenerator, self).submit()
+        if sequence_num != -1:
+            with common_utils.Namespace(self._namespace):
+                db.run_in_transaction(
+                    StudentAggregateWatermarkEntity.mark_started,
+                    _timestamp_to_datetime(self.mapper_params['watermark']))
+        return sequence_num
+
     @staticmethod
     def map(event):
+        params = context.get().mapreduce_spec.mapper.params
+        if event.recorded_on >= _timestamp_to_datetime(params['upper']):
+            # Recorded after this run started; leave it for the next run.
+            return
         for component in (StudentAggregateComponentRegistry.
                           get_components_for_event_source(event.source)):
             component_name = component.get_name()
-            params = context.get().mapreduce_spec.mapper.params
             static_data = params.get(component_name)
             value = None
             try:
@@ -221,6 +378,15 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                 value_str = '%s:%s' % (component_name, transforms.dumps(value))
                 yield event.user_id, value_str
 
+    @classmethod
+    def _get_reduce_state(cls):
+        spec = context.get().mapreduce_spec
+        state = cls._reduce_state
+        if not state or state.mapreduce_id != spec.mapreduce_id:
+            state = _ReduceState(spec.mapreduce_id, spec.mapper.params)
+            cls._reduce_state = state
+        return state
+
     @staticmethod
     def reduce(user_id, values):
 
@@ -238,9 +404,8 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
             return
 
         params = context.get().mapreduce_spec.mapper.params
-        ns = params['course_namespace']
-        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
-        course = courses.Course(None, app_context=app_context)
+        state = StudentAggregateGenerator._get_reduce_state()
+        course = state.course
 
         # Bundle items together into lists by collection name
         event_items = collections.defaultdict(list)
@@ -248,6 +413,15 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
             component_name, payload = value.split(':', 1)
             event_items[component_name].append(transforms.loads(payload))
 
+        # When running incrementally, new items are merged into the aggregate
+        # stored by earlier runs.
+        previous = None
+        if params['incremental']:
+            previous = {}
+            entity = StudentAggregateEntity.get_by_key_name(user_id)
+            if entity:
+                previous = transforms.loads(zlib.decompress(entity.data))
+
         # Build up per-Student aggregate by calling each component.  Note that
         # we call each component whether or not its mapper produced any
         # output.
@@ -255,11 +429,23 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
         for component in StudentAggregateComponentRegistry.get_components():
             component_name = component.get_name()
             static_value = params.get(component_name)
+            schema_name = params['schema_names'][component_name]
             value = {}
             try:
-                value = component.produce_aggregate(
-                    course, student, static_value,
-                    event_items.get(component_name, []))
+                if (previous is not None and
+                    component.get_event_sources_wanted()):
+                    if schema_name in previous:
+                        component_aggregate = {
+                            schema_name: previous[schema_name]}
+                    else:
+                        component_aggregate = None
+                    value = component.merge_aggregate(
+                        course, student, static_value, component_aggregate,
+                        event_items.get(component_name, []))
+                else:
+                    value = component.produce_aggregate(
+                        course, student, static_value,
+                        event_items.get(component_name, []))
                 if not value:
                     continue
             # pylint: disable=broad-except
@@ -270,7 +456,6 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                                  component_name, str(ex))
                 continue
 
-            schema_name = params['schema_names'][component_name]
             if schema_name not in value:
                 logging.critical(
                     'Student aggregation reduce handler %s produced '
@@ -279,8 +464,7 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                     component_name, schema_name)
                 continue
 
-            variances = transforms.validate_object_matches_json_schema(
-                value[schema_name], params['schemas'][component_name])
+            variances = state.validators[component_name](value[schema_name])
             if variances:
                 logging.critical(
                     'Student aggregation reduce handler %s produced '
@@ -306,7 +490,20 @@ class StudentAggregateGenerator(jobs.MapReduceJob):
                 'Aggregated compressed student data is over %d bytes; '
                 'cannot store this in one field; ignoring this record!')
         else:
-            StudentAggregateEntity(key_name=user_id, data=data).put()
+            # Puts are batched by the mapreduce mutation pool.
+            yield operation.db.Put(
+                StudentAggregateEntity(key_name=user_id, data=data))
+
+    @staticmethod
+    def complete(kwargs, results):
+        """Record that events up to this run's start have been aggregated."""
+        params = kwargs['mapper_params']
+        with common_utils.Namespace(params['course_namespace']):
+            state = StudentAggregateWatermarkEntity.get_or_create()
+            state.watermark = _timestamp_to_datetime(params['watermark'])
+            state.signature = params['signature']
+            state.started = None
+            state.put()
 
 
 class StudentAggregateComponentRegistry(
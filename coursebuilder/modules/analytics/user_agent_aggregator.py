@@ -44,19 +44,35 @@ class UserAgentAggregator(
         return content.get('user_agent')
 
     @classmethod
-    def produce_aggregate(cls, course, student, static_params, event_items):
-        user_agents = collections.defaultdict(int)
-        for user_agent in event_items:
-            user_agents[user_agent] += 1
-
+    def _build_aggregate(cls, user_agents):
+        total = sum(user_agents.itervalues())
         ret = []
         for user_agent, count in user_agents.iteritems():
             ret.append({
                 'user_agent': user_agent,
-                'frequency': float(count) / len(event_items),
+                'frequency': float(count) / total,
+                'count': count,
                 })
         return {'user_agent_frequencies': ret}
 
+    @classmethod
+    def produce_aggregate(cls, course, student, static_params, event_items):
+        user_agents = collections.defaultdict(int)
+        for user_agent in event_items:
+            user_agents[user_agent] += 1
+        return cls._build_aggregate(user_agents)
+
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        user_agents = collections.defaultdict(int)
+        if aggregate:
+            for item in aggregate['user_agent_frequencies']:
+                user_agents[item['user_agent']] += item['count']
+        for user_agent in event_items:
+            user_agents[user_agent] += 1
+        return cls._build_aggregate(user_agents)
+
     @classmethod
     def get_schema(cls):
         user_agent_frequency = schema_fields.FieldRegistry(
@@ -71,6 +87,10 @@ class UserAgentAggregator(
             'user_agent in responses from this user.  The sum of all the '
             'frequency values should add up to 1.0.  The most-frequent '
             'user_agent is listed first in the array.'))
+        user_agent_frequency.add_property(schema_fields.SchemaField(
+            'count', 'Count', 'integer',
+            description='The number of responses from this user that came '
+            'from the user_agent.'))
         return schema_fields.FieldArray(
           'user_agent_frequencies', 'User Agent Frequencies',
           item_type=user_agent_frequency,
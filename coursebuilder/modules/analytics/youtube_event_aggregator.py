@@ -33,6 +33,8 @@ ACTION_ID_TO_NAME = {
     3: 'buffering',
     5: 'video cued'
 }
+ACTION_NAME_TO_ID = dict(
+    (name, action_id) for action_id, name in ACTION_ID_TO_NAME.iteritems())
 
 
 class YouTubeEventAggregator(
@@ -97,6 +99,22 @@ class YouTubeEventAggregator(
 
         return {'youtube': youtube_interactions}
 
+    @classmethod
+    def merge_aggregate(cls, course, student, static_params, aggregate,
+                        event_items):
+        if aggregate:
+            earlier_items = []
+            for interaction in aggregate['youtube']:
+                for event in interaction['events']:
+                    action = ACTION_NAME_TO_ID.get(
+                        event['action'], event['action'])
+                    earlier_items.append([
+                        interaction['video_id'], event['position'], action,
+                        event['timestamp']])
+            event_items = earlier_items + event_items
+        return cls.produce_aggregate(
+            course, student, static_params, event_items)
+
     @classmethod
     def get_schema(cls):
         youtube_event = schema_fields.FieldRegistry('event')
@@ -35,6 +35,7 @@ __author__ = [
     'John Orr (jorr@google.com)']
 
 
+import hashlib
 import os
 import StringIO
 
@@ -50,12 +51,14 @@ from common import tags
 from controllers import sites
 from controllers import utils
 from models import analytics
+from models import counters
 from models import courses
 from models import custom_modules
 from models import data_sources
 from models import jobs
 from models import models
 from models import services
+from models import transforms
 from modules.analytics import student_aggregate
 from modules.certificate import custom_criteria
 from modules.certificate import messages
@@ -67,6 +70,14 @@ MODULE_TITLE = 'Certificates'
 CERTIFICATE_HANDLER_PATH = 'certificate'
 CERTIFICATE_PDF_HANDLER_PATH = 'certificate.pdf'
 RESOURCES_PATH = '/modules/certificate/resources'
+QUALIFIED_MEMCACHE_KEY_PREFIX = 'certificate-qualified:'
+
+CERTIFICATE_QUALIFIED_CACHE_HIT = counters.PerfCounter(
+    'gcb-certificate-qualified-cache-hit',
+    'A number of times a cached qualified verdict was reused.')
+CERTIFICATE_QUALIFIED_CACHE_MISS = counters.PerfCounter(
+    'gcb-certificate-qualified-cache-miss',
+    'A number of times certificate criteria had to be evaluated.')
 
 
 class ShowCertificateHandler(utils.BaseHandler):
@@ -220,28 +231,134 @@ def _prepare_assessment_criterion(score_list, criterion):
     return _check_assessment_criterion
 
 
-def student_is_qualified(student, course, explanations=None):
+def _get_qualification_fingerprint(student, course, criteria):
+    """Hashes the criteria, scores and progress a verdict is based on.
+
+    Returns:
+        (fingerprint, progress) tuple; progress is the student's progress
+        entity, or None if there is none yet.
+    """
+    progress = models.StudentPropertyEntity.get(
+        student, course.get_progress_tracker().PROPERTY_KEY)
+    fingerprint = hashlib.md5(transforms.dumps(
+        [criteria, student.scores, progress.value if progress else None],
+        sort_keys=True)).hexdigest()
+    return fingerprint, progress
+
+
+def _can_cache_qualified_verdict(criteria):
+    """Whether a verdict depends only on what the fingerprint covers."""
+    # Custom criteria may read anything and fill in explanations, neither of
+    # which a cached verdict can reproduce.
+    return models.CAN_USE_MEMCACHE.value and not any(
+        criterion.get('custom_criteria') for criterion in criteria)
+
+
+def student_is_qualified(
+    student, course, explanations=None, graded_units=None):
     """Determines whether the student has met criteria for a certificate.
 
+    Unless there are custom criteria, a qualified verdict is remembered in
+    memcache together with a fingerprint of the criteria and of the student's
+    scores and progress; while these are unchanged the verdict is reused
+    without evaluating the criteria again. Negative verdicts are always
+    recomputed, so that explanations are filled in and newly met criteria are
+    noticed.
+
     Args:
         student: models.models.Student. The student entity to test.
         course: modesl.courses.Course. The course which the student is
             enrolled in.
         explanations: list. Holder for a list of explanatory strings. Typically
             this will hold explanation of which criteria remain to be be met.
+        graded_units: list. The result of course.get_graded_units(), if the
+            caller tests several students against the same course.
 
     Returns:
         True if the student is qualified, False otherwise.
     """
     environ = course.app_context.get_environ()
-    score_list = course.get_all_scores(student)
+    criteria = environ.get('certificate_criteria')
+    if not criteria:
+        return False
 
-    if not environ.get('certificate_criteria'):
+    if not _can_cache_qualified_verdict(criteria):
+        return _criteria_are_met(
+            criteria, student, course,
+            course.get_all_scores(student, graded_units=graded_units),
+            explanations)
+
+    memcache_key = QUALIFIED_MEMCACHE_KEY_PREFIX + student.user_id
+    namespace = course.app_context.get_namespace_name()
+    fingerprint, progress = _get_qualification_fingerprint(
+        student, course, criteria)
+    if fingerprint == models.MemcacheManager.get(
+            memcache_key, namespace=namespace):
+        CERTIFICATE_QUALIFIED_CACHE_HIT.inc()
+        return True
+    CERTIFICATE_QUALIFIED_CACHE_MISS.inc()
+
+    if progress is None:
+        # Same as what get_or_create_progress() would create, but unsaved.
+        progress = models.StudentPropertyEntity.create(
+            student, course.get_progress_tracker().PROPERTY_KEY)
+    if not _criteria_are_met(
+            criteria, student, course,
+            course.get_all_scores(
+                student, progress=progress, graded_units=graded_units),
+            explanations):
         return False
 
+    models.MemcacheManager.set(memcache_key, fingerprint, namespace=namespace)
+    return True
+
+
+def students_are_qualified(students, course, graded_units=None):
+    """Determines which of a batch of students have met certificate criteria.
+
+    This gives the same verdicts as student_is_qualified(), but the course's
+    graded units are looked up once for the batch and the students' progress
+    entities are fetched in a single datastore call.  Verdicts cached by
+    student_is_qualified() are neither used nor updated.
+
+    Args:
+        students: list of models.models.Student. The students to test; all
+            are enrolled in course.
+        course: models.courses.Course. The course to test against.
+        graded_units: list. The result of course.get_graded_units(), if the
+            caller tests several batches against the same course.
+
+    Returns:
+        A list holding True or False for each student, in order.
+    """
+    criteria = course.app_context.get_environ().get('certificate_criteria')
+    if not criteria:
+        return [False] * len(students)
+    if graded_units is None:
+        graded_units = course.get_graded_units()
+
+    property_name = course.get_progress_tracker().PROPERTY_KEY
+    progress_list = models.StudentPropertyEntity.get_by_key_name([
+        models.StudentPropertyEntity.create_key(student.user_id, property_name)
+        for student in students])
+
+    verdicts = []
+    for student, progress in zip(students, progress_list):
+        if progress is None:
+            # Same as what get_or_create_progress() would create, but unsaved.
+            progress = models.StudentPropertyEntity.create(
+                student, property_name)
+        score_list = course.get_all_scores(
+            student, progress=progress, graded_units=graded_units)
+        verdicts.append(
+            _criteria_are_met(criteria, student, course, score_list, None))
+    return verdicts
+
+
+def _criteria_are_met(criteria, student, course, score_list, explanations):
     criteria_functions = []
     # First validate the correctness of _all_ provided criteria
-    for criterion in environ['certificate_criteria']:
+    for criterion in criteria:
         assessment_id = criterion.get('assessment_id', '')
         custom = criterion.get('custom_criteria', '')
         assert (assessment_id is not '') or (custom is not ''), (
@@ -363,8 +480,46 @@ TOTAL_ACTIVE_STUDENTS = 'total_active_students'
 TOTAL_STUDENTS = 'total_students'
 
 
+class _QualifiedVerdictPool(object):
+    """Certificate verdicts for the students a mapper slice is about to see.
+
+    The mapreduce context flushes its registered pools at the end of each
+    slice, and flushing drops the verdicts, so none is kept across slices.
+    A flushed pool has no way to emit mapper output, so instead of holding
+    back students until a batch is full, a miss looks ahead: the student and
+    those following in key order, which the input reader hands to the mapper
+    next, are tested together by students_are_qualified().
+    """
+
+    NAME = 'certificate_qualified_verdicts'
+    BATCH_SIZE = 50
+
+    def __init__(self):
+        self._verdicts = {}
+
+    def is_qualified(self, student, course, graded_units):
+        key = str(student.key())
+        if key not in self._verdicts:
+            students = [student] + models.Student.all().filter(
+                '__key__ >', student.key()).order('__key__').fetch(
+                    self.BATCH_SIZE - 1)
+            self._verdicts = dict(zip(
+                [str(s.key()) for s in students],
+                students_are_qualified(
+                    students, course, graded_units=graded_units)))
+        return self._verdicts.pop(key)
+
+    def flush(self):
+        self._verdicts = {}
+
+
 class CertificatesEarnedGenerator(jobs.AbstractCountingMapReduceJob):
 
+    # Course and its graded units; built once per job in each process.
+    _course_mapreduce_id = None
+    _course = None
+    _graded_units = None
+
     @staticmethod
     def get_description():
         return 'certificates earned'
@@ -376,13 +531,33 @@ class CertificatesEarnedGenerator(jobs.AbstractCountingMapReduceJob):
     def entity_class():
         return models.Student
 
+    @classmethod
+    def _get_course_and_graded_units(cls):
+        mapreduce_spec = context.get().mapreduce_spec
+        if cls._course_mapreduce_id != mapreduce_spec.mapreduce_id:
+            ns = mapreduce_spec.mapper.params['course_namespace']
+            app_context = (
+                sites.get_course_index().get_app_context_for_namespace(ns))
+            cls._course = courses.Course(None, app_context=app_context)
+            cls._graded_units = cls._course.get_graded_units()
+            cls._course_mapreduce_id = mapreduce_spec.mapreduce_id
+        return cls._course, cls._graded_units
+
+    @staticmethod
+    def _get_verdict_pool():
+        ctx = context.get()
+        pool = ctx.get_pool(_QualifiedVerdictPool.NAME)
+        if pool is None:
+            pool = _QualifiedVerdictPool()
+            ctx.register_pool(_QualifiedVerdictPool.NAME, pool)
+        return pool
+
     @staticmethod
     def map(student):
-        params = context.get().mapreduce_spec.mapper.params
-        ns = params['course_namespace']
-        app_context = sites.get_course_index().get_app_context_for_namespace(ns)
-        course = courses.Course(None, app_context=app_context)
-        if student_is_qualified(student, course):
+        course, graded_units = (
+            CertificatesEarnedGenerator._get_course_and_graded_units())
+        pool = CertificatesEarnedGenerator._get_verdict_pool()
+        if pool.is_qualified(student, course, graded_units):
             yield(TOTAL_CERTIFICATES, 1)
         if student.scores:
             yield(TOTAL_ACTIVE_STUDENTS, 1)
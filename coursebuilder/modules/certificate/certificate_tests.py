@@ -16,8 +16,8 @@
 
 __author__ = 'John Orr (jorr@google.com)'
 
-
 from controllers import sites
+from models import config
 from models import courses
 from models import models
 from models import student_work
@@ -253,6 +253,102 @@ class CertificateCriteriaTestCase(actions.TestBase):
         self.assertEquals(200, response.status_code)
         self._run_analytic_and_expect(1, 1, 1)  # 1 student, 1 active, 1 cert
 
+    def test_students_are_qualified_in_batch(self):
+        assessment = self.course.add_assessment()
+        assessment.title = 'Assessment'
+        assessment.html_content = 'assessment content'
+        assessment.availability = courses.AVAILABILITY_AVAILABLE
+        self.course.save()
+        self.certificate_criteria.append(
+            {'assessment_id': assessment.unit_id, 'pass_percent': 70.0})
+
+        actions.submit_assessment(
+            self,
+            assessment.unit_id,
+            {'answers': '', 'score': 80.0,
+             'assessment_type': assessment.unit_id},
+            presubmit_checks=False
+        )
+        qualified = models.Student.get_by_user(self.TEST_USER)
+        no_progress = models.Student(
+            key_name='no_progress', user_id='no_progress', is_enrolled=True)
+        no_progress.put()
+
+        course = courses.Course(None, self.course.app_context)
+        students = [qualified, no_progress]
+        self.assertEquals(
+            [True, False], certificate.students_are_qualified(students, course))
+        self.assertEquals(
+            [certificate.student_is_qualified(student, course)
+             for student in students],
+            certificate.students_are_qualified(
+                students, course, graded_units=course.get_graded_units()))
+        self.assertEquals([], certificate.students_are_qualified([], course))
+
+    def test_analytic_fetches_progress_once_per_batch(self):
+        num_students = 200
+        assessment = self.course.add_assessment()
+        assessment.title = 'Assessment'
+        assessment.availability = courses.AVAILABILITY_AVAILABLE
+        self.course.save()
+        self.certificate_criteria.append(
+            {'assessment_id': assessment.unit_id, 'pass_percent': 70.0})
+        students = [
+            models.Student(
+                key_name='student%s' % i, user_id='student%s' % i,
+                is_enrolled=True,
+                scores='{"%s": %s}' % (assessment.unit_id, i % 100))
+            for i in xrange(num_students)]
+        db.put(students)
+        course = courses.Course(None, self.course.app_context)
+        tracker = course.get_progress_tracker()
+        for student in students:
+            tracker.put_assessment_completed(student, assessment.unit_id)
+
+        self.assertEquals(
+            [certificate.student_is_qualified(student, course)
+             for student in students],
+            certificate.students_are_qualified(students, course))
+
+        # Count progress fetches made while the analytic job runs.  The
+        # verdict cache must stay out of the job even with memcache on.
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.addCleanup(
+            config.Registry.test_overrides.pop, models.CAN_USE_MEMCACHE.name)
+        user_ids = set(student.user_id for student in students)
+        batch_sizes = []
+        single_fetches = []
+        get_by_key_name = models.StudentPropertyEntity.get_by_key_name
+        get_property = models.StudentPropertyEntity.get
+
+        def counting_get_by_key_name(key_names, *args, **kwargs):
+            if isinstance(key_names, list):
+                batch_sizes.append(len(key_names))
+            return get_by_key_name(key_names, *args, **kwargs)
+
+        def counting_get(student, property_name):
+            if student.user_id in user_ids:
+                single_fetches.append(property_name)
+            return get_property(student, property_name)
+
+        self.swap(models.StudentPropertyEntity, 'get_by_key_name',
+                  staticmethod(counting_get_by_key_name))
+        self.swap(
+            models.StudentPropertyEntity, 'get', staticmethod(counting_get))
+        cache_misses = certificate.CERTIFICATE_QUALIFIED_CACHE_MISS.value
+        # The fixture plus the student registered in setUp().
+        self._run_analytic_and_expect(
+            num_students + 1, num_students, num_students * 30 / 100)
+
+        batch_size = certificate._QualifiedVerdictPool.BATCH_SIZE
+        self.assertEquals(
+            cache_misses, certificate.CERTIFICATE_QUALIFIED_CACHE_MISS.value)
+        self.assertEquals([], single_fetches)
+        self.assertTrue(batch_sizes)
+        self.assertEquals(batch_size, max(batch_sizes))
+        self.assertLessEqual(
+            len(batch_sizes), 2 * (num_students + 1) / batch_size + 1)
+
     def _submit_review(self, assessment):
         """Submits a review by the current student.
 
@@ -342,6 +438,63 @@ class CertificateCriteriaTestCase(actions.TestBase):
         response = self.get('certificate')
         self.assertEquals(200, response.status_code)
 
+    def test_qualified_verdict_is_cached_until_scores_change(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.addCleanup(
+            config.Registry.test_overrides.pop, models.CAN_USE_MEMCACHE.name)
+        assessment = self.course.add_assessment()
+        assessment.title = 'Assessment'
+        assessment.html_content = 'assessment content'
+        assessment.availability = courses.AVAILABILITY_AVAILABLE
+        self.course.save()
+        self.certificate_criteria.append(
+            {'assessment_id': assessment.unit_id, 'pass_percent': 70.0})
+
+        def submit(score):
+            actions.submit_assessment(
+                self, assessment.unit_id,
+                {'answers': '', 'score': score,
+                 'assessment_type': assessment.unit_id},
+                presubmit_checks=False)
+
+        submit(80)
+        response = self.get('certificate')
+        self.assertEquals(200, response.status_code)
+
+        hits = certificate.CERTIFICATE_QUALIFIED_CACHE_HIT.value
+        misses = certificate.CERTIFICATE_QUALIFIED_CACHE_MISS.value
+        response = self.get('certificate')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(
+            hits + 1, certificate.CERTIFICATE_QUALIFIED_CACHE_HIT.value)
+
+        submit(50)
+        response = self.get('certificate')
+        self._assert_redirect_to_course_landing_page(response)
+        self.assertEquals(
+            hits + 1, certificate.CERTIFICATE_QUALIFIED_CACHE_HIT.value)
+        self.assertEquals(
+            misses + 1, certificate.CERTIFICATE_QUALIFIED_CACHE_MISS.value)
+
+    def test_custom_criteria_verdict_is_not_cached(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.addCleanup(
+            config.Registry.test_overrides.pop, models.CAN_USE_MEMCACHE.name)
+        calls = []
+
+        def test_custom_criterion(student, unused_course, explanations=None):
+            calls.append(student.scores)
+            return True
+        self._register_custom_criterion(test_custom_criterion)
+
+        hits = certificate.CERTIFICATE_QUALIFIED_CACHE_HIT.value
+        for _ in xrange(2):
+            response = self.get('certificate')
+            self.assertEquals(200, response.status_code)
+        self.assertEquals(2, len(calls))
+        self.assertEquals(
+            hits, certificate.CERTIFICATE_QUALIFIED_CACHE_HIT.value)
+
     def test_custom_criteria_with_explanation(self):
         def test_custom_criterion(
                 unused_student, unused_course, explanations=None):
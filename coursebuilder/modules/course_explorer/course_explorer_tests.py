@@ -110,6 +110,7 @@ class CourseExplorerTest(BaseExplorerTest):
         info = {'final_grade': 'A'}
         course_info_dict = {'': info}
         profile.course_info = transforms.dumps(course_info_dict)
+        profile.completed_courses = ['']
         profile.put()
 
         # Check if 'View score' text is visible on profile page.
@@ -124,6 +125,40 @@ class CourseExplorerTest(BaseExplorerTest):
         response = self.get('/explorer')
         actions.assert_contains('View score', response.body)
 
+    def test_enrollment_is_written_to_index_and_legacy_json(self):
+        user = actions.login('index_student@example.com')
+        actions.register(self, 'Index Student')
+
+        profile = PersonalProfile.get_by_key_name(user.user_id())
+        self.assertEqual([''], profile.enrolled_courses)
+        self.assertEqual(
+            {'': True}, transforms.loads(profile.enrollment_info))
+
+    def test_enrollment_is_written_only_to_index_without_legacy_writes(self):
+        config.Registry.test_overrides[
+            models.CAN_WRITE_LEGACY_ENROLLMENT_INFO.name] = False
+        user = actions.login('index_only_student@example.com')
+        actions.register(self, 'Index Only Student')
+
+        profile = PersonalProfile.get_by_key_name(user.user_id())
+        self.assertEqual([''], profile.enrolled_courses)
+        self.assertIsNone(profile.enrollment_info)
+        response = self.get('/explorer/courses')
+        actions.assert_contains('Power Searching with Google', response.body)
+
+    def test_profile_without_enrollment_index_is_read_from_legacy_json(self):
+        user = actions.login('legacy_student@example.com')
+        actions.register(self, 'Legacy Student')
+
+        # Make the profile look like one saved before the index existed.
+        profile = PersonalProfile.get_by_key_name(user.user_id())
+        profile.enrolled_courses = []
+        profile.enrollment_index_version = None
+        profile.put()
+
+        response = self.get('/explorer/courses')
+        actions.assert_contains('Power Searching with Google', response.body)
+
     def test_multiple_course(self):
         """Tests when multiple courses are available."""
         sites.setup_courses('course:/test::ns_test, course:/:/')
@@ -174,6 +209,27 @@ class CourseExplorerTest(BaseExplorerTest):
         # No registration button present
         self.assertIsNone(item.find('.//a[@href="/register"]'))
 
+    def test_catalog_reloads_course_when_settings_change(self):
+        admin_email = 'admin@example.com'
+        actions.simple_add_course('catalog', admin_email, 'Catalog Title One')
+        actions.login('student@example.com')
+
+        response = self.get('/explorer')
+        self.assertIn('Catalog Title One', response.body)
+
+        # Unchanged courses are served from the catalog.
+        hits = student.CATALOG_HIT.value
+        response = self.get('/explorer')
+        self.assertIn('Catalog Title One', response.body)
+        self.assertGreater(student.CATALOG_HIT.value, hits)
+
+        # Saving course.yaml reloads only that course.
+        actions.update_course_config_as_admin(
+            'catalog', admin_email, {'course': {'title': 'Catalog Title Two'}})
+        response = self.get('/explorer')
+        self.assertIn('Catalog Title Two', response.body)
+        self.assertNotIn('Catalog Title One', response.body)
+
 
 class CourseExplorerDisabledTest(actions.TestBase):
     """Tests when course explorer is disabled."""
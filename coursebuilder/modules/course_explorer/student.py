@@ -18,11 +18,13 @@ __author__ = 'Rahul Singal (rahulsingal@google.com)'
 
 import mimetypes
 import os
+import time
 
 import course_explorer
 import webapp2
 
 import appengine_config
+from common import caching
 from common import jinja_utils
 from common import users
 from controllers import sites
@@ -30,7 +32,7 @@ from controllers import utils
 from models import courses as models_courses
 from models import models
 from models import roles
-from models import transforms
+from models.counters import PerfCounter
 
 # We want to use views file in both /views and /modules/course_explorer/views.
 TEMPLATE_DIRS = [
@@ -44,6 +46,99 @@ STUDENT_RENAME_GLOBAL_XSRF_TOKEN_ID = 'rename-student-global'
 # Int. Maximum number of bytes App Engine's db.StringProperty can store.
 _STRING_PROPERTY_MAX_BYTES = 500
 
+# Int. Seconds a catalog entry is trusted even if course.yaml is unchanged;
+# bounds staleness of settings that do not live in course.yaml (translations).
+CATALOG_ENTRY_TTL_SEC = 60
+
+CATALOG_HIT = PerfCounter(
+    'gcb-course-explorer-CourseCatalog-hit',
+    'A number of times course settings were found in the explorer catalog.')
+CATALOG_MISS = PerfCounter(
+    'gcb-course-explorer-CourseCatalog-miss',
+    'A number of times course settings were (re)loaded into the catalog.')
+
+
+class CourseCatalogEntry(object):
+    """Settings of a single course as needed to list it in the explorer.
+
+    The environ held here is shared by all requests and must not be modified;
+    per-user views are built by get_environ_for_current_user().
+    """
+
+    def __init__(self, app_context, stamp, environ):
+        self.app_context = app_context
+        self.stamp = stamp
+        self.created_on = time.time()
+        self.environ = environ
+
+    def get_environ_for_current_user(self):
+        """Returns environ with per-user overrides (e.g., student groups)."""
+        if not models_courses.Course.COURSE_ENV_POST_COPY_HOOKS:
+            return self.environ
+
+        # Only the sections the explorer reads are copied for the hooks.
+        # pylint: disable=protected-access
+        overrides = models_courses.Course._run_env_post_copy_hooks(
+            self.app_context, {
+                'course': self.environ['course'],
+                'reg_form': self.environ['reg_form']})
+        environ = dict(self.environ)
+        environ.update(overrides)
+        return environ
+
+    @classmethod
+    def is_public(cls, environ, user):
+        """Checks if a user may see the course; super admins are not checked."""
+        if roles.Roles.is_listed_course_admin(user, environ['course']):
+            return True
+        return bool(
+            environ['course'].get('now_available', False) and
+            roles.Roles.is_whitelisted(
+                user,
+                models_courses.Course.get_whitelist_from_environ(environ)))
+
+
+class ProcessScopedCourseCatalog(caching.ProcessScopedSingleton):
+    """Holds in-process catalog of settings of all courses.
+
+    An entry is reloaded when its course.yaml is written, the current locale of
+    its course changes, or it is older than CATALOG_ENTRY_TTL_SEC. Unchanged
+    courses cost a lookup of VFS metadata, which is normally in-process cached.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    @classmethod
+    def _get_stamp(cls, app_context):
+        return (
+            app_context.get_current_locale(),
+            app_context.fs.get_updated_on(app_context.get_config_filename()))
+
+    def get_entries(self, app_contexts):
+        """Returns catalog entries for app_contexts, reloading stale ones."""
+        now = time.time()
+        entries = {}
+        for app_context in app_contexts:
+            stamp = self._get_stamp(app_context)
+            entry = self._entries.get(app_context)
+            if (entry and entry.stamp == stamp and
+                now - entry.created_on < CATALOG_ENTRY_TTL_SEC):
+                CATALOG_HIT.inc()
+            else:
+                CATALOG_MISS.inc()
+                # The catalog is shared by all users; per-user hooks run on
+                # retrieval.
+                environ = (
+                    models_courses.Course.get_environ_without_post_copy_hooks(
+                        app_context))
+                entry = CourseCatalogEntry(app_context, stamp, environ)
+            entries[app_context] = entry
+
+        # Replacing the dict drops entries of courses no longer configured.
+        self._entries = entries
+        return [entries[app_context] for app_context in app_contexts]
+
 
 class IndexPageHandler(webapp2.RequestHandler, utils.QueryableRouteMixin):
     """Handles routing of root URL '/'."""
@@ -74,8 +169,8 @@ class BaseStudentHandler(webapp2.RequestHandler):
     def initialize_student_state(self):
         """Initialize course information related to student."""
         utils.PageInitializerService.get().initialize(self.template_values)
-        self.enrolled_courses_dict = {}
-        self.courses_progress_dict = {}
+        self.profile = None
+        self.course_environs = {}
         user = users.get_current_user()
         if not user:
             return
@@ -88,40 +183,49 @@ class BaseStudentHandler(webapp2.RequestHandler):
         self.template_values['register_xsrf_token'] = (
             utils.XsrfTokenManager.create_xsrf_token('register-post'))
 
-        self.enrolled_courses_dict = transforms.loads(profile.enrollment_info)
-        if self.enrolled_courses_dict:
+        self.profile = profile
+        if profile.enrolled_courses:
             self.template_values['has_enrolled_courses'] = True
 
-        if profile.course_info:
-            self.courses_progress_dict = transforms.loads(profile.course_info)
-
     def get_public_courses(self):
         """Get all the public courses."""
+        user = users.get_current_user()
+        is_super_admin = roles.Roles.is_super_admin()
+
         public_courses = []
-        for course in sites.get_all_courses():
-            if ((course.now_available and roles.Roles.is_user_whitelisted(
-                    course)) or roles.Roles.is_course_admin(course)):
-                public_courses.append(course)
+        for entry in ProcessScopedCourseCatalog.instance().get_entries(
+                sites.get_all_courses()):
+            environ = entry.get_environ_for_current_user()
+            if is_super_admin or entry.is_public(environ, user):
+                self.course_environs[entry.app_context] = environ
+                public_courses.append(entry.app_context)
         return public_courses
 
+    def get_environ(self, course):
+        """Returns course settings as seen by the current user."""
+        environ = self.course_environs.get(course)
+        if environ is None:
+            environ = sites.ApplicationContext.get_environ(course)
+        return environ
+
     def is_enrolled(self, course):
         """Returns true if student is enrolled else false."""
-        return bool(
-            self.enrolled_courses_dict.get(course.get_namespace_name()))
+        return bool(self.profile and self.profile.is_enrolled(
+            course.get_namespace_name()))
 
     def is_completed(self, course):
         """Returns true if student has completed course else false."""
-        info = self.courses_progress_dict.get(course.get_namespace_name())
-        if info and 'final_grade' in info:
-            return True
-        return False
+        return bool(self.profile and self.profile.is_completed(
+            course.get_namespace_name()))
 
     def can_register(self, course):
-        return course.get_environ()['reg_form']['can_register']
+        return self.get_environ(course)['reg_form']['can_register']
 
     def get_course_info(self, course):
         """Returns course info required in views."""
-        info = sites.ApplicationContext.get_environ(course)
+        # Environ may be shared via the catalog; copy what is modified here.
+        info = dict(self.get_environ(course))
+        info['course'] = dict(info['course'])
         slug = course.get_slug()
         course_preview_url = slug
         if slug == '/':
@@ -198,8 +302,7 @@ class ProfileHandler(BaseStudentHandler):
             return
 
         courses = self.get_public_courses()
-        self.template_values['student'] = (
-            models.StudentProfileDAO.get_profile_by_user_id(user.user_id()))
+        self.template_values['student'] = self.profile
         self.template_values['navbar'] = {'profile': True}
         self.template_values['courses'] = self.get_enrolled_courses(courses)
         self.template_values['student_edit_xsrf_token'] = (
@@ -125,7 +125,9 @@ class CourseHandler(utils.BaseHandler):
     @classmethod
     def get_child_routes(cls):
         """Add child handlers for REST."""
-        return [('/rest/events', EventsRESTHandler)]
+        return [
+            ('/rest/events', EventsRESTHandler),
+            ('/rest/events/batch', EventsBatchRESTHandler)]
 
     def get_user_student_profile(self):
         user = self.personalize_page_and_get_user()
@@ -945,8 +947,7 @@ class EventsRESTHandler(utils.BaseRESTHandler):
         self.error(404)
         return
 
-    def _add_request_facts(self, payload_json):
-        payload_dict = transforms.loads(payload_json)
+    def _add_request_facts(self, payload_dict):
         if 'loc' not in payload_dict:
             payload_dict['loc'] = {}
         loc = payload_dict['loc']
@@ -963,9 +964,31 @@ class EventsRESTHandler(utils.BaseRESTHandler):
         user_agent = self.request.headers.get('User-Agent')
         if user_agent:
             payload_dict['user_agent'] = user_agent
-        payload_json = transforms.dumps(payload_dict).lstrip(
-            models.transforms.JSON_XSSI_PREFIX)
-        return payload_json
+        return payload_dict
+
+    def _get_user_for_request(self, request):
+        """Checks the XSRF token in the request; returns the current user."""
+        if not self.assert_xsrf_token_or_fail(request, 'event-post', {}):
+            return None
+        return self.get_user()
+
+    def _record_and_process_events(self, user, events):
+        """Records events and applies their progress updates.
+
+        Args:
+          user: the user who triggered the events.
+          events: a list of (source, payload_dict) tuples.
+        """
+        models.EventEntity.record_multi(user, events)
+        COURSE_EVENTS_RECORDED.inc(increment=len(events))
+
+        student = models.Student.get_enrolled_student_by_user(user)
+        if not student:
+            return
+        tracker = self.get_course().get_progress_tracker()
+        with tracker.batch_updates(student):
+            for source, payload in events:
+                self.process_event(student, source, payload)
 
     def post(self):
         """Receives event and puts it into datastore."""
@@ -975,30 +998,18 @@ class EventsRESTHandler(utils.BaseRESTHandler):
             return
 
         request = transforms.loads(self.request.get('request'))
-        if not self.assert_xsrf_token_or_fail(request, 'event-post', {}):
-            return
-
-        user = self.get_user()
+        user = self._get_user_for_request(request)
         if not user:
             return
 
         source = request.get('source')
-        payload_json = request.get('payload')
-        payload_json = self._add_request_facts(payload_json)
-        models.EventEntity.record(source, user, payload_json)
-        COURSE_EVENTS_RECORDED.inc()
-
-        self.process_event(user, source, payload_json)
+        payload = self._add_request_facts(
+            transforms.loads(request.get('payload')))
+        self._record_and_process_events(user, [(source, payload)])
 
-    def process_event(self, user, source, payload_json):
+    def process_event(self, student, source, payload):
         """Processes an event after it has been recorded in the event stream."""
 
-        student = models.Student.get_enrolled_student_by_user(user)
-        if not student:
-            return
-
-        payload = transforms.loads(payload_json)
-
         if 'location' not in payload:
             return
 
@@ -1033,6 +1044,42 @@ class EventsRESTHandler(utils.BaseRESTHandler):
                     student, unit_id, lesson_id)
 
 
+class EventsBatchRESTHandler(EventsRESTHandler):
+    """Receives several events in a single POST.
+
+    The request is a JSON object with an 'xsrf_token' and an 'events' list;
+    each item of the list has the same 'source' and 'payload' fields as a
+    request to EventsRESTHandler.  All events are recorded with one datastore
+    put, and all resulting progress changes are saved with one progress write.
+    """
+
+    MAX_EVENTS_PER_REQUEST = 100
+
+    def post(self):
+        """Receives a list of events and puts them into datastore."""
+
+        request = transforms.loads(self.request.get('request'))
+        items = request.get('events') or []
+        COURSE_EVENTS_RECEIVED.inc(increment=len(items))
+        if not self.can_record_student_events():
+            return
+        if len(items) > self.MAX_EVENTS_PER_REQUEST:
+            transforms.send_json_response(
+                self, 400, 'Too many events in one request.')
+            return
+
+        user = self._get_user_for_request(request)
+        if not user:
+            return
+
+        events = []
+        for item in items:
+            payload = self._add_request_facts(
+                transforms.loads(item.get('payload')))
+            events.append((item.get('source'), payload))
+        self._record_and_process_events(user, events)
+
+
 def on_module_enabled(unused_custom_module):
     # Conform with convention for sub-packages within modules/courses; this
     # file doesn't have any module-registration-time work to do.
@@ -16,6 +16,7 @@
 
 __author__ = 'Mike gainer (mgainer@google.com)'
 
+import datetime
 import logging
 import os
 
@@ -30,6 +31,7 @@ from common import users
 from controllers import sites
 from controllers import utils
 from mapreduce import context
+from mapreduce import operation
 from models import courses
 from models import custom_modules
 from models import data_removal as models_data_removal
@@ -561,6 +563,14 @@ class DataRemovalCronHandler(utils.AbstractAllCoursesCronHandler):
                 continue
             job = DataRemovalJob(app_context, entity_classes[name], user_ids)
             if job.is_active():
+                # Restarting a scan that is under way would throw away the
+                # part of the table it has done.  Let it finish; users that
+                # became pending since it started all share the next scan.
+                if not job.is_stale():
+                    logging.info(
+                        'Data removal cron handler: removal for %s already '
+                        'running', name)
+                    continue
                 job.cancel()
             job.submit()
 
@@ -568,6 +578,14 @@ class DataRemovalCronHandler(utils.AbstractAllCoursesCronHandler):
 class DataRemovalJob(jobs.AbstractCountingMapReduceJob):
     """Map/reduce job against a single un-indexed table to delete user data."""
 
+    # A removal job not heard from in this long is assumed to have died, and
+    # is canceled and restarted by the cron handler.
+    STALE_JOB_SECS = 24 * 60 * 60
+
+    # User IDs to remove, as a set; built once per job in each process.
+    _user_ids_mapreduce_id = None
+    _user_ids_to_remove = None
+
     def __init__(self, app_context, entity_class, user_ids):
         super(DataRemovalJob, self).__init__(app_context)
         self._entity_class = entity_class
@@ -589,14 +607,27 @@ class DataRemovalJob(jobs.AbstractCountingMapReduceJob):
             'entity_class_name': self._entity_class_name,
         }
 
+    def is_stale(self, now_fn=datetime.datetime.utcnow):
+        job = self.load()
+        return bool(job and job.updated_on and (
+            now_fn() - job.updated_on).total_seconds() > self.STALE_JOB_SECS)
+
+    @classmethod
+    def _get_user_ids_to_remove(cls):
+        mapreduce_spec = context.get().mapreduce_spec
+        if cls._user_ids_mapreduce_id != mapreduce_spec.mapreduce_id:
+            cls._user_ids_to_remove = frozenset(
+                mapreduce_spec.mapper.params['user_ids'])
+            cls._user_ids_mapreduce_id = mapreduce_spec.mapreduce_id
+        return cls._user_ids_to_remove
+
     @staticmethod
     def map(item):
-        mapper_params = context.get().mapreduce_spec.mapper.params
-        user_ids_to_remove = set(mapper_params['user_ids'])
-        item_user_ids = set(item.get_user_ids())
-        matching = item_user_ids.intersection(user_ids_to_remove)
+        user_ids_to_remove = DataRemovalJob._get_user_ids_to_remove()
+        matching = user_ids_to_remove.intersection(item.get_user_ids())
         if matching:
-            item.delete()
+            # Batched with other deletes in the shard's mutation pool.
+            yield operation.db.Delete(item)
             for user_id in matching:
                 yield user_id, 1
 
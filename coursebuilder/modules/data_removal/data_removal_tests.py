@@ -18,6 +18,7 @@ __author__ = 'Mike Gainer (mgainer@google.com)'
 
 from common import utils as common_utils
 from common import users
+from controllers import sites
 from models import data_removal as models_data_removal
 from models import models
 from models import student_work
@@ -324,6 +325,50 @@ class DataRemovalTests(DataRemovalTestBase):
             self.assertEquals(1, len(entities))
             self.assertEquals(student2_id, entities[0].user_id)
 
+    def test_users_pending_during_removal_job_share_next_job(self):
+        user = actions.login(self.STUDENT_EMAIL)
+        actions.register(self, user.email(), course=self.COURSE)
+        other_user = actions.login('student002@foo.com')
+        actions.register(self, other_user.email(), course=self.COURSE)
+        with common_utils.Namespace(self.NAMESPACE):
+            student1_id = models.Student.get_by_user(user).user_id
+            student2_id = models.Student.get_by_user(other_user).user_id
+            models.EventEntity(user_id=student1_id, source='test').put()
+            models.EventEntity(user_id=student2_id, source='test').put()
+        job = data_removal.DataRemovalJob(
+            sites.get_app_context_for_namespace(self.NAMESPACE),
+            models.EventEntity, [])
+
+        # First user's removal starts a job for the event table.
+        actions.login(self.STUDENT_EMAIL)
+        self._unregister_and_request_data_removal(self.COURSE)
+        self.execute_all_deferred_tasks(
+            models.StudentLifecycleObserver.QUEUE_NAME)
+        self.get(data_removal.DataRemovalCronHandler.URL,
+                 headers={'X-AppEngine-Cron': 'True'})
+        sequence_num = job.load().sequence_num
+
+        # Second user's removal does not restart the job in progress.
+        actions.login('student002@foo.com')
+        self._unregister_and_request_data_removal(self.COURSE)
+        self.execute_all_deferred_tasks(
+            models.StudentLifecycleObserver.QUEUE_NAME)
+        self.get(data_removal.DataRemovalCronHandler.URL,
+                 headers={'X-AppEngine-Cron': 'True'})
+        self.assertEquals(sequence_num, job.load().sequence_num)
+
+        self.execute_all_deferred_tasks()
+        with common_utils.Namespace(self.NAMESPACE):
+            self.assertEquals(
+                [student2_id],
+                [e.user_id for e in models.EventEntity.all().run()])
+
+        # The next cron run picks up the second user.
+        self._complete_removal()
+        with common_utils.Namespace(self.NAMESPACE):
+            self.assertEquals([], list(models.EventEntity.all().run()))
+            self.assertIsNone(models.Student.get_by_user(other_user))
+
     def test_multiple_courses(self):
         COURSE_TWO = 'course_two'
         COURSE_TWO_NS = 'ns_' + COURSE_TWO
@@ -81,6 +81,9 @@ class ExpireOldAssignedReviewsHandler(utils.BaseHandler):
                     expired_keys, exception_keys = (
                         review.Manager.expire_old_reviews_for_unit(
                             unit['review_window_mins'], unit['id']))
+                    # Expiry reorders candidates, so repopulate the pool that
+                    # get_new_review() draws from.
+                    review.Manager.refill_candidate_pool(unit['id'])
 
                     unit_expired_count = len(expired_keys)
                     unit_exception_count = len(exception_keys)
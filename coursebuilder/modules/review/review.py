@@ -20,14 +20,17 @@ __author__ = [
 
 import datetime
 import random
+import time
 
 from common import schema_fields
+from common import utils as common_utils
 from models import counters
 from models import custom_modules
 from models import data_removal
 from models import data_sources
 from models import entities
 from models import entity_transforms
+from models import models as m_models
 from models import student_work
 from models import transforms
 from models import utils
@@ -37,7 +40,9 @@ from modules.review import dashboard as review_dashboard
 from modules.review import domain
 from modules.review import peer
 from modules.review import stats
+from google.appengine.api import namespace_manager
 from google.appengine.ext import db
+from google.appengine.ext import deferred
 
 
 # In-process increment-only performance counters.
@@ -151,10 +156,29 @@ COUNTER_GET_NEW_REVIEW_FAILED = counters.PerfCounter(
 COUNTER_GET_NEW_REVIEW_NOT_ASSIGNABLE = counters.PerfCounter(
     'gcb-pr-get-new-review-none-assignable',
     'number of times get_new_review() failed to find an assignable review')
+COUNTER_GET_NEW_REVIEW_POOL_CANDIDATE = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-candidate',
+    ('number of candidates get_new_review() took from the shared candidate '
+     'pool'))
+COUNTER_GET_NEW_REVIEW_POOL_EXHAUSTED = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-exhausted',
+    'number of times get_new_review() found a candidate pool shard exhausted')
+COUNTER_GET_NEW_REVIEW_POOL_FALLBACK = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-fallback',
+    ('number of times get_new_review() could not assign from the candidate '
+     'pool and fell back to querying for candidates'))
+COUNTER_GET_NEW_REVIEW_POOL_RETURNED = counters.PerfCounter(
+    'gcb-pr-get-new-review-pool-returned',
+    ('number of candidates get_new_review() put back into the candidate pool '
+     'because they could be assigned to other reviewers only'))
 COUNTER_GET_NEW_REVIEW_REASSIGN_EXISTING = counters.PerfCounter(
     'gcb-pr-get-new-review-reassign-existing',
     ('number of times get_new_review() unremoved and reassigned an existing '
      'review step'))
+COUNTER_GET_NEW_REVIEW_RETRIED = counters.PerfCounter(
+    'gcb-pr-get-new-review-retried',
+    ('number of times get_new_review() retried because assigning a candidate '
+     'failed, usually due to contention with other reviewers'))
 COUNTER_GET_NEW_REVIEW_START = counters.PerfCounter(
     'gcb-pr-get-new-review-start',
     'number of times get_new_review() has started processing')
@@ -199,6 +223,13 @@ COUNTER_GET_SUBMISSION_AND_REVIEW_STEP_KEYS_SUCCESS = counters.PerfCounter(
     ('number of times get_submission-and-review-step-keys() completed '
      'successfully'))
 
+COUNTER_REFILL_CANDIDATE_POOL_REQUESTED = counters.PerfCounter(
+    'gcb-pr-refill-candidate-pool-requested',
+    'number of times a background refill of a candidate pool was requested')
+COUNTER_REFILL_CANDIDATE_POOL_CANDIDATES = counters.PerfCounter(
+    'gcb-pr-refill-candidate-pool-candidates',
+    'number of candidates refill_candidate_pool() put into candidate pools')
+
 COUNTER_START_REVIEW_PROCESS_FOR_ALREADY_STARTED = counters.PerfCounter(
     'gcb-pr-start-review-process-for-already-started',
     ('number of times start_review_process_for() called when review already '
@@ -251,6 +282,139 @@ COUNTER_WRITE_REVIEW_UPDATED_EXISTING_REVIEW = counters.PerfCounter(
 _REVIEW_STEP_QUERY_LIMIT = 2 * domain.MAX_UNREMOVED_REVIEW_STEPS
 
 
+class _NotAssignableToReviewerError(Exception):
+    """Raised for a review candidate that other reviewers may still take."""
+
+
+class _CandidatePool(object):
+    """Sharded pool of review assignment candidates for a unit, in memcache.
+
+    The head of Manager.get_assignment_candidates_query() is dealt round-robin
+    into NUM_SHARDS shards. A shard is a run of numbered slots, one memcache
+    item each, plus a position and a length counter. A reviewer takes a
+    candidate by incrementing the position of a shard and using the slot at
+    that position, so concurrent reviewers are handed disjoint candidates
+    instead of all contending for the same few summaries at the head of the
+    query. A candidate that only the taking reviewer cannot use (e.g., it is
+    their own work) is put back into a new slot appended by incrementing the
+    length. Once a shard's position runs past its length the shard is
+    exhausted, and a refill of the whole pool is deferred to a task queue.
+
+    Candidates carry the change_date they were pooled with, so an assignment
+    from a stale entry fails the usual change_date check and is retried.
+    """
+
+    NUM_SHARDS = 10
+    CANDIDATES_PER_SHARD = 20
+    TTL_SECS = 60 * 60
+    REFILL_INTERVAL_SECS = 30
+
+    @classmethod
+    def is_enabled(cls):
+        return m_models.CAN_USE_MEMCACHE.value
+
+    @classmethod
+    def _slot_key(cls, unit_id, shard, position):
+        return 'review-candidates:%s:%s:%s' % (unit_id, shard, position)
+
+    @classmethod
+    def _length_key(cls, unit_id, shard):
+        return 'review-candidates-length:%s:%s' % (unit_id, shard)
+
+    @classmethod
+    def _position_key(cls, unit_id, shard):
+        return 'review-candidates-position:%s:%s' % (unit_id, shard)
+
+    @classmethod
+    def _refill_key(cls, unit_id, now):
+        return 'review-candidates-refill:%s:%s' % (
+            unit_id, int(now) / cls.REFILL_INTERVAL_SECS)
+
+    @classmethod
+    def fill(cls, unit_id):
+        """Replaces the pool for a unit; returns the number of candidates."""
+        summaries = Manager.get_assignment_candidates_query(unit_id).fetch(
+            cls.NUM_SHARDS * cls.CANDIDATES_PER_SHARD)
+        shards = [[] for _ in xrange(cls.NUM_SHARDS)]
+        for index, summary in enumerate(summaries):
+            shards[index % cls.NUM_SHARDS].append((
+                str(summary.key()), str(summary.reviewee_key),
+                summary.change_date))
+
+        mapping = {}
+        for shard, candidates in enumerate(shards):
+            for position, candidate in enumerate(candidates, 1):
+                mapping[cls._slot_key(unit_id, shard, position)] = candidate
+            mapping[cls._length_key(unit_id, shard)] = len(candidates)
+            mapping[cls._position_key(unit_id, shard)] = 0
+        m_models.MemcacheManager.set_multi(mapping, ttl=cls.TTL_SECS)
+        return len(summaries)
+
+    @classmethod
+    def take(cls, unit_id, shard):
+        """Takes the next candidate from a shard.
+
+        Args:
+            unit_id: string. Id of the unit the pool is for.
+            shard: int. Index of the shard to take from.
+
+        Returns:
+            (summary_key, reviewee_key, change_date) tuple, or None if the shard
+            is exhausted or missing from memcache.
+        """
+        position = m_models.MemcacheManager.incr(
+            cls._position_key(unit_id, shard), 1)
+        if not position:
+            return None
+        length_key = cls._length_key(unit_id, shard)
+        slot_key = cls._slot_key(unit_id, shard, position)
+        values = m_models.MemcacheManager.get_multi([length_key, slot_key])
+        length = values.get(length_key)
+        candidate = values.get(slot_key)
+        # The slot of a candidate being put back may not be written yet; that
+        # candidate is only available again after the next refill.
+        if not length or position > length or not candidate:
+            return None
+        summary_key, reviewee_key, change_date = candidate
+        return db.Key(summary_key), db.Key(reviewee_key), change_date
+
+    @classmethod
+    def put_back(cls, unit_id, shard, candidate):
+        """Appends a candidate taken from a shard back to its end.
+
+        Args:
+            unit_id: string. Id of the unit the pool is for.
+            shard: int. Index of the shard the candidate was taken from.
+            candidate: (summary_key, reviewee_key, change_date) tuple, as
+                returned by take().
+        """
+        position = m_models.MemcacheManager.incr(
+            cls._length_key(unit_id, shard), 1)
+        if not position:
+            return
+        summary_key, reviewee_key, change_date = candidate
+        m_models.MemcacheManager.set(
+            cls._slot_key(unit_id, shard, position),
+            (str(summary_key), str(reviewee_key), change_date),
+            ttl=cls.TTL_SECS)
+        COUNTER_GET_NEW_REVIEW_POOL_RETURNED.inc()
+
+    @classmethod
+    def request_refill(cls, unit_id, now_fn=time.time):
+        """Defers a refill of the pool, at most once per refill interval."""
+        if m_models.MemcacheManager.incr(
+                cls._refill_key(unit_id, now_fn()), 1) != 1:
+            return
+        COUNTER_REFILL_CANDIDATE_POOL_REQUESTED.inc()
+        deferred.defer(
+            _refill_candidate_pool, namespace_manager.get_namespace(), unit_id)
+
+
+def _refill_candidate_pool(namespace, unit_id):
+    with common_utils.Namespace(namespace):
+        Manager.refill_candidate_pool(unit_id)
+
+
 class Manager(object):
     """Object that manages the review subsystem."""
 
@@ -625,9 +789,14 @@ class Manager(object):
         the list. We then retry assignment up to max_retries times. If we run
         out of retries or candidates, we raise domain.NotAssignableError.
 
-        This is a naive implementation because it scales only to relatively low
-        new review assignments per second and because it can raise
-        domain.NotAssignableError when there are in fact assignable reviews.
+        This query path scales only to relatively low new review assignments
+        per second, because concurrent reviewers all contend for the same
+        candidates at the head of the query. When memcache is enabled we
+        therefore first try candidates from a sharded pool that hands out
+        disjoint candidates to concurrent reviewers (see _CandidatePool), and
+        use the query only if that fails. Both share one budget of max_retries
+        failed assignments. Either way we can raise domain.NotAssignableError
+        when there are in fact assignable reviews.
 
         Args:
             unit_id: string. The unit to assign work from.
@@ -654,16 +823,26 @@ class Manager(object):
         """
         try:
             COUNTER_GET_NEW_REVIEW_START.inc()
+            retries = 0
+            if _CandidatePool.is_enabled():
+                assigned_key, retries = cls._get_new_review_from_pool(
+                    unit_id, reviewer_key, max_retries)
+                if assigned_key:
+                    COUNTER_GET_NEW_REVIEW_SUCCESS.inc()
+                    return assigned_key
+                COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.inc()
+
             # Filter out candidates that are for submissions by the reviewer.
-            raw_candidates = cls.get_assignment_candidates_query(unit_id).fetch(
-                candidate_count)
-            COUNTER_ASSIGNMENT_CANDIDATES_QUERY_RESULTS_RETURNED.inc(
-                increment=len(raw_candidates))
-            candidates = [
-                candidate for candidate in raw_candidates
-                if candidate.reviewee_key != reviewer_key]
+            candidates = []
+            if retries < max_retries:
+                raw_candidates = cls.get_assignment_candidates_query(
+                    unit_id).fetch(candidate_count)
+                COUNTER_ASSIGNMENT_CANDIDATES_QUERY_RESULTS_RETURNED.inc(
+                    increment=len(raw_candidates))
+                candidates = [
+                    candidate for candidate in raw_candidates
+                    if candidate.reviewee_key != reviewer_key]
 
-            retries = 0
             while True:
                 if not candidates or retries >= max_retries:
                     COUNTER_GET_NEW_REVIEW_NOT_ASSIGNABLE.inc()
@@ -672,10 +851,14 @@ class Manager(object):
                             unit_id, repr(reviewer_key)))
                 candidate = cls._choose_assignment_candidate(candidates)
                 candidates.remove(candidate)
-                assigned_key = cls._attempt_review_assignment(
-                    candidate.key(), reviewer_key, candidate.change_date)
+                try:
+                    assigned_key = cls._attempt_review_assignment(
+                        candidate.key(), reviewer_key, candidate.change_date)
+                except _NotAssignableToReviewerError:
+                    assigned_key = None
 
                 if not assigned_key:
+                    COUNTER_GET_NEW_REVIEW_RETRIED.inc()
                     retries += 1
                 else:
                     COUNTER_GET_NEW_REVIEW_SUCCESS.inc()
@@ -685,6 +868,81 @@ class Manager(object):
             COUNTER_GET_NEW_REVIEW_FAILED.inc()
             raise e
 
+    @classmethod
+    def _get_new_review_from_pool(cls, unit_id, reviewer_key, max_retries):
+        """Attempts to assign a review from the unit's candidate pool.
+
+        Shards are visited starting from a random one, so concurrent reviewers
+        spread across shards. Failed assignments count against max_retries;
+        exhausted shards do not, but they trigger a background refill.
+        Candidates that other reviewers may still take, such as the reviewer's
+        own work, are put back into the pool. Running into one of those again
+        means the rest of the shard is of no use to this reviewer.
+
+        Returns:
+            (db.Key of peer.ReviewStep or None, int) tuple: the assigned step,
+            if any, and the number of failed assignments.
+        """
+        start = random.randrange(_CandidatePool.NUM_SHARDS)
+        retries = 0
+        refill_requested = False
+        put_back_keys = set()
+        for offset in xrange(_CandidatePool.NUM_SHARDS):
+            shard = (start + offset) % _CandidatePool.NUM_SHARDS
+            while retries < max_retries:
+                candidate = _CandidatePool.take(unit_id, shard)
+                if not candidate:
+                    COUNTER_GET_NEW_REVIEW_POOL_EXHAUSTED.inc()
+                    if not refill_requested:
+                        _CandidatePool.request_refill(unit_id)
+                        refill_requested = True
+                    break
+
+                summary_key, reviewee_key, change_date = candidate
+                if summary_key in put_back_keys:
+                    _CandidatePool.put_back(unit_id, shard, candidate)
+                    break
+                if reviewee_key == reviewer_key:
+                    _CandidatePool.put_back(unit_id, shard, candidate)
+                    put_back_keys.add(summary_key)
+                    continue
+                COUNTER_GET_NEW_REVIEW_POOL_CANDIDATE.inc()
+                try:
+                    assigned_key = cls._attempt_review_assignment(
+                        summary_key, reviewer_key, change_date)
+                except KeyError:
+                    # The summary was deleted after it was pooled.
+                    assigned_key = None
+                except _NotAssignableToReviewerError:
+                    _CandidatePool.put_back(unit_id, shard, candidate)
+                    put_back_keys.add(summary_key)
+                    assigned_key = None
+                if assigned_key:
+                    return assigned_key, retries
+                COUNTER_GET_NEW_REVIEW_RETRIED.inc()
+                retries += 1
+        return None, retries
+
+    @classmethod
+    def refill_candidate_pool(cls, unit_id):
+        """Refills the shared pool get_new_review() draws candidates from.
+
+        Runs in a deferred task when get_new_review() finds the pool
+        exhausted, and from cron to keep pools of active units populated.
+        Does nothing if memcache is disabled.
+
+        Args:
+            unit_id: string. Id of the unit to refill the pool for.
+
+        Returns:
+            int. The number of candidates put into the pool.
+        """
+        if not _CandidatePool.is_enabled():
+            return 0
+        count = _CandidatePool.fill(unit_id)
+        COUNTER_REFILL_CANDIDATE_POOL_CANDIDATES.inc(increment=count)
+        return count
+
     @classmethod
     def _choose_assignment_candidate(cls, candidates):
         """Seam that allows different choice functions in tests."""
@@ -721,7 +979,7 @@ class Manager(object):
                 # Reviewer has previously done this review and the review
                 # has been deleted. Skip to the next one.
                 COUNTER_GET_NEW_REVIEW_CANNOT_UNREMOVE_COMPLETED.inc()
-                return
+                raise _NotAssignableToReviewerError()
 
             if step.removed:
                 # We can reassign the existing review step.
@@ -733,7 +991,7 @@ class Manager(object):
                 # Reviewee has already reviewed or is already assigned to review
                 # this submission, so we cannot reassign the step.
                 COUNTER_GET_NEW_REVIEW_ALREADY_ASSIGNED.inc()
-                return
+                raise _NotAssignableToReviewerError()
 
         summary.increment_count(domain.REVIEW_STATE_ASSIGNED)
         return entities.put([step, summary])[0]
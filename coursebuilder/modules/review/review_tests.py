@@ -21,12 +21,15 @@ __author__ = [
 
 import os
 import datetime
+import logging
+import time
 import types
 import urllib
 
 from common import crypto
 from common import schema_transforms
 from controllers import sites
+from models import config
 from models import data_sources
 from models import models
 from models import student_work
@@ -54,6 +57,10 @@ class ManagerTest(actions.TestBase):
             student_work.Submission.key_name(
                 reviewee_key=self.reviewee_key, unit_id=self.unit_id))
 
+    def tearDown(self):
+        config.Registry.test_overrides.pop(models.CAN_USE_MEMCACHE.name, None)
+        super(ManagerTest, self).tearDown()
+
     def test_add_reviewer_adds_new_step_and_summary(self):
         step_key = review_module.Manager.add_reviewer(
             self.unit_id, self.submission_key, self.reviewee_key,
@@ -831,6 +838,149 @@ class ManagerTest(actions.TestBase):
 
         self.assertEqual(lower_priority_summary_key, step.review_summary_key)
 
+    def _put_review_summaries(self, count):
+        summary_keys = []
+        for index in xrange(count):
+            reviewee_key = db.Key.from_path(
+                models.Student.kind(), 'reviewee%s@example.com' % index)
+            submission_key = db.Key.from_path(
+                student_work.Submission.kind(),
+                student_work.Submission.key_name(
+                    reviewee_key=reviewee_key, unit_id=self.unit_id))
+            summary_keys.append(peer.ReviewSummary(
+                reviewee_key=reviewee_key, submission_key=submission_key,
+                unit_id=self.unit_id).put())
+        return summary_keys
+
+    def test_get_new_review_falls_back_to_query_and_refills_empty_pool(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        summary_key = self._put_review_summaries(1)[0]
+        fallbacks = review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value
+
+        step_key = review_module.Manager.get_new_review(
+            self.unit_id, self.reviewer_key)
+
+        self.assertEqual(summary_key, db.get(step_key).review_summary_key)
+        self.assertEqual(
+            fallbacks + 1,
+            review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value)
+
+        # Exhausting the pool asked for exactly one background refill.
+        self.assertEqual(1, self.execute_all_deferred_tasks())
+        # pylint: disable=protected-access
+        pool = review_module._CandidatePool
+        candidates = [
+            pool.take(self.unit_id, shard) for shard in xrange(pool.NUM_SHARDS)]
+        self.assertEqual(
+            [summary_key], [c[0] for c in candidates if c is not None])
+
+    def test_candidate_pool_serves_many_concurrent_reviewers(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        num_summaries = 100
+        num_waves = 10
+        summary_keys = self._put_review_summaries(num_summaries)
+
+        counters = [
+            review_module.COUNTER_GET_NEW_REVIEW_POOL_CANDIDATE,
+            review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK,
+            review_module.COUNTER_GET_NEW_REVIEW_RETRIED]
+        before = [counter.value for counter in counters]
+
+        # Each wave is as many reviewers as there are submissions arriving at
+        # once between two refills of the pool. They share the pool through
+        # memcache, so each must be handed a different candidate and none may
+        # contend with another for the same summary.
+        assignments = set()
+        start = time.time()
+        for wave in xrange(num_waves):
+            review_module.Manager.refill_candidate_pool(self.unit_id)
+            for index in xrange(num_summaries):
+                reviewer_key = db.Key.from_path(
+                    models.Student.kind(),
+                    'reviewer%s-%s@example.com' % (wave, index))
+                step = db.get(review_module.Manager.get_new_review(
+                    self.unit_id, reviewer_key))
+                self.assertNotEqual(reviewer_key, step.reviewee_key)
+                assignments.add(step.review_summary_key)
+            self.assertEqual(set(summary_keys), assignments)
+            assignments.clear()
+        elapsed = time.time() - start
+
+        num_reviewers = num_summaries * num_waves
+        self.assertEqual(
+            [num_reviewers, 0, 0],
+            [counter.value - value
+             for counter, value in zip(counters, before)])
+        self.assertEqual(
+            [num_waves] * num_summaries,
+            [summary.assigned_count for summary in db.get(summary_keys)])
+        logging.info(
+            'Assigned %s reviews from the candidate pool in %.3fs',
+            num_reviewers, elapsed)
+
+    def test_candidate_pool_keeps_own_submission_for_other_reviewers(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        summary_key = self._put_review_summaries(1)[0]
+        review_module.Manager.refill_candidate_pool(self.unit_id)
+
+        reviewee_key = db.get(summary_key).reviewee_key
+        self.assertRaises(
+            domain.NotAssignableError, review_module.Manager.get_new_review,
+            self.unit_id, reviewee_key)
+
+        fallbacks = review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value
+        step_key = review_module.Manager.get_new_review(
+            self.unit_id, self.reviewer_key)
+
+        self.assertEqual(summary_key, db.get(step_key).review_summary_key)
+        self.assertEqual(
+            fallbacks, review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value)
+
+    def test_candidate_pool_keeps_already_assigned_for_other_reviewers(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        summary_key = self._put_review_summaries(1)[0]
+        summary = db.get(summary_key)
+        peer.ReviewStep(
+            assigner_kind=domain.ASSIGNER_KIND_HUMAN,
+            review_summary_key=summary_key,
+            reviewee_key=summary.reviewee_key, reviewer_key=self.reviewer_key,
+            state=domain.REVIEW_STATE_ASSIGNED,
+            submission_key=summary.submission_key, unit_id=self.unit_id,
+            key_name=peer.ReviewStep.key_name(
+                summary.submission_key, self.reviewer_key)
+        ).put()
+        review_module.Manager.refill_candidate_pool(self.unit_id)
+
+        self.assertRaises(
+            domain.NotAssignableError, review_module.Manager.get_new_review,
+            self.unit_id, self.reviewer_key)
+
+        fallbacks = review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value
+        other_reviewer_key = db.Key.from_path(
+            models.Student.kind(), 'other_reviewer@example.com')
+        step_key = review_module.Manager.get_new_review(
+            self.unit_id, other_reviewer_key)
+
+        self.assertEqual(summary_key, db.get(step_key).review_summary_key)
+        self.assertEqual(
+            fallbacks, review_module.COUNTER_GET_NEW_REVIEW_POOL_FALLBACK.value)
+
+    def test_get_new_review_shares_retries_between_pool_and_query(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        summary_key = self._put_review_summaries(1)[0]
+        review_module.Manager.refill_candidate_pool(self.unit_id)
+        # Make the pooled candidate stale.
+        db.put(db.get(summary_key))
+        attempts = (
+            review_module.COUNTER_GET_NEW_REVIEW_ASSIGNMENT_ATTEMPTED.value)
+
+        self.assertRaises(
+            domain.NotAssignableError, review_module.Manager.get_new_review,
+            self.unit_id, self.reviewer_key, max_retries=1)
+        self.assertEqual(
+            attempts + 1,
+            review_module.COUNTER_GET_NEW_REVIEW_ASSIGNMENT_ATTEMPTED.value)
+
     def test_get_review_step_keys_by_returns_list_of_keys(self):
         summary_key = peer.ReviewSummary(
             reviewee_key=self.reviewee_key, submission_key=self.submission_key,
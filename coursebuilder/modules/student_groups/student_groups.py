@@ -30,6 +30,7 @@ import os
 import urllib
 
 import appengine_config
+from common import caching
 from common import crypto
 from common import resource
 from common import safe_dom
@@ -38,6 +39,7 @@ from common import utils as common_utils
 from common import users
 from controllers import utils
 from models import courses
+from models import counters
 from models import custom_modules
 from models import data_sources
 from models import entities
@@ -63,6 +65,8 @@ MODULE_NAME_AS_IDENTIFIER = 'student_groups'
 _TEMPLATES_DIR = os.path.join(
     appengine_config.BUNDLE_ROOT, 'modules', 'student_groups', 'templates')
 EPOCH = datetime.datetime(1970, 1, 1)
+# Groups whose compiled overrides are kept in-process, across all courses.
+MAX_COMPILED_OVERRIDES_CACHE_ITEMS = 1000
 
 custom_module = None
 
@@ -504,6 +508,87 @@ class NoOverridesStudentGroup(object):
         return default
 
 
+class CompiledOverrides(object):
+    """A group's availability overrides, flattened for applying in one pass.
+
+    Entries set to "no override" are dropped, so every value present is to be
+    applied as-is.
+    """
+
+    def __init__(self, student_group):
+        # pylint: disable=protected-access
+        handler = StudentGroupAvailabilityRestHandler
+        overrides = student_group.dict.get(
+            StudentGroupDTO.OVERRIDES_PROPERTY, {})
+        self.course_availability = self._effective(
+            overrides.get(handler._COURSE_AVAILABILITY))
+        self.unit_availability = self._flatten(overrides.get('unit'))
+        self.lesson_availability = self._flatten(overrides.get('lesson'))
+
+    @classmethod
+    def _effective(cls, availability):
+        # pylint: disable=protected-access
+        if availability and availability != (
+                StudentGroupAvailabilityRestHandler._AVAILABILITY_NO_OVERRIDE):
+            return availability
+        return None
+
+    @classmethod
+    def _flatten(cls, settings_by_id):
+        ret = {}
+        for element_id, settings in (settings_by_id or {}).iteritems():
+            availability = cls._effective(settings.get('availability'))
+            if availability:
+                ret[element_id] = availability
+        return ret
+
+
+class ProcessScopedCompiledOverridesCache(caching.ProcessScopedSingleton):
+    """Holds in-process CompiledOverrides, keyed by course and group.
+
+    Entries are revalidated against the updated_on stamp the entity cache puts
+    on the group DTO, so a saved group is recompiled on its next use.
+    """
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(cls.instance().cache.items)
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_item_count=MAX_COMPILED_OVERRIDES_CACHE_ITEMS)
+
+    @classmethod
+    def get_overrides(cls, app_context, student_group):
+        version = getattr(student_group, 'updated_on', None)
+        if version is None:
+            return CompiledOverrides(student_group)
+        cache = cls.instance().cache
+        key = (app_context.get_namespace_name(), student_group.id)
+        found, entry = cache.get(key)
+        if found and entry[0] == version:
+            COMPILED_OVERRIDES_CACHE_HIT.inc()
+            return entry[1]
+        COMPILED_OVERRIDES_CACHE_MISS.inc()
+        overrides = CompiledOverrides(student_group)
+        cache.put(key, (version, overrides))
+        return overrides
+
+
+COMPILED_OVERRIDES_CACHE_LEN = counters.PerfCounter(
+    'gcb-student-groups-CompiledOverridesCache-len',
+    'A total number of compiled student group overrides held in-process.')
+COMPILED_OVERRIDES_CACHE_HIT = counters.PerfCounter(
+    'gcb-student-groups-CompiledOverridesCache-hit',
+    'A number of times compiled student group overrides were reused.')
+COMPILED_OVERRIDES_CACHE_MISS = counters.PerfCounter(
+    'gcb-student-groups-CompiledOverridesCache-miss',
+    'A number of times student group overrides had to be compiled.')
+
+COMPILED_OVERRIDES_CACHE_LEN.poll_value = (
+    ProcessScopedCompiledOverridesCache.get_cache_len)
+
+
 class StudentGroupDAO(models.BaseJsonDao):
     """Persistence manager for Student Group entitities."""
 
@@ -1100,11 +1185,9 @@ def modify_course_environment(app_context, env):
         return
 
     # Apply overrides as applicable.
-    # pylint: disable=protected-access
-    course_availability = student_group.get_override(
-        [StudentGroupAvailabilityRestHandler._COURSE_AVAILABILITY])
-    NO_OVERRIDE = StudentGroupAvailabilityRestHandler._AVAILABILITY_NO_OVERRIDE
-    if course_availability and course_availability != NO_OVERRIDE:
+    course_availability = ProcessScopedCompiledOverridesCache.get_overrides(
+        app_context, student_group).course_availability
+    if course_availability:
         setting = courses.COURSE_AVAILABILITY_POLICIES[course_availability]
         env['course']['now_available'] = setting['now_available']
         env['course']['browsable'] = setting['browsable']
@@ -1123,18 +1206,20 @@ def modify_unit_and_lesson_attributes(course, units, lessons):
     if not student_group:
         return
 
-    # pylint: disable=protected-access
-    NO_OVERRIDE = StudentGroupAvailabilityRestHandler._AVAILABILITY_NO_OVERRIDE
-    for unit in units:
-        unit_availability = student_group.get_override(
-            ['unit', str(unit.unit_id), 'availability'])
-        if unit_availability and unit_availability != NO_OVERRIDE:
-            unit.availability = unit_availability
-    for lesson in lessons:
-        lesson_availability = student_group.get_override(
-            ['lesson', str(lesson.lesson_id), 'availability'])
-        if lesson_availability and lesson_availability != NO_OVERRIDE:
-            lesson.availability = lesson_availability
+    overrides = ProcessScopedCompiledOverridesCache.get_overrides(
+        course.app_context, student_group)
+    unit_availability = overrides.unit_availability
+    lesson_availability = overrides.lesson_availability
+    if unit_availability:
+        for unit in units:
+            availability = unit_availability.get(str(unit.unit_id))
+            if availability:
+                unit.availability = availability
+    if lesson_availability:
+        for lesson in lessons:
+            availability = lesson_availability.get(str(lesson.lesson_id))
+            if availability:
+                lesson.availability = availability
 
 
 class AddToStudentAggregate(
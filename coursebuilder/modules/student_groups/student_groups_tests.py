@@ -1117,6 +1117,49 @@ class AvailabilityTests(StudentGroupsTestBase):
         response = self.get(self.LESSON_TWO_URL)
         self.assertEquals(response.status_int, 302)
 
+    def _put_unit_two_group_availability(self, availability):
+        self._put_availability(
+            self.group_id, [self.IN_GROUP_STUDENT_EMAIL],
+            AvailabilityRestHandler._AVAILABILITY_NO_OVERRIDE,
+            [{'id': str(self.unit_two.unit_id),
+              'type': 'unit',
+              AvailabilityRestHandler._OVERRIDDEN_AVAILABILITY: availability},
+             {'id': str(self.lesson_two.lesson_id),
+              'type': 'lesson',
+              AvailabilityRestHandler._OVERRIDDEN_AVAILABILITY: availability}])
+
+    def test_compiled_overrides_are_reused_until_group_changes(self):
+        self._put_course_availability(
+            courses.COURSE_AVAILABILITY_REGISTRATION_REQUIRED,
+            [{'id': str(self.unit_two.unit_id),
+              'type': 'unit',
+              'availability': courses.AVAILABILITY_UNAVAILABLE},
+             {'id': str(self.lesson_two.lesson_id),
+              'type': 'lesson',
+              'availability': courses.AVAILABILITY_UNAVAILABLE}])
+        self._put_unit_two_group_availability(courses.AVAILABILITY_AVAILABLE)
+
+        actions.login(self.IN_GROUP_STUDENT_EMAIL)
+        actions.register(self, 'John Smith')
+        response = self.get(self.LESSON_TWO_URL)
+        self.assertEquals(response.status_int, 200)
+
+        misses = student_groups.COMPILED_OVERRIDES_CACHE_MISS.value
+        hits = student_groups.COMPILED_OVERRIDES_CACHE_HIT.value
+        response = self.get(self.LESSON_TWO_URL)
+        self.assertEquals(response.status_int, 200)
+        self.assertEquals(
+            misses, student_groups.COMPILED_OVERRIDES_CACHE_MISS.value)
+        self.assertGreater(
+            student_groups.COMPILED_OVERRIDES_CACHE_HIT.value, hits)
+
+        # Saving the group is seen on the very next request.
+        actions.login(self.ADMIN_EMAIL)
+        self._put_unit_two_group_availability(courses.AVAILABILITY_UNAVAILABLE)
+        actions.login(self.IN_GROUP_STUDENT_EMAIL)
+        response = self.get(self.LESSON_TWO_URL)
+        self.assertEquals(response.status_int, 302)
+
     def test_course_availability_overrides(self):
         # Register normal student before we make the course private.
         actions.login(self.NON_GROUP_STUDENT_EMAIL)
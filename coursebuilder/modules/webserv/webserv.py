@@ -21,9 +21,11 @@
 __author__ = 'Pavel Simakov (psimakov@google.com)'
 
 
+import calendar
 import collections
 from datetime import datetime
 from datetime import timedelta
+import hashlib
 import mimetypes
 import os
 import re
@@ -31,11 +33,13 @@ import re
 import markdown
 
 import appengine_config
+from common import caching
 from common import jinja_utils
 from common import safe_dom
 from common import schema_fields
 from controllers import sites
 from controllers import utils
+from models import counters
 from models import courses
 from models import custom_modules
 from models import services
@@ -75,6 +79,10 @@ CACHING_SELECT_DATA = [
 
 EXPIRES_IN_THE_PAST = 'Mon, 01 Jan 1990 00:00:00 GMT'
 
+# max number of files and rendered pages held in-process, and the largest one
+MAX_RENDERED_FILE_CACHE_ITEMS = 200
+MAX_RENDERED_FILE_CACHE_ITEM_SIZE_BYTES = 128 * 1024
+
 webserv_module = None
 
 
@@ -96,8 +104,109 @@ def set_no_caching_headers_for(response):
     response.pragma = 'no-cache'
 
 
-def get_file_content_utf_8(filename):
-    return open(filename, 'r').read().decode('utf-8')
+def get_file_version(filename):
+    stat = os.stat(filename)
+    return filename, stat.st_mtime, stat.st_size
+
+
+def get_file_content(filename, versions=None):
+    """Reads a file; appends its version to versions, if given."""
+    if versions is not None:
+        versions.append(get_file_version(filename))
+    with open(filename, 'r') as stream:
+        return stream.read()
+
+
+def get_file_content_utf_8(filename, versions=None):
+    return get_file_content(filename, versions=versions).decode('utf-8')
+
+
+class RenderedFile(object):
+    """Content made from one or more files, with the versions it was made of."""
+
+    def __init__(self, versions, body):
+        self.versions = tuple(versions)
+        self.body = body
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        self.etag = hashlib.md5(body).hexdigest()
+        self.last_modified = int(max(mtime for _, mtime, _ in self.versions))
+        self._template_env = None
+        self._template = None
+
+    def is_current(self):
+        try:
+            return all(
+                get_file_version(version[0]) == version
+                for version in self.versions)
+        except OSError:
+            return False
+
+    def get_template(self, jinja_environment):
+        """Returns body compiled as a template of jinja_environment."""
+        if self._template_env is not jinja_environment:
+            self._template = jinja_environment.from_string(self.body)
+            self._template_env = jinja_environment
+        return self._template
+
+
+class ProcessScopedRenderedFileCache(caching.ProcessScopedSingleton):
+    """Holds in-process RenderedFile objects, keyed by file and options.
+
+    Entries are revalidated against the modification times and sizes of the
+    files they were made from, so an edited file is re-read on its next use.
+    """
+
+    @classmethod
+    def get_cache_len(cls):
+        return len(cls.instance().cache.items)
+
+    def __init__(self):
+        self.cache = caching.LRUCache(
+            max_item_count=MAX_RENDERED_FILE_CACHE_ITEMS,
+            max_item_size_bytes=MAX_RENDERED_FILE_CACHE_ITEM_SIZE_BYTES)
+        self.cache.get_entry_size = self._get_entry_size
+
+    def _get_entry_size(self, key, value):
+        return len(value.body)
+
+    @classmethod
+    def get_rendered_file(cls, key, render):
+        """Returns a current RenderedFile for key, calling render if needed.
+
+        Args:
+            key: a hashable identity of the content and the options used to
+                make it.
+            render: a callable taking a list, to which it must append the
+                get_file_version() of every file it reads; returns the body.
+
+        Returns:
+            A RenderedFile.
+        """
+        cache = cls.instance().cache
+        found, entry = cache.get(key)
+        if found and entry.is_current():
+            RENDERED_FILE_CACHE_HIT.inc()
+            return entry
+        RENDERED_FILE_CACHE_MISS.inc()
+        versions = []
+        entry = RenderedFile(versions, render(versions))
+        cache.put(key, entry)
+        return entry
+
+
+RENDERED_FILE_CACHE_LEN = counters.PerfCounter(
+    'gcb-webserv-RenderedFileCache-len',
+    'A total number of files and rendered pages held in-process.')
+RENDERED_FILE_CACHE_HIT = counters.PerfCounter(
+    'gcb-webserv-RenderedFileCache-hit',
+    'A number of times a file or rendered page was reused.')
+RENDERED_FILE_CACHE_MISS = counters.PerfCounter(
+    'gcb-webserv-RenderedFileCache-miss',
+    'A number of times a file had to be read or a page rendered.')
+
+RENDERED_FILE_CACHE_LEN.poll_value = (
+    ProcessScopedRenderedFileCache.get_cache_len)
 
 
 def get_config(app_context):
@@ -174,7 +283,8 @@ class MarkdownMetadataHandler(object):
         '<!-- MD_DEFAULT_HEADER --></head>\n<body>')
     MD_DEFAULT_FOOTER = '<!-- MD_DEFAULT_FOOTER --></body>\n</html>'
 
-    def __init__(self, web_server, config, md, relname, default_header_footer):
+    def __init__(self, web_server, config, md, relname, default_header_footer,
+                 versions=None):
         self.web_server = web_server
         self.config = config
         self.md = md
@@ -182,6 +292,7 @@ class MarkdownMetadataHandler(object):
         self.current_doc_metadata = md.Meta
         self.default_header_footer = default_header_footer
         self.top_doc_metadata = None
+        self.versions = versions
 
     def get(self, name):
         """Get metadata from current document or top index.md."""
@@ -193,7 +304,8 @@ class MarkdownMetadataHandler(object):
                 self.config.get(WEBSERV_DOC_ROOT),
                 self.MD_ROOT_DOCUMENT_NAME, self.config)
             if filename:
-                self.md.convert(get_file_content_utf_8(filename))
+                self.md.convert(get_file_content_utf_8(
+                    filename, versions=self.versions))
                 self.top_doc_metadata = self.md.Meta
         if name in self.top_doc_metadata:
             return self.top_doc_metadata[name]
@@ -205,7 +317,8 @@ class MarkdownMetadataHandler(object):
             filename, relname = self.web_server.get_target_filename(
                 self.config.get(WEBSERV_DOC_ROOT), fn[0], self.config)
             if filename:
-                return get_file_content_utf_8(filename)
+                return get_file_content_utf_8(
+                    filename, versions=self.versions)
         return default
 
     def get_header(self):
@@ -270,8 +383,34 @@ class WebServer(lessons.CourseHandler, utils.StarRouteHandlerMixin):
         else:
             raise Exception('Unknown caching policy: %s', caching)
 
-    def do_jinja(self, config, relname=None, from_string=None):
-        assert relname or from_string
+    def is_not_modified(self, etag, last_modified=None):
+        """Sets validators; makes the response a 304 if the client is current.
+
+        Args:
+            etag: string. Entity tag of the content.
+            last_modified: int or None. UTC seconds since the epoch the
+                content last changed at, if it comes from files.
+
+        Returns:
+            True if the response is a 304 and no body should be written.
+        """
+        self.response.etag = etag
+        if last_modified is not None:
+            self.response.last_modified = last_modified
+        if self.request.if_none_match:
+            not_modified = etag in self.request.if_none_match
+        else:
+            since = self.request.if_modified_since
+            not_modified = bool(
+                last_modified is not None and since and
+                calendar.timegm(since.utctimetuple()) >= last_modified)
+        if not_modified:
+            self.response.set_status(304)
+            self.response.clear()
+        return not_modified
+
+    def do_jinja(self, config, relname=None, rendered_file=None):
+        assert relname or rendered_file
         template_dirs = [
             os.path.join(
                 appengine_config.BUNDLE_ROOT, 'modules', 'webserv',
@@ -279,23 +418,35 @@ class WebServer(lessons.CourseHandler, utils.StarRouteHandlerMixin):
             os.path.join(
                 appengine_config.BUNDLE_ROOT, 'views')]
 
-        if from_string:
-            template = jinja_utils.create_and_configure_jinja_environment(
-                template_dirs, handler=self).from_string(from_string)
+        if rendered_file:
+            template = jinja_utils.bind_template(
+                rendered_file.get_template(
+                    jinja_utils.create_and_configure_jinja_environment(
+                        template_dirs)),
+                handler=self)
         else:
             template = jinja_utils.get_template(
                 relname, template_dirs, handler=self)
 
         self.response.headers['Content-Type'] = 'text/html'
         self.template_value['gcb_webserv_metadata'] = self.get_metadata()
-        self.response.write(template.render(self.template_value))
+        content = template.render(self.template_value)
+
+        # The page depends on the user, so it is rendered every time; the ETag
+        # still spares sending an unchanged page again.
+        etag = hashlib.md5(content.encode('utf-8')).hexdigest()
+        if not self.is_not_modified(etag):
+            self.response.write(content)
 
     def do_plain(self, config, filename, relname):
-        with open(filename, 'r') as stream:
-            self.response.headers[
-                'Content-Type'] = self.get_mime_type(filename)
-            self.set_cache_control(config, self.response)
-            self.response.write(stream.read())
+        rendered_file = ProcessScopedRenderedFileCache.get_rendered_file(
+            ('plain', filename),
+            lambda versions: get_file_content(filename, versions=versions))
+        self.response.headers['Content-Type'] = self.get_mime_type(filename)
+        self.set_cache_control(config, self.response)
+        if not self.is_not_modified(
+                rendered_file.etag, rendered_file.last_modified):
+            self.response.write(rendered_file.body)
 
     def do_html(self, config, filename, relname):
         if not config.get(WEBSERV_JINJA_ENABLED):
@@ -309,25 +460,35 @@ class WebServer(lessons.CourseHandler, utils.StarRouteHandlerMixin):
             self.do_plain(config, filename, relname)
             return
 
-        md = markdown.Markdown(extensions=MD_EXTENSIONS)
-        body = md.convert(get_file_content_utf_8(filename))
         body_only = self.request.get('body_only', 'FALSE').upper() == 'TRUE'
         default_header_footer = self.request.get(
             'default_header_footer', 'FALSE').upper() == 'TRUE'
-        meta = MarkdownMetadataHandler(
-            self, config, md, relname, default_header_footer)
-        if body_only:
-            content = body
-        else:
-            content = meta.get_header() + body + meta.get_footer()
+
+        def render(versions):
+            md = markdown.Markdown(extensions=MD_EXTENSIONS)
+            body = md.convert(get_file_content_utf_8(
+                filename, versions=versions))
+            if body_only:
+                return body
+            meta = MarkdownMetadataHandler(
+                self, config, md, relname, default_header_footer,
+                versions=versions)
+            return meta.get_header() + body + meta.get_footer()
+
+        # The header and footer are looked up relative to the doc_root.
+        rendered_file = ProcessScopedRenderedFileCache.get_rendered_file(
+            ('markdown', filename, config.get(WEBSERV_DOC_ROOT), body_only,
+             default_header_footer), render)
 
         if config.get(WEBSERV_JINJA_ENABLED):
-            self.do_jinja(config, from_string=content)
+            self.do_jinja(config, rendered_file=rendered_file)
             return
 
         self.set_cache_control(config, self.response)
         self.response.headers['Content-Type'] = 'text/html'
-        self.response.write(content)
+        if not self.is_not_modified(
+                rendered_file.etag, rendered_file.last_modified):
+            self.response.write(rendered_file.body)
 
     def replace_last(self, text, find, replace):
         li = text.rsplit(find, 1)
@@ -463,3 +463,38 @@ class WebservFunctionalTests(actions.TestBase):
                     '/test/foo/index.html',
                     '/test/foo/markdown.md']:
                 self.assert_cached(self.get(url), 60)
+
+    def test_conditional_get(self):
+        self._init_course('test')
+        actions.login('admin@example.com', is_admin=True)
+
+        with actions.OverriddenEnvironment(self.enabled(
+                md_enabled=True, jinja_enabled=False)):
+            for url in ['/test/foo/main.css', '/test/foo/markdown.md']:
+                response = self.get(url)
+                self.assertEquals(200, response.status_int)
+                etag = response.headers['ETag']
+                last_modified = response.headers['Last-Modified']
+
+                hits = webserv.RENDERED_FILE_CACHE_HIT.value
+                response = self.get(url, headers={'If-None-Match': etag})
+                self.assertEquals(304, response.status_int)
+                self.assertEquals('', response.body)
+                self.assertEquals(
+                    hits + 1, webserv.RENDERED_FILE_CACHE_HIT.value)
+
+                response = self.get(
+                    url, headers={'If-Modified-Since': last_modified})
+                self.assertEquals(304, response.status_int)
+
+                response = self.get(url, headers={'If-None-Match': '"x"'})
+                self.assertEquals(200, response.status_int)
+                self.assertEquals(etag, response.headers['ETag'])
+
+        with actions.OverriddenEnvironment(self.enabled(
+                md_enabled=True, jinja_enabled=True)):
+            response = self.get('/test/foo/markdown.md')
+            self.assertIn('Power Searching with Google', response.body)
+            response = self.get('/test/foo/markdown.md', headers={
+                'If-None-Match': response.headers['ETag']})
+            self.assertEquals(304, response.status_int)
@@ -62,6 +62,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.common_users.AuthInterceptorAndRequestHooksTest': 2,
     'tests.functional.common_users.PublicExceptionsAndClassesIdentityTests': 2,
     'tests.functional.common_user_routes.TestUserRoutes': 9,
+    'tests.functional.controllers_sites.RouteDispatchTest': 2,
     'tests.functional.controllers_utils.LocalizedGlobalHandlersTest': 4,
     'tests.functional.i18n.I18NCourseSettingsTests': 7,
     'tests.functional.i18n.I18NMultipleChoiceQuestionTests': 6,
@@ -71,9 +72,9 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_analytics.ProgressAnalyticsTest': 9,
     'tests.functional.model_analytics.QuestionAnalyticsTest': 3,
     'tests.functional.model_config.ValueLoadingTests': 2,
-    'tests.functional.model_courses.CourseCachingTest': 5,
+    'tests.functional.model_courses.CourseCachingTest': 8,
     'tests.functional.model_courses.PermissionsTest': 4,
-    'tests.functional.model_data_sources.PaginatedTableTest': 17,
+    'tests.functional.model_data_sources.PaginatedTableTest': 18,
     'tests.functional.model_data_sources.PiiExportTest': 4,
     'tests.functional.model_entities.BaseEntityTestCase': 3,
     'tests.functional.model_entities.ExportEntityTestCase': 2,
@@ -83,7 +84,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_models.ContentChunkTestCase': 16,
     'tests.functional.model_models.EventEntityTestCase': 1,
     'tests.functional.model_models.MemcacheManagerTestCase': 4,
-    'tests.functional.model_models.PersonalProfileTestCase': 1,
+    'tests.functional.model_models.PersonalProfileTestCase': 4,
     'tests.functional.model_models.QuestionDAOTestCase': 3,
     'tests.functional.model_models.StudentAnswersEntityTestCase': 1,
     'tests.functional.model_models.StudentLifecycleObserverTestCase': 13,
@@ -96,7 +97,8 @@ ALL_TEST_CLASSES = {
     'tests.functional.model_student_work.ReviewTest': 3,
     'tests.functional.model_student_work.SubmissionTest': 4,
     'tests.functional.model_utils.QueryMapperTest': 4,
-    'tests.functional.model_vfs.VfsLargeFileSupportTest': 6,
+    'tests.functional.model_vfs.VfsJinjaEnvironmentPoolTest': 2,
+    'tests.functional.model_vfs.VfsLargeFileSupportTest': 8,
     'tests.functional.module_config_test.ManipulateAppYamlFileTest': 8,
     'tests.functional.module_config_test.ModuleIncorporationTest': 12,
     'tests.functional.module_config_test.ModuleManifestTest': 7,
@@ -109,7 +111,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.student_last_location.NonRootCourse': 9,
     'tests.functional.student_last_location.RootCourse': 3,
     'tests.functional.student_tracks.StudentTracksTest': 10,
-    'tests.functional.roles.RolesTest': 24,
+    'tests.functional.roles.RolesTest': 28,
     'tests.functional.test_classes.ActivityTest': 1,
     'tests.functional.test_classes.AdminAspectTest': 10,
     'tests.functional.test_classes.AssessmentPolicyTests': 6,
@@ -120,7 +122,7 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.CourseUrlRewritingTest': 48,
     'tests.functional.test_classes.DatastoreBackedCustomCourseTest': 6,
     'tests.functional.test_classes.DatastoreBackedSampleCourseTest': 48,
-    'tests.functional.test_classes.EtlMainTestCase': 46,
+    'tests.functional.test_classes.EtlMainTestCase': 53,
     'tests.functional.test_classes.EtlTranslationRoundTripTest': 1,
     'tests.functional.test_classes.ExtensionSwitcherTests': 3,
     'tests.functional.test_classes.InaccessiblePageHandlingTest': 7,
@@ -132,9 +134,9 @@ ALL_TEST_CLASSES = {
     'tests.functional.test_classes.MultipleCoursesTest': 1,
     'tests.functional.test_classes.NamespaceTest': 2,
     'tests.functional.test_classes.StaticHandlerTest': 3,
-    'tests.functional.test_classes.StudentAspectTest': 20,
+    'tests.functional.test_classes.StudentAspectTest': 21,
     'tests.functional.test_classes.StudentKeyNameTest': 8,
-    'tests.functional.test_classes.StudentUnifiedProfileTest': 20,
+    'tests.functional.test_classes.StudentUnifiedProfileTest': 21,
     'tests.functional.test_classes.TransformsEntitySchema': 1,
     'tests.functional.test_classes.TransformsJsonFileTestCase': 3,
     'tests.functional.test_classes.VirtualFileSystemTest': 48,
@@ -168,7 +170,7 @@ ALL_TEST_CLASSES = {
     'tests.unit.common_safe_dom.ElementTests': 17,
     'tests.unit.common_safe_dom.ScriptElementTests': 3,
     'tests.unit.common_safe_dom.EntityTests': 11,
-    'tests.unit.common_tags.CustomTagTests': 13,
+    'tests.unit.common_tags.CustomTagTests': 16,
     'tests.unit.common_utils.CommonUnitTests': 11,
     'tests.unit.common_utils.ParseTimedeltaTests': 8,
     'tests.unit.common_utils.ValidateTimedeltaTests': 6,
@@ -179,7 +181,7 @@ ALL_TEST_CLASSES = {
     'tests.unit.models_courses.WorkflowValidationTests': 13,
     'tests.unit.models_transforms.JsonToDictTests': 13,
     'tests.unit.models_transforms.JsonParsingTests': 3,
-    'tests.unit.models_transforms.SchemaValidationTests': 21,
+    'tests.unit.models_transforms.SchemaValidationTests': 22,
     'tests.unit.models_transforms.StringValueConversionTests': 2,
     'tests.unit.test_classes.DeepDictionaryMergeTest': 5,
     'tests.unit.test_classes.EtlRetryTest': 3,
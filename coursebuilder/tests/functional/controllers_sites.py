@@ -0,0 +1,74 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Functional tests for controllers.sites."""
+
+import logging
+import time
+
+from controllers import sites
+from tests.functional import actions
+
+
+class RouteDispatchTest(actions.TestBase):
+    """Compares trie and linear routing over all registered routes."""
+
+    ROUNDS = 20
+
+    def setUp(self):
+        super(RouteDispatchTest, self).setUp()
+        self.handler = sites.ApplicationRequestHandler()
+        self.paths = []
+        for path in sorted(sites.ApplicationRequestHandler.urls_map):
+            self.paths.extend([
+                path, path + '/', path + '/foo', path + '/foo/bar?baz=1'])
+        self.paths.extend(['', '/', '/no/such/path', '//foo//bar'])
+
+    def tearDown(self):
+        sites.ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = True
+        super(RouteDispatchTest, self).tearDown()
+
+    def _resolve_all(self, can_use_route_trie):
+        sites.ApplicationRequestHandler.CAN_USE_ROUTE_TRIE = can_use_route_trie
+        # pylint: disable=protected-access
+        resolve = self.handler._get_handler_factory_for_path
+        start = time.time()
+        for _ in xrange(self.ROUNDS):
+            handlers = [resolve(path) for path in self.paths]
+        return handlers, time.time() - start
+
+    def test_trie_routing_matches_linear_routing(self):
+        linear, linear_sec = self._resolve_all(False)
+        trie, trie_sec = self._resolve_all(True)
+        self.assertEquals(linear, trie)
+        logging.info(
+            'Resolved %s paths %s times; linear: %.3fs, trie: %.3fs',
+            len(self.paths), self.ROUNDS, linear_sec, trie_sec)
+
+    def test_route_map_changes_are_seen(self):
+        # pylint: disable=protected-access
+        resolve = self.handler._get_handler_factory_for_path
+        urls_map = sites.ApplicationRequestHandler.urls_map
+        path = '/route_test/foo'
+        before = resolve(path)
+
+        class _Handler(object):
+            pass
+
+        urls_map[path] = _Handler
+        try:
+            self.assertIs(_Handler, resolve(path))
+        finally:
+            del urls_map[path]
+        self.assertIs(before, resolve(path))
@@ -18,6 +18,8 @@ __author__ = [
     'mgainer@google.com (Mike Gainer)',
 ]
 
+import yaml
+
 from common import utils as common_utils
 from controllers import sites
 from models import config
@@ -186,6 +188,45 @@ class CourseCachingTest(actions.TestBase):
             memcache_values.keys(),
             'Only shard zero should be present in memcache.')
 
+    def _get_environ(self):
+        self.app_context.clear_per_request_cache()
+        return courses.Course.get_environ(self.app_context)
+
+    def test_environ_is_cached_in_process(self):
+        env = self._get_environ()
+
+        # Drop the memcache copy; settings still come from the process cache.
+        models.MemcacheManager.delete(
+            courses.Course.make_locale_environ_key(None), self.NAMESPACE)
+        hits = courses.ENVIRON_CACHE_HIT.value
+        self.assertEquals(env, self._get_environ())
+        self.assertEquals(hits + 1, courses.ENVIRON_CACHE_HIT.value)
+
+        # Callers get copies; modifying one does not alter the cached settings.
+        env['course']['title'] = 'Modified Title'
+        self.assertEquals('Test Course', self._get_environ()['course']['title'])
+
+    def test_process_cache_hit_is_kept_for_request(self):
+        self._get_environ()
+        self.app_context.clear_per_request_cache()
+
+        # Only the first lookup in a request goes to the process cache.
+        hits = courses.ENVIRON_CACHE_HIT.value
+        courses.Course.get_environ(self.app_context)
+        courses.Course.get_environ(self.app_context)
+        self.assertEquals(hits + 1, courses.ENVIRON_CACHE_HIT.value)
+
+    def test_environ_is_reloaded_when_course_yaml_changes(self):
+        env = self._get_environ()
+        self.assertEquals('Test Course', env['course']['title'])
+
+        # Write course.yaml directly, leaving both caches in place.
+        env['course']['title'] = 'New Title'
+        self.app_context.fs.put(
+            self.app_context.get_config_filename(),
+            vfs.string_to_stream(unicode(yaml.safe_dump(env))))
+        self.assertEquals('New Title', self._get_environ()['course']['title'])
+
 
 class PermissionsTest(actions.TestBase):
 
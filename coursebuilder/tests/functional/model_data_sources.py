@@ -23,8 +23,10 @@ from webtest import app
 from common import catch_and_log
 from common import crypto
 from common import utils as common_utils
+from models import config
 from models import data_sources
 from models import entities
+from models import models
 from models import transforms
 from models.data_sources import utils as data_sources_utils
 
@@ -496,6 +498,45 @@ class PaginatedTableTest(DataSourceTest):
             'fetch page 1 start cursor present; end cursor present',
             ])
 
+    def test_cached_cursors_give_direct_page_access(self):
+        config.Registry.test_overrides[models.CAN_USE_MEMCACHE.name] = True
+        self.addCleanup(
+            config.Registry.test_overrides.pop, models.CAN_USE_MEMCACHE.name)
+        email = 'admin@google.com'
+        actions.login(email, is_admin=True)
+
+        response = transforms.loads(self.get(
+            '/rest/data/character/items?chunk_size=3&page_number=2').body)
+        self._verify_data(self.characters[6:9], response['data'])
+
+        # A request without the source context from the first one still
+        # reaches page 2 in a single query, using the shared cursors.
+        response = transforms.loads(self.get(
+            '/rest/data/character/items?chunk_size=3&page_number=2').body)
+        self.assertEquals(2, response['page_number'])
+        self._verify_data(self.characters[6:9], response['data'])
+        self._assert_have_only_logs(response, [
+            'Creating new context for given parameters',
+            'using 3 cached page cursors',
+            'fetch page 2 start cursor present; end cursor present',
+            ])
+
+        # Cursors are not shared between different queries.
+        response = transforms.loads(self.get(
+            '/rest/data/character/items?chunk_size=3&page_number=1'
+            '&ordering=rank').body)
+        self._verify_data([self.characters[9], self.characters[0],
+                           self.characters[7]], response['data'])
+        self._assert_have_only_logs(response, [
+            'Creating new context for given parameters',
+            'fetch page 0 start cursor missing; end cursor missing',
+            'fetch page 0 using limit 3',
+            'fetch page 0 saving end cursor',
+            'fetch page 1 start cursor present; end cursor missing',
+            'fetch page 1 using limit 3',
+            'fetch page 1 saving end cursor',
+            ])
+
     def test_pagination_filtering_and_ordering(self):
         email = 'admin@google.com'
         actions.login(email, is_admin=True)
@@ -333,6 +333,72 @@ class PersonalProfileTestCase(actions.ExportTestBase):
         self.assertEqual(
             self.transform(user_id), exported.safe_key.name())
 
+    def test_legacy_enrollment_info_is_migrated_to_index(self):
+        profile = models.PersonalProfile(
+            key_name='1',
+            enrollment_info=transforms.dumps(
+                {'ns_a': True, 'ns_b': False, 'ns_c': True}),
+            course_info=transforms.dumps(
+                {'ns_a': {'final_grade': 'A'}, 'ns_c': {}}))
+        profile.put()
+        profile = models.PersonalProfile.get_by_key_name('1')
+        self.assertFalse(profile.has_enrollment_index)
+
+        # Legacy profiles are readable before they are migrated.
+        dto = models.PersonalProfileDTO(personal_profile=profile)
+        self.assertTrue(dto.is_enrolled('ns_a'))
+        self.assertFalse(dto.is_enrolled('ns_b'))
+        self.assertTrue(dto.is_completed('ns_a'))
+        self.assertFalse(dto.is_completed('ns_c'))
+
+        profile.migrate_enrollment_index()
+        profile.put()
+        profile = models.PersonalProfile.get_by_key_name('1')
+        self.assertTrue(profile.has_enrollment_index)
+        self.assertTrue(profile.has_completion_index)
+        self.assertEqual(['ns_a', 'ns_c'], profile.enrolled_courses)
+        self.assertEqual(['ns_a'], profile.completed_courses)
+
+        # The legacy JSON is kept until the index is proven.
+        self.assertEqual(
+            {'ns_a': True, 'ns_b': False, 'ns_c': True},
+            transforms.loads(profile.enrollment_info))
+        dto = models.PersonalProfileDTO(personal_profile=profile)
+        self.assertTrue(dto.is_completed('ns_a'))
+        self.assertFalse(dto.is_completed('ns_c'))
+
+    def test_enrollment_only_index_is_migrated_to_completion_index(self):
+        profile = models.PersonalProfile(
+            key_name='1', enrolled_courses=['ns_a', 'ns_b'],
+            enrollment_index_version=1,
+            course_info=transforms.dumps({'ns_b': {'final_grade': 'B'}}))
+        profile.put()
+        profile = models.PersonalProfile.get_by_key_name('1')
+        self.assertTrue(profile.has_enrollment_index)
+        self.assertFalse(profile.has_completion_index)
+        self.assertEqual(['ns_b'], profile.get_completed_courses())
+
+        profile.migrate_enrollment_index()
+        profile.put()
+        profile = models.PersonalProfile.get_by_key_name('1')
+        self.assertEqual(['ns_a', 'ns_b'], profile.enrolled_courses)
+        self.assertEqual(['ns_b'], profile.completed_courses)
+
+        # Once indexed, completion is no longer read from course_info.
+        profile.course_info = None
+        dto = models.PersonalProfileDTO(personal_profile=profile)
+        self.assertTrue(dto.is_completed('ns_b'))
+        self.assertFalse(dto.is_completed('ns_a'))
+
+    def test_enrollment_index_partial_updates(self):
+        index = ['ns_a', 'ns_c']
+        models.StudentProfileDAO._set_in_index(index, 'ns_b', True)
+        models.StudentProfileDAO._set_in_index(index, 'ns_b', True)
+        self.assertEqual(['ns_a', 'ns_b', 'ns_c'], index)
+        models.StudentProfileDAO._set_in_index(index, 'ns_a', False)
+        models.StudentProfileDAO._set_in_index(index, 'ns_x', False)
+        self.assertEqual(['ns_b', 'ns_c'], index)
+
 
 class MemcacheManagerTestCase(actions.TestBase):
 
@@ -23,6 +23,7 @@ import random
 import StringIO
 import tempfile
 
+from common import jinja_utils
 from common import utils as common_utils
 from models import vfs
 from models import courses
@@ -169,6 +170,54 @@ class VfsLargeFileSupportTest(actions.TestBase):
             shard_1 = vfs.FileDataEntity.get_by_key_name(file_key_names[1])
             self.assertEquals(1, len(shard_1.data))
 
+    def test_put_multi_async_writes_large_and_draft_files(self):
+        large_data = 'x' * (vfs._MAX_VFS_SHARD_SIZE + 1)
+        fs = vfs.DatastoreBackedFileSystem('ns_foo', '/')
+        fs.put('/small', StringIO.StringIO('old contents'))
+        self.assertEquals(
+            [True, False, False], fs.isfile_multi(['/small', '/large', '/no']))
+
+        fs.put_multi_async([
+            ('/small', StringIO.StringIO('new contents')),
+            ('/large', StringIO.StringIO(large_data), True)])()
+
+        self.assertEquals(
+            [True, True, False], fs.isfile_multi(['/small', '/large', '/no']))
+        small = fs.get('/small')
+        self.assertEquals('new contents', small.read())
+        self.assertFalse(small.metadata.is_draft)
+        large = fs.get('/large')
+        self.assertEquals(large_data, large.read())
+        self.assertTrue(large.metadata.is_draft)
+
+    def test_put_multi_async_writes_no_metadata_if_data_put_fails(self):
+        fs = vfs.DatastoreBackedFileSystem('ns_foo', '/')
+        fs.put('/small', StringIO.StringIO('old contents'))
+
+        class FailedPut(object):
+
+            def check_success(self):
+                raise ValueError('Data put failed')
+
+        put_async = vfs.db.put_async
+
+        def failing_put_async(models, **kwargs):
+            if any(isinstance(model, vfs.FileDataEntity) for model in models):
+                return FailedPut()
+            return put_async(models, **kwargs)
+
+        self.swap(vfs.db, 'put_async', failing_put_async)
+        wait_and_finalize = fs.put_multi_async([
+            ('/small', StringIO.StringIO('new contents')),
+            ('/new', StringIO.StringIO('new file'))])
+        with self.assertRaises(ValueError):
+            wait_and_finalize()
+
+        self.assertEquals([True, False], fs.isfile_multi(['/small', '/new']))
+        small = fs.get('/small')
+        self.assertEquals('old contents', small.read())
+        self.assertEquals(len('old contents'), small.metadata.size)
+
     def test_illegal_file_name(self):
         namespace = 'ns_foo'
         fs = vfs.DatastoreBackedFileSystem(namespace, '/')
@@ -199,3 +248,53 @@ class VfsLargeFileSupportTest(actions.TestBase):
         # from AppEngine about cross-group transaction having too many
         # entities involved.
         self.course.save()
+
+
+class VfsJinjaEnvironmentPoolTest(actions.TestBase):
+
+    COURSE_NAME = 'test_course'
+    ADMIN_EMAIL = 'admin@foo.com'
+
+    def setUp(self):
+        super(VfsJinjaEnvironmentPoolTest, self).setUp()
+        self.app_context = actions.simple_add_course(
+            self.COURSE_NAME, self.ADMIN_EMAIL, 'Test Course')
+        self.template_dir = os.path.join(
+            self.app_context.get_home(), 'views', 'pool_test')
+        self.template_file = os.path.join(self.template_dir, 'page.html')
+
+    def _put_template(self, text):
+        self.app_context.fs.impl.put(
+            self.template_file, vfs.string_to_stream(unicode(text)))
+
+    def _render(self):
+        environ = self.app_context.fs.get_jinja_environ([self.template_dir])
+        return environ, environ.get_template('page.html').render({})
+
+    def test_environment_is_reused_and_sees_updates(self):
+        self._put_template('version one')
+        environ_1, text = self._render()
+        self.assertEquals('version one', text)
+
+        environ_2, text = self._render()
+        self.assertIs(environ_1, environ_2)
+        self.assertEquals('version one', text)
+
+        self._put_template('version two')
+        environ_3, text = self._render()
+        self.assertIs(environ_1, environ_3)
+        self.assertEquals('version two', text)
+
+    def test_request_values_are_not_stored_in_pooled_environment(self):
+        self._put_template('{{ value() }}')
+        environ = self.app_context.fs.get_jinja_environ([self.template_dir])
+        template = environ.get_template('page.html')
+        first = jinja_utils.bind_template(
+            template, handler='one', value=lambda: 'one')
+        second = jinja_utils.bind_template(
+            template, handler='two', value=lambda: 'two')
+        self.assertEquals('one', first.render({}))
+        self.assertEquals('two', second.render({}))
+        for shared_globals in (environ.globals, template.globals):
+            self.assertNotIn('value', shared_globals)
+            self.assertNotIn(jinja_utils.GCB_TAGS_HANDLER, shared_globals)
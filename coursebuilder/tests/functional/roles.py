@@ -232,6 +232,79 @@ class RolesTest(actions.TestBase):
         self.assertIn(
             PERMISSION, mem_map[STUDENT_EMAIL][PERMISSION_MODULE.name])
 
+    def test_permissions_map_is_cached_in_process_until_roles_change(self):
+        self._create_role()
+        roles.Roles.update_permissions_map()
+        actions.login(STUDENT_EMAIL)
+        course = self._get_course()
+        self.assertTrue(roles.Roles.is_user_allowed(
+            course, PERMISSION_MODULE, PERMISSION))
+
+        # Later checks are served in-process, even without the memcache copy.
+        MemcacheManager.delete(roles.Roles.memcache_key)
+        hits = roles.PERMISSIONS_CACHE_HIT.value
+        self.assertTrue(roles.Roles.is_user_allowed(
+            course, PERMISSION_MODULE, PERMISSION))
+        self.assertTrue(roles.Roles.in_any_role(course))
+        self.assertEquals(hits + 2, roles.PERMISSIONS_CACHE_HIT.value)
+
+        # Saving roles the way the role editor does is seen right away.
+        role = models.RoleDAO.get_all()[0]
+        role.dict['users'] = []
+        models.RoleDAO.save(role)
+        roles.Roles.update_permissions_map()
+        self.assertFalse(roles.Roles.is_user_allowed(
+            course, PERMISSION_MODULE, PERMISSION))
+        self.assertFalse(roles.Roles.in_any_role(course))
+
+    def test_missing_generation_token_is_seeded(self):
+        self._create_role()
+        roles.Roles.update_permissions_map()
+        MemcacheManager.delete(roles.Roles.generation_memcache_key)
+        actions.login(STUDENT_EMAIL)
+        course = self._get_course()
+
+        self.assertTrue(roles.Roles.is_user_allowed(
+            course, PERMISSION_MODULE, PERMISSION))
+        self.assertIsNotNone(
+            MemcacheManager.get(roles.Roles.generation_memcache_key))
+
+        hits = roles.PERMISSIONS_CACHE_HIT.value
+        self.assertTrue(roles.Roles.is_user_allowed(
+            course, PERMISSION_MODULE, PERMISSION))
+        self.assertEquals(hits + 1, roles.PERMISSIONS_CACHE_HIT.value)
+
+    def test_email_lists_are_parsed_once_and_follow_edits(self):
+        roles.ProcessScopedEmailSetCache.clear_instance()
+        actions.login(STUDENT_EMAIL)
+        app_context = self._get_course()
+        config.Registry.test_overrides[roles.GCB_WHITELISTED_USERS.name] = (
+            'Foo@Bar.com\n%s' % STUDENT_EMAIL.upper())
+
+        misses = roles.EMAIL_SET_CACHE_MISS.value
+        for _ in xrange(3):
+            self.assertTrue(roles.Roles.is_user_whitelisted(app_context))
+        self.assertEquals(misses + 1, roles.EMAIL_SET_CACHE_MISS.value)
+
+        config.Registry.test_overrides[roles.GCB_WHITELISTED_USERS.name] = (
+            'foo@bar.com')
+        self.assertFalse(roles.Roles.is_user_whitelisted(app_context))
+        self.assertEquals(misses + 2, roles.EMAIL_SET_CACHE_MISS.value)
+
+    def test_large_email_list_is_parsed_once(self):
+        roles.ProcessScopedEmailSetCache.clear_instance()
+        actions.login(STUDENT_EMAIL)
+        app_context = self._get_course()
+        config.Registry.test_overrides[roles.GCB_WHITELISTED_USERS.name] = (
+            '\n'.join(['user%s@example.com' % index for index in xrange(
+                50000)] + [STUDENT_EMAIL]))
+
+        misses = roles.EMAIL_SET_CACHE_MISS.value
+        for _ in xrange(3):
+            self.assertTrue(roles.Roles.is_user_whitelisted(app_context))
+        self.assertEquals(misses + 1, roles.EMAIL_SET_CACHE_MISS.value)
+        self.assertEquals(1, roles.ProcessScopedEmailSetCache.get_cache_len())
+
     # --------------------------- Whitelisting tests:
     # See tests/functional/whitelist.py, which covers both the actual
     # role behavior as well as more-abstract can-you-see-the-resource
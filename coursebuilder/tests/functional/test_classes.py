@@ -3004,6 +3004,49 @@ class StudentAspectTest(actions.TestBase):
             finally:
                 namespace_manager.set_namespace(old_namespace)
 
+    def test_batched_events(self):
+        """Test several events posted together are all recorded."""
+
+        email = 'test_batched_events@example.com'
+        name = 'Test Batched Events'
+
+        actions.login(email)
+        actions.register(self, name)
+
+        with actions.OverriddenEnvironment(
+            {'course': {analytics.CAN_RECORD_STUDENT_EVENTS: 'true'}}):
+
+            request = {'events': [
+                {'source': 'test-source-%s' % index,
+                 'payload': transforms.dumps({'index': index})}
+                for index in range(3)]}
+
+            # Check XSRF token is required.
+            response = self.post('rest/events/batch?%s' % urllib.urlencode(
+                {'request': transforms.dumps(request)}), {})
+            assert_equals(response.status_int, 200)
+            assert_contains('"status": 403', response.body)
+
+            request['xsrf_token'] = XsrfTokenManager.create_xsrf_token(
+                'event-post')
+            response = self.post('rest/events/batch?%s' % urllib.urlencode(
+                {'request': transforms.dumps(request)}), {})
+            assert_equals(response.status_int, 200)
+            assert not response.body
+
+            old_namespace = namespace_manager.get_namespace()
+            namespace_manager.set_namespace(self.namespace)
+            try:
+                events = models.EventEntity.all().fetch(1000)
+                assert_equals(
+                    ['test-source-0', 'test-source-1', 'test-source-2'],
+                    sorted([event.source for event in events]))
+                for event in events:
+                    assert_contains('locale', transforms.loads(
+                        event.data)['loc'])
+            finally:
+                namespace_manager.set_namespace(old_namespace)
+
     def test_two_students_dont_see_each_other_pages(self):
         """Test a user can't see another user pages."""
         email1 = 'user1@foo.com'
@@ -4949,6 +4992,20 @@ class HasBlobProperty(entities.BaseEntity):
     data = db.BlobProperty(indexed=False)
 
 
+class EtlTestStudentDomainCounter(jobs.AbstractCountingMapReduceJob):
+
+    @staticmethod
+    def get_description():
+        return 'count students by email domain'
+
+    def entity_class(self):
+        return models.Student
+
+    @staticmethod
+    def map(student):
+        yield (student.email.split('@')[1], 1)
+
+
 class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
     """Tests tools/etl/etl.py's main()."""
 
@@ -5226,6 +5283,150 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
             [model.key().name() for model in [first_entity, second_entity]],
             [entity['key.name'] for entity in entitiez])
 
+    def test_download_datastore_in_parallel_matches_sequential_download(self):
+        with Namespace(self.namespace):
+            db.put([
+                models.Student(key_name='student%s' % i) for i in xrange(7)] + [
+                models.StudentPropertyEntity(key_name='property%s' % i)
+                for i in xrange(5)] + [
+                models.QuestionEntity(data='question%s' % i)
+                for i in xrange(3)])
+        types = 'Student,StudentPropertyEntity,QuestionEntity'
+
+        def download(archive_path, workers):
+            etl.main(etl.create_args_parser().parse_args(
+                [etl._MODE_DOWNLOAD, etl._TYPE_DATASTORE] + self.common_args +
+                ['--archive_path', archive_path, '--datastore_types', types,
+                 '--batch_size', '2', '--download_workers', str(workers)]),
+                testing=True)
+            with zipfile.ZipFile(archive_path) as archive:
+                contents = [
+                    (name, archive.read(name)) for name in archive.namelist()]
+            # Manifests differ only in when the download started.
+            manifest = transforms.loads(contents[0][1])
+            del manifest['exported_on']
+            return [(etl._MANIFEST_FILENAME, manifest)] + contents[1:]
+
+        sequential = download(
+            os.path.join(self.test_tempdir, 'sequential.zip'), 1)
+        parallel = download(self.archive_path, 4)
+        self.assertEqual(4, len(sequential))
+        self.assertEqual(sequential, parallel)
+
+    def test_failed_download_removes_temporary_file(self):
+        with Namespace(self.namespace):
+            models.Student(key_name='student').put()
+
+        def fail(unused_json_file, unused_privacy_transform_fn, unused_model):
+            raise ValueError('Cannot write model')
+
+        self.swap(etl, '_write_model_to_json_file', fail)
+        args = etl.create_args_parser().parse_args(
+            [etl._MODE_DOWNLOAD, etl._TYPE_DATASTORE] + self.common_args +
+            ['--archive_path', self.archive_path, '--datastore_types',
+             'Student', '--download_workers', '1'])
+        self.assertRaises(ValueError, etl.main, args, testing=True)
+        self.assertFalse(os.path.exists(os.path.join(
+            os.path.dirname(self.archive_path), 'Student.json')))
+
+    def test_incremental_download_merges_into_full_download(self):
+        # Pin auto_now properties to a clock in UTC, as on the server.
+        now = [datetime.datetime.utcnow() - datetime.timedelta(days=1)]
+        self.swap(db.DateTimeProperty, 'now', staticmethod(lambda: now[0]))
+        with Namespace(self.namespace):
+            chunks = [
+                models.ContentChunkEntity(
+                    content_type='text/plain', contents='old%s' % i)
+                for i in xrange(5)]
+            db.put(chunks + [
+                models.QuestionEntity(data='question%s' % i)
+                for i in xrange(3)])
+        types = ['ContentChunkEntity', 'QuestionEntity']
+
+        def run(mode, archive_path, extra_args):
+            etl.main(etl.create_args_parser().parse_args(
+                [mode, etl._TYPE_DATASTORE] + self.common_args +
+                ['--archive_path', archive_path] + extra_args), testing=True)
+
+        def download(archive_path, extra_args=None):
+            run(etl._MODE_DOWNLOAD, archive_path,
+                ['--datastore_types', ','.join(types)] + (extra_args or []))
+
+        def read(archive_path, name):
+            with zipfile.ZipFile(archive_path) as archive:
+                return transforms.loads(archive.read(name))
+
+        def read_rows(archive_path, type_name):
+            rows = read(archive_path, 'models/%s.json' % type_name)['rows']
+            return sorted(rows, key=etl._get_row_key)
+
+        base_path = os.path.join(self.test_tempdir, 'base.zip')
+        download(base_path)
+        now[0] = datetime.datetime.utcnow()
+        with Namespace(self.namespace):
+            chunks[1].contents = 'new1'
+            chunks[1].put()
+            models.ContentChunkEntity(
+                content_type='text/plain', contents='new9').put()
+            models.QuestionEntity(data='question9').put()
+
+        # Only changed entities of timestamped types are downloaded.
+        delta_path = os.path.join(self.test_tempdir, 'delta.zip')
+        download(delta_path, ['--since_archive', base_path])
+        self.assertEqual(
+            ['ContentChunkEntity'],
+            read(delta_path, etl._MANIFEST_FILENAME)['incremental_types'])
+        self.assertEqual(
+            ['new1', 'new9'],
+            sorted(row['contents']
+                   for row in read_rows(delta_path, 'ContentChunkEntity')))
+        self.assertEqual(4, len(read_rows(delta_path, 'QuestionEntity')))
+
+        merged_path = os.path.join(self.test_tempdir, 'merged.zip')
+        run(etl._MODE_MERGE, merged_path,
+            ['--merge_archives', '%s,%s' % (base_path, delta_path)])
+        download(self.archive_path)
+        for type_name in types:
+            self.assertEqual(
+                read_rows(self.archive_path, type_name),
+                read_rows(merged_path, type_name))
+
+    def test_incremental_download_is_full_without_auto_now_property(self):
+        # StudentPropertyEntity has an indexed updated_on, but put() does not
+        # maintain it, so incremental downloads must not trust it.
+        with Namespace(self.namespace):
+            for i in xrange(3):
+                models.StudentPropertyEntity(
+                    key_name=models.StudentPropertyEntity.create_key(
+                        'student%s' % i, 'name'),
+                    name='name').put()
+        self.assertIsNone(
+            etl._get_modification_property(models.StudentPropertyEntity))
+
+        def download(archive_path, extra_args=None):
+            etl.main(etl.create_args_parser().parse_args(
+                [etl._MODE_DOWNLOAD, etl._TYPE_DATASTORE] + self.common_args +
+                ['--archive_path', archive_path,
+                 '--datastore_types', 'StudentPropertyEntity'] +
+                (extra_args or [])), testing=True)
+
+        base_path = os.path.join(self.test_tempdir, 'base.zip')
+        download(base_path)
+        with Namespace(self.namespace):
+            entity = models.StudentPropertyEntity.get_by_key_name(
+                models.StudentPropertyEntity.create_key('student1', 'name'))
+            entity.value = 'changed'
+            entity.put()
+
+        download(self.archive_path, ['--since_archive', base_path])
+        with zipfile.ZipFile(self.archive_path) as archive:
+            manifest = transforms.loads(archive.read(etl._MANIFEST_FILENAME))
+            rows = transforms.loads(
+                archive.read('models/StudentPropertyEntity.json'))['rows']
+        self.assertEqual([], manifest['incremental_types'])
+        self.assertEqual(3, len(rows))
+        self.assertIn('changed', [row['value'] for row in rows])
+
     def _test_resume_download(self, what, archive_type):
         with Namespace(self.namespace):
             models.QuestionEntity().put()
@@ -5418,6 +5619,47 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
             ['--disable_remote'])
         etl.main(args, testing=True)
 
+    def _put_students_for_local_mapreduce(self, context):
+        with Namespace(context.get_namespace_name()):
+            db.put([
+                models.Student(key_name='a', email='a@foo.com'),
+                models.Student(key_name='b', email='b@foo.com'),
+                models.Student(key_name='c', email='c@bar.com')])
+
+    def _run_local_mapreduce(self, job_args):
+        path = os.path.join(self.test_tempdir, 'results.json')
+        args = etl.create_args_parser().parse_args(
+            ['run', 'tools.etl.local_mapreduce.RunMapReduceJob'] +
+            self.common_args + ['--job_args=%s %s --output %s' % (
+                'tests.functional.test_classes.EtlTestStudentDomainCounter',
+                job_args, path)])
+        etl.main(args, testing=True)
+        with open(path) as f:
+            return sorted(transforms.loads(f.read()))
+
+    def test_run_local_mapreduce_over_datastore_succeeds(self):
+        context = etl_lib.get_context(self.url_prefix)
+        self._put_students_for_local_mapreduce(context)
+        self.assertEqual(
+            [['bar.com', 1], ['foo.com', 2]],
+            self._run_local_mapreduce('--processes 2'))
+
+    def test_run_local_mapreduce_over_archive_succeeds(self):
+        download_datastore_args = etl.create_args_parser().parse_args(
+            [etl._MODE_DOWNLOAD] + self.common_datastore_args +
+            ['--datastore_types', 'Student'])
+        context = etl_lib.get_context(download_datastore_args.course_url_prefix)
+        self._put_students_for_local_mapreduce(context)
+        etl.main(download_datastore_args, testing=True)
+
+        # Results come from the archive, not from the datastore.
+        with Namespace(context.get_namespace_name()):
+            db.delete(list(models.Student.all(keys_only=True)))
+        self.assertEqual(
+            [['bar.com', 1], ['foo.com', 2]],
+            self._run_local_mapreduce(
+                '--processes 1 --archive_path %s' % self.archive_path))
+
     def test_run_upload_file_to_course_succeeds(self):
         """Tests upload of a single local file to a course."""
         path = os.path.join(self.test_tempdir, 'file')
@@ -5826,6 +6068,41 @@ class EtlMainTestCase(testing.EtlTestBase, DatastoreBackedCourseTest):
         self.assertIn('All 40 entities already uploaded; skipping',
                       self.get_log())
 
+    def test_upload_streams_entities_in_batches(self):
+        sites.setup_courses(self.raw)
+        with Namespace(self.namespace):
+            db.put([EtlTestEntityPii(score=i) for i in xrange(45)])
+        self._download_archive()
+        self._clear_datastore()
+
+        read_paths = []
+        get = etl._ZipArchive.get
+
+        def recording_get(archive, path):
+            read_paths.append(path)
+            return get(archive, path)
+
+        batch_sizes = []
+        upload_batch = etl._upload_batch
+
+        def recording_upload_batch(entity_class, schema, entities, *args):
+            if entity_class is EtlTestEntityPii:
+                batch_sizes.append(len(entities))
+            return upload_batch(entity_class, schema, entities, *args)
+
+        self.swap(etl._ZipArchive, 'get', recording_get)
+        self.swap(etl, '_upload_batch', recording_upload_batch)
+        self._upload_archive(['--batch_size', '20'])
+
+        # Entity files are read a batch at a time, never loaded whole.
+        self.assertEqual([], [
+            path for path in read_paths
+            if path.startswith(etl._ARCHIVE_PATH_PREFIX_MODELS)])
+        self.assertEqual([20, 20, 5], batch_sizes)
+        with Namespace(self.namespace):
+            self.assertEqual(range(45), sorted(
+                entity.score for entity in EtlTestEntityPii.all().fetch(100)))
+
     def test_is_identity_transform_when_privacy_false(self):
         self.assertEqual(
             1, etl._get_privacy_transform_fn(False, 'no_effect')(1))
@@ -151,3 +151,44 @@ class CustomTagTests(unittest.TestCase):
                 '<Count>2</Count></div><div>foot</div>'
             ),
             str(safe_dom))
+
+    def test_parsed_html_is_reused_and_tags_rendered_each_time(self):
+        html = '<p>static <b>text</b></p><count></count><p>more</p>'
+        tags.ProcessScopedParsedHtmlCache.clear_all()
+        expected = (
+            '<div>1</div><p>static <b>text</b></p><Count>1</Count>'
+            '<p>more</p><div>foot</div>')
+
+        parses = []
+        old_parse = tags.html_string_to_element_tree
+
+        def counting_parse(*args, **kwargs):
+            parses.append(args)
+            return old_parse(*args, **kwargs)
+
+        tags.html_string_to_element_tree = counting_parse
+        try:
+            self.assertEqual(
+                expected, str(tags.html_to_safe_dom(html, self.mock_handler)))
+            self.assertEqual(
+                expected, str(tags.html_to_safe_dom(html, self.mock_handler)))
+        finally:
+            tags.html_string_to_element_tree = old_parse
+        self.assertEqual(1, len(parses))
+
+    def test_lxml_parse_matches_html5lib(self):
+        html = (
+            'Text <!-- note --><p class="a">one<br/>two</p>'
+            '<div><reroot><p>x</p></reroot></div> tail')
+        self.assertEqual(
+            str(tags.html_to_safe_dom(
+                html, self.mock_handler, use_lxml=False)),
+            str(tags.html_to_safe_dom(
+                html, self.mock_handler, use_lxml=True)))
+
+    def test_lxml_parses_non_ascii_byte_string(self):
+        html = u'<p>caf\xe9</p>'.encode('utf-8')
+        self.assertIn(
+            u'<p>caf\xe9</p>',
+            tags.html_to_safe_dom(
+                html, self.mock_handler, use_lxml=True).sanitized)
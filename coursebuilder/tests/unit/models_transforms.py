@@ -21,6 +21,7 @@ import datetime
 import unittest
 
 from common import schema_fields
+from common import schema_transforms
 from models import transforms
 
 
@@ -494,3 +495,37 @@ class SchemaValidationTests(unittest.TestCase):
             source, json_schema), [])
 
         self.assertEqual(transforms.json_to_dict(source, json_schema), source)
+
+    def test_compiled_validator_gives_same_complaints(self):
+        reg = schema_fields.FieldRegistry('Test')
+        reg.add_property(schema_fields.SchemaField(
+            'a_url', 'A URL', 'url', optional=True))
+        sub_registry = schema_fields.FieldRegistry('subregistry')
+        sub_registry.add_property(schema_fields.SchemaField(
+            'name', 'Name', 'string'))
+        sub_registry.add_property(schema_fields.SchemaField(
+            'score', 'Score', 'number', optional=True))
+        reg.add_property(schema_fields.FieldArray(
+            'struct_array', 'Struct Array', item_type=sub_registry))
+        json_schema = reg.get_json_schema_dict()
+        validate = schema_transforms.compile_json_schema_validator(json_schema)
+
+        for source in [
+            {},
+            None,
+            'not a dict',
+            {'a_url': 'http://example.com/', 'struct_array': []},
+            {'a_url': 'example', 'a_number': 456},
+            {'struct_array': [None, {}, {'name': 'x', 'score': 1},
+                              {'name': 'y', 'score': 1.0}, 'z']},
+            {'struct_array': 'not a list'},
+            ]:
+            self.assertEqual(
+                transforms.validate_object_matches_json_schema(
+                    source, json_schema),
+                validate(source))
+        self.assertEqual(
+            transforms.validate_object_matches_json_schema(
+                {'a_url': 7}, json_schema['properties']),
+            schema_transforms.compile_json_schema_validator(
+                json_schema['properties'])({'a_url': 7}))
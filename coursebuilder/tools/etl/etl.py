@@ -45,6 +45,20 @@ By default, all data types are downloaded.  You can specifically select or
 skip specific types using the --datastore_types and --exclude_types flags,
 respectively.
 
+Downloads can be incremental, which suits regular backups of large courses:
+
+$ python etl.py download datastore /cs101 server.appspot.com \
+    --archive_path delta.zip --since_archive archive.zip
+
+This downloads only entities changed since archive.zip was made (or since the
+UTC time given with --since YYYY-MM-DDTHH:MM:SS) for types with an
+automatically-updated timestamp; other types are downloaded in full. Deleted
+entities are not noticed. A full archive is rebuilt from a full download and
+the incremental ones after it, oldest first, with
+
+$ python etl.py merge datastore /cs101 localhost --archive_path full.zip \
+    --merge_archives archive.zip,delta.zip
+
 3. Upload of datastore entities.  This feature is experimental.
 
 $ python etl.py upload datastore /cs101 server.apppot.com \
@@ -158,8 +172,12 @@ __author__ = [
 ]
 
 import argparse
+import collections
+import datetime
 import functools
+import itertools
 import logging
+import multiprocessing.pool
 import os
 import random
 import re
@@ -198,6 +216,8 @@ _ARCHIVE_PATH_PREFIX_MODELS = 'models'
 _COURSE_JSON_PATH_SUFFIX = 'data/course.json'
 # String. End of the path to course.yaml in an archive.
 _COURSE_YAML_PATH_SUFFIX = 'course.yaml'
+# String. UTC format of --since and of times recorded in manifests.
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
 # String. Message the user must type to confirm datastore deletion.
 _DELETE_DATASTORE_CONFIRMATION_INPUT = 'YES, DELETE'
 # Default value of --port passed to the dev appserver. Keep this in sync
@@ -223,6 +243,10 @@ _EXCLUDE_TYPES = set([
     ])
 # Function that takes one arg and returns it.
 _IDENTITY_TRANSFORM = lambda x: x
+# datetime.timedelta. How far before a --since_archive's export time to start
+# an incremental download, to cover clock skew between this machine and the
+# server. Entities seen twice are merged harmlessly.
+_INCREMENTAL_OVERLAP = datetime.timedelta(minutes=10)
 # Regex. Format of __internal_names__ used by datastore kinds.
 _INTERNAL_DATASTORE_KIND_REGEX = re.compile(r'^__.*__$')
 # Names of fields in row which should be ignored when importing datastore.
@@ -243,14 +267,16 @@ _MANIFEST_FILENAME = 'manifest.json'
 _MODE_DELETE = 'delete'
 # String. Identifier for download mode.
 _MODE_DOWNLOAD = 'download'
+# String. Identifier for merge mode.
+_MODE_MERGE = 'merge'
 # String. Identifier for custom run mode.
 _MODE_RUN = 'run'
 # String. Identifier for upload mode.
 _MODE_UPLOAD = 'upload'
 # List of all modes.
-_MODES = [_MODE_DELETE, _MODE_DOWNLOAD, _MODE_RUN, _MODE_UPLOAD]
+_MODES = [_MODE_DELETE, _MODE_DOWNLOAD, _MODE_MERGE, _MODE_RUN, _MODE_UPLOAD]
 # List of modes where --force_overwrite is supported:
-_FORCE_OVERWRITE_MODES = [_MODE_DOWNLOAD, _MODE_UPLOAD]
+_FORCE_OVERWRITE_MODES = [_MODE_DOWNLOAD, _MODE_MERGE, _MODE_UPLOAD]
 # Int. The number of times to retry remote_api calls.
 _RETRIES = 3
 # String. Identifier for type corresponding to course definition data.
@@ -259,6 +285,10 @@ _TYPE_COURSE = 'course'
 _TYPE_DATASTORE = 'datastore'
 # Number of items upon which to emit upload rate statistics.
 _UPLOAD_CHUNK_SIZE = 1000
+# Int. Most course files to check and write per batch of datastore calls.
+_UPLOAD_FILES_BATCH_SIZE = 100
+# Int. Most bytes of course file contents to hold and write per batch.
+_UPLOAD_FILES_BATCH_BYTES = 8 * 1024 * 1024
 # We support .zip files as one archive format.
 ARCHIVE_TYPE_ZIP = 'zip'
 # We support plain UNIX directory structure as an archive format
@@ -301,11 +331,19 @@ def create_args_parser():
         '--archive_path',
         help=(
             'Absolute path of the archive file to read or write; required if '
-            'mode is %s or %s' % (_MODE_DOWNLOAD, _MODE_UPLOAD)), type=str)
+            'mode is %s, %s or %s' % (
+                _MODE_DOWNLOAD, _MODE_MERGE, _MODE_UPLOAD)), type=str)
     parser.add_argument(
         '--batch_size',
         help='Number of results to attempt to retrieve per batch',
         default=20, type=int)
+    parser.add_argument(
+        '--download_workers',
+        help=(
+            'If mode is %s, number of entity types to fetch at once. With '
+            'more than one, each type also fetches its next batch while the '
+            'current one is written' % _MODE_DOWNLOAD),
+        default=4, type=int)
     parser.add_argument(
         '--datastore_types', default=[],
         help=(
@@ -352,6 +390,14 @@ def create_args_parser():
         help=(
             'If mode is %s, string containing args delegated to etl_lib.Job '
             'subclass') % _MODE_RUN, type=lambda s: s.split())
+    parser.add_argument(
+        '--merge_archives', default=[],
+        help=(
+            'If mode is %s, comma-separated list of archive paths to combine '
+            'into --archive_path: a full download of type %s followed by '
+            'incremental downloads of it, oldest first' % (
+                _MODE_MERGE, _TYPE_DATASTORE)),
+        type=lambda s: s.split(','))
     parser.add_argument(
         '--log_level', choices=_LOG_LEVEL_CHOICES,
         help='Level of logging messages to emit', default='INFO',
@@ -368,6 +414,20 @@ def create_args_parser():
             "When mode is '%s', type is '%s', and --privacy is passed,  pass "
             "this secret to have user ids transformed with it rather than with "
             "random bits") % (_MODE_DOWNLOAD, _TYPE_DATASTORE), type=str)
+    parser.add_argument(
+        '--since',
+        help=(
+            "When mode is '%s' and type is '%s', only download entities "
+            "changed at or after this UTC time, formatted as "
+            "YYYY-MM-DDTHH:MM:SS. Applies to types with an automatically "
+            "updated timestamp; other types are downloaded in full" % (
+                _MODE_DOWNLOAD, _TYPE_DATASTORE)),
+        type=_parse_datetime)
+    parser.add_argument(
+        '--since_archive',
+        help=(
+            'Like --since, but takes the time from the manifest of this '
+            'earlier archive, less a margin for clock skew'), type=str)
     parser.add_argument(
         '--verbose', action='store_true',
         help='Tell about each item uploaded/downloaded.')
@@ -526,6 +586,20 @@ class _AbstractArchive(object):
         """
         raise NotImplementedError()
 
+    def get_stream(self, path):
+        """Return a read-only file-like object for the entity found at path.
+
+        Returns None if path is not in the archive. Callers must close the
+        returned object.
+
+        Args:
+            path: string. Path of file to retrieve from the archive.
+
+        Returns:
+            File-like object supporting readline() and iteration.
+        """
+        raise NotImplementedError()
+
     def open(self, mode):
         """Opens archive in the mode given by mode string ('r', 'w', 'a')."""
         raise NotImplementedError()
@@ -595,6 +669,23 @@ class _ZipArchive(_AbstractArchive):
         except KeyError:
             pass
 
+    def get_stream(self, path):
+        """Return a read-only file-like object for the entity found at path.
+
+        Returns None if path is not in the archive.
+
+        Args:
+            path: string. Path of file to retrieve from the archive.
+
+        Returns:
+            File-like object decompressing the entity as it is read.
+        """
+        assert self._zipfile
+        try:
+            return self._zipfile.open(path)
+        except KeyError:
+            pass
+
     def open(self, mode):
         """Opens archive in the mode given by mode string ('r', 'w', 'a')."""
         assert not self._zipfile
@@ -638,6 +729,12 @@ class _DirectoryArchive(_AbstractArchive):
         with open(path, 'rb') as fp:
             return fp.read()
 
+    def get_stream(self, filename):
+        path = os.path.join(self.path, filename)
+        if not os.path.exists(path):
+            return None
+        return open(path, 'rb')
+
     def open(self, mode):
         if mode in ('w', 'a'):
             if not os.path.exists(self.path):
@@ -654,23 +751,38 @@ class _DirectoryArchive(_AbstractArchive):
 class _Manifest(object):
     """Manifest that lists the contents and version of an archive folder."""
 
-    def __init__(self, raw, version):
+    def __init__(self, raw, version, exported_on=None, since=None,
+                 incremental_types=None):
         """Constructs a new manifest.
 
         Args:
             raw: string. Raw course definition string.
             version: string. Version of Course Builder course this manifest was
                 generated from.
+            exported_on: datetime.datetime or None. UTC time the download
+                that made the archive started.
+            since: datetime.datetime or None. For an incremental download,
+                the UTC time entities must have changed after to be included.
+            incremental_types: list of string. For an incremental download,
+                names of the types holding only changed entities; other types
+                were downloaded in full.
         """
         self._entities = []
         self._raw = raw
         self._version = version
+        self.exported_on = exported_on
+        self.since = since
+        self.incremental_types = sorted(incremental_types or [])
 
     @classmethod
     def from_json(cls, json):
         """Returns a manifest for the given JSON string."""
         parsed = transforms.loads(json)
-        instance = cls(parsed['raw'], parsed['version'])
+        instance = cls(
+            parsed['raw'], parsed['version'],
+            exported_on=_parse_datetime_or_none(parsed.get('exported_on')),
+            since=_parse_datetime_or_none(parsed.get('since')),
+            incremental_types=parsed.get('incremental_types'))
         for entity in parsed['entities']:
             instance.add(_ManifestEntity(entity['path'], entity['is_draft']))
         return instance
@@ -703,6 +815,12 @@ class _Manifest(object):
             'raw': self.raw,
             'version': self.version,
         }
+        if self.exported_on:
+            manifest['exported_on'] = self.exported_on.strftime(
+                _DATETIME_FORMAT)
+        if self.since:
+            manifest['since'] = self.since.strftime(_DATETIME_FORMAT)
+            manifest['incremental_types'] = self.incremental_types
         return transforms.dumps(manifest, indent=2, sort_keys=2)
 
 
@@ -826,7 +944,9 @@ def _open_archive_for_write(context, course, archive_path, params):
         archive.open('w')
 
     if not manifest:
-        manifest = _Manifest(context.raw, course.version)
+        manifest = _Manifest(
+            context.raw, course.version,
+            exported_on=datetime.datetime.utcnow())
     return archive, already_done_names, manifest
 
 
@@ -879,7 +999,8 @@ def _download_course(context, course, params, archive, already_done_names,
         courses.ADDITIONAL_ENTITIES_FOR_COURSE_IMPORT)
     type_names = set([entity.__name__ for entity in all_entities])
     _download_types(archive, manifest, type_names, already_done_names,
-                    params.batch_size, _IDENTITY_TRANSFORM)
+                    params.batch_size, _IDENTITY_TRANSFORM,
+                    params.download_workers)
 
 def _download_datastore(context, course, params, archive, already_done_types,
                         manifest):
@@ -901,19 +1022,88 @@ def _download_datastore(context, course, params, archive, already_done_types,
     privacy_transform_fn = _get_privacy_transform_fn(
         params.privacy, privacy_secret)
     found_types = (requested_types & available_types)
+    since = _get_since(params)
+    if since:
+        manifest.since = since
+        manifest.incremental_types = sorted(
+            type_name for type_name in found_types
+            if _get_modification_property(db.class_for_kind(type_name)))
+        _LOG.info(
+            'Downloading entities changed since %s for types: %s', since,
+            ', '.join(manifest.incremental_types))
     _download_types(archive, manifest, found_types, already_done_types,
-                    params.batch_size, privacy_transform_fn)
+                    params.batch_size, privacy_transform_fn,
+                    params.download_workers, since=since)
+
+
+def _get_since(params):
+    """Returns the time an incremental download starts from, or None."""
+    if params.since:
+        return params.since
+    if not params.since_archive:
+        return None
+    archive = _init_archive(
+        params.since_archive,
+        vars(params).get('archive_type', ARCHIVE_TYPE_ZIP))
+    try:
+        archive.open('r')
+    except (IOError, ValueError):
+        _die('Cannot open --since_archive path ' + params.since_archive)
+    manifest = archive.manifest
+    if not (manifest and manifest.exported_on):
+        _die('Archive %s does not record when it was made; use --since' % (
+            params.since_archive))
+    return manifest.exported_on - _INCREMENTAL_OVERLAP
+
+
+def _get_modification_property(model_class):
+    """Returns name of an indexed last-modified time property, or None.
+
+    That is a DateTimeProperty with auto_now, which the datastore sets on every
+    write. Properties such as updated_on are only as current as the code that
+    maintains them, which not every writer does, so kinds without an auto_now
+    property are downloaded in full.
+    """
+    for name, prop in sorted(model_class.properties().iteritems()):
+        if (isinstance(prop, db.DateTimeProperty) and
+            not isinstance(prop, (db.DateProperty, db.TimeProperty)) and
+            prop.indexed and prop.auto_now):
+            return name
+    return None
 
 
 def _download_types(archive, manifest, type_names, already_done_names,
-                    batch_size, transform):
+                    batch_size, transform, workers=1, since=None):
+    """Downloads types, up to workers at once, into the archive.
+
+    Types are fetched concurrently into temporary files, but are added to the
+    archive one at a time in sorted order, so the archive is the same as a
+    sequential download would make, and a --resume after a failure sees
+    a sorted prefix of the types as done. With since, types that have a
+    last-modified property only get entities changed at or after it.
+    """
     for type_name in type_names & already_done_names:
         _LOG.info('Skipping already-downloaded type %s', type_name)
     type_names -= already_done_names
     _verify_downloadability(type_names)
     _finalize_manifest(type_names, manifest, archive)
-    for type_name in sorted(type_names):
-        _download_type(archive, manifest, type_name, batch_size, transform)
+
+    download = functools.partial(
+        _download_type_to_file, archive, batch_size=batch_size,
+        privacy_transform_fn=transform, since=since, prefetch=workers > 1)
+    type_names = sorted(type_names)
+    if workers <= 1 or len(type_names) <= 1:
+        for type_name in type_names:
+            _add_type_file_to_archive(archive, download(type_name))
+        return
+
+    pool = multiprocessing.pool.ThreadPool(min(workers, len(type_names)))
+    try:
+        for json_path in pool.imap(download, type_names):
+            _add_type_file_to_archive(archive, json_path)
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 def _verify_downloadability(type_names):
@@ -951,9 +1141,13 @@ def _finalize_manifest(type_names, manifest, archive):
     archive.add(_MANIFEST_FILENAME, str(manifest))
 
 
-def _download_type(
-    archive, manifest, model_class, batch_size, privacy_transform_fn):
-    """Downloads a set of files and adds them to the archive."""
+def _download_type_to_file(
+    archive, model_class, batch_size, privacy_transform_fn, since=None,
+    prefetch=False):
+    """Downloads entities of a type to a temporary file; returns its path.
+
+    The temporary file is removed if the download fails.
+    """
 
     json_path = os.path.join(
         os.path.dirname(archive.path), '%s.json' % model_class)
@@ -963,20 +1157,131 @@ def _download_type(
         model_class, json_path)
     json_file = transforms.JsonFile(json_path)
     json_file.open('w')
-    model_map_fn = functools.partial(
-        _write_model_to_json_file, json_file, privacy_transform_fn)
-    _process_models(
-        db.class_for_kind(model_class), batch_size,
-        model_map_fn=model_map_fn)
+    succeeded = False
+    try:
+        model_map_fn = functools.partial(
+            _write_model_to_json_file, json_file, privacy_transform_fn)
+        entity_class = db.class_for_kind(model_class)
+        filters = []
+        modification_property = (
+            _get_modification_property(entity_class) if since else None)
+        if modification_property:
+            filters.append(('%s >=' % modification_property, since))
+        _process_models(
+            entity_class, batch_size, model_map_fn=model_map_fn,
+            prefetch=prefetch, filters=filters)
+        succeeded = True
+    finally:
+        json_file.close()
+        if not succeeded:
+            _LOG.info('Removing temporary file ' + json_path)
+            os.remove(json_path)
+    return json_file.name
+
+
+def _merge(params):
+    """Combines a full datastore archive and later incremental ones."""
+    archive_type = vars(params).get('archive_type', ARCHIVE_TYPE_ZIP)
+    sources = []
+    for path in params.merge_archives:
+        source = _init_archive(path, archive_type)
+        try:
+            source.open('r')
+        except (IOError, ValueError):
+            _die('Cannot open archive path ' + path)
+        manifest = source.manifest
+        if not manifest:
+            _die('Archive %s has no manifest' % path)
+        sources.append((source, manifest))
+    if sources[0][1].since:
+        _die('First of --merge_archives must be a full download, not '
+             'an incremental one')
+
+    type_names = set()
+    for source, _ in sources:
+        type_names.update([
+            name.replace('.json', '')
+            for name in source.listdir(_ARCHIVE_PATH_PREFIX_MODELS)])
+    last_manifest = sources[-1][1]
+    manifest = _Manifest(
+        last_manifest.raw, last_manifest.version,
+        exported_on=last_manifest.exported_on)
+
+    archive = _init_archive(os.path.abspath(params.archive_path), archive_type)
+    archive.open('w')
+    with archive:
+        _finalize_manifest(type_names, manifest, archive)
+        for type_name in sorted(type_names):
+            _add_type_file_to_archive(
+                archive, _merge_type_to_file(archive, sources, type_name))
+    _LOG.info('Done; archive saved to ' + archive.path)
+
+
+def _merge_type_to_file(archive, sources, type_name):
+    """Merges one type from (archive, manifest) pairs into a temporary file.
+
+    The newest archive holding all entities of the type is the base; changed
+    entities from incremental archives after it replace base entities with
+    the same key, or are added after them. Only the changes are held in
+    memory. Entities deleted since the base are not removed, as incremental
+    downloads cannot see deletions.
+
+    Returns:
+        Path of the temporary file.
+    """
+    json_name = '%s.json' % type_name
+    internal_path = _AbstractArchive.get_internal_path(
+        json_name, prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+    base = None
+    changes = collections.OrderedDict()
+    for source, manifest in sources:
+        stream = source.get_stream(internal_path)
+        if stream is None:
+            continue
+        try:
+            if type_name not in manifest.incremental_types:
+                base = source
+                changes.clear()
+            else:
+                for row in _iter_json_rows(stream):
+                    changes[_get_row_key(row)] = row
+        finally:
+            stream.close()
+
+    json_path = os.path.join(os.path.dirname(archive.path), json_name)
+    _LOG.info(
+        'Merging %d changed entities of type %s into temporary file %s',
+        len(changes), type_name, json_path)
+    json_file = transforms.JsonFile(json_path)
+    json_file.open('w')
+    if base:
+        stream = base.get_stream(internal_path)
+        try:
+            for row in _iter_json_rows(stream):
+                json_file.write(changes.pop(_get_row_key(row), row))
+        finally:
+            stream.close()
+    for row in changes.itervalues():
+        json_file.write(row)
     json_file.close()
+    return json_file.name
+
+
+def _get_row_key(row):
+    """Returns a hashable identity for a row written by _get_entity_dict."""
+    return row.get('key.name'), row.get('key.id')
+
+
+def _add_type_file_to_archive(archive, json_path):
+    """Adds a file made by _download_type_to_file to the archive."""
     internal_path = _AbstractArchive.get_internal_path(
-        os.path.basename(json_file.name), prefix=_ARCHIVE_PATH_PREFIX_MODELS)
+        os.path.basename(json_path), prefix=_ARCHIVE_PATH_PREFIX_MODELS)
 
     _LOG.info('Adding %s to archive', internal_path)
-    archive.add_local_file(json_file.name, internal_path)
+    archive.add_local_file(json_path, internal_path)
 
-    _LOG.info('Removing temporary file ' + json_file.name)
-    os.remove(json_file.name)
+    _LOG.info('Removing temporary file ' + json_path)
+    os.remove(json_path)
 
 
 def _filter_filesystem_files(files):
@@ -1028,6 +1333,19 @@ def _get_privacy_transform_fn(privacy, privacy_secret):
                                  privacy_secret)
 
 
+def _parse_datetime(text):
+    """Parses a --since value; raises argparse.ArgumentTypeError if bad."""
+    try:
+        return datetime.datetime.strptime(text, _DATETIME_FORMAT)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '"%s" is not a time formatted as YYYY-MM-DDTHH:MM:SS' % text)
+
+
+def _parse_datetime_or_none(text):
+    return datetime.datetime.strptime(text, _DATETIME_FORMAT) if text else None
+
+
 def _get_privacy_secret(privacy_secret):
     """Gets the passed privacy secret (or 128 random bits if None)."""
     secret = privacy_secret
@@ -1190,51 +1508,56 @@ def _list_all(context, include_inherited=False):
         appengine_config.BUNDLE_ROOT, include_inherited=include_inherited)
 
 
-def _process_models(model_class, batch_size, delete=False, model_map_fn=None):
-    """Fetch all rows in batches."""
+def _process_models(model_class, batch_size, delete=False, model_map_fn=None,
+                    prefetch=False, filters=None):
+    """Fetch all rows, or those matching filters, in batches.
+
+    With prefetch, each batch is fetched in a background thread while the
+    previous one is being processed. Filters are (property_operator, value)
+    pairs as taken by db.Query.filter.
+    """
     assert (delete or model_map_fn) or (not delete and model_map_fn)
     reportable_chunk = batch_size * 10
     total_count = 0
-    cursor = None
-    while True:
-        batch_count, cursor = _process_models_batch(
-            model_class, cursor, batch_size, delete, model_map_fn)
-        if not batch_count:
-            break
-        if not cursor:
-            break
-        total_count += batch_count
-        if not total_count % reportable_chunk:
-            _LOG.info('Processed records: %s', total_count)
-
-
-@_retry(message='Processing datastore entity batch failed; retrying')
-def _process_models_batch(
-    model_class, cursor, batch_size, delete, model_map_fn):
-    """Processes or deletes models in batches."""
-    query = model_class.all(keys_only=delete)
+    fetch = functools.partial(
+        _fetch_models_batch, model_class, batch_size=batch_size,
+        keys_only=delete, filters=filters)
+    pool = multiprocessing.pool.ThreadPool(1) if prefetch else None
+    try:
+        results, cursor = fetch(None)
+        while results:
+            pending = pool.apply_async(fetch, (cursor,)) if pool else None
+            if delete:
+                _delete_models_batch(results)
+            else:
+                for result in results:
+                    model_map_fn(result)
+            total_count += len(results)
+            if not total_count % reportable_chunk:
+                _LOG.info('Processed records: %s', total_count)
+            results, cursor = pending.get() if pending else fetch(cursor)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+@_retry(message='Fetching datastore entity batch failed; retrying')
+def _fetch_models_batch(model_class, cursor, batch_size, keys_only,
+                        filters=None):
+    """Fetches a batch of models; returns them and the cursor after them."""
+    query = model_class.all(keys_only=keys_only)
+    for property_operator, value in filters or []:
+        query.filter(property_operator, value)
     if cursor:
         query.with_cursor(start_cursor=cursor)
-
-    count = 0
-    empty = True
     results = query.fetch(limit=batch_size)
+    return results, query.cursor() if results else None
 
-    if results:
-        empty = False
-        if delete:
-            key_count = len(results)
-            db.delete(results)
-            count += key_count
-        else:
-            for result in results:
-                model_map_fn(result)
-                count += 1
 
-    cursor = None
-    if not empty:
-        cursor = query.cursor()
-    return count, cursor
+@_retry(message='Deleting datastore entity batch failed; retrying')
+def _delete_models_batch(keys):
+    db.delete(keys)
 
 
 def _get_entity_dict(model, privacy_transform_fn):
@@ -1251,26 +1574,39 @@ def _get_entity_dict(model, privacy_transform_fn):
 
 
 @_retry(message='Upload failed; retrying')
-def _put(context, content, path, is_draft, force_overwrite, verbose):
-    path = os.path.join(appengine_config.BUNDLE_ROOT, path)
-    description = _remove_bundle_root(path)
-    do_put = False
-    if context.fs.impl.isfile(path) and not path.endswith('/course.yaml'):
-        if force_overwrite:
-            _LOG.info('Overriding file %s', description)
-            context.fs.impl.delete(path)
-            do_put = True
+def _put_multi(context, files, force_overwrite, verbose):
+    """Writes a batch of files to the course.
+
+    Existing files are found with one datastore call and the rest written with
+    one asynchronous put, rather than several calls per file.
+
+    Args:
+        context: sites.ApplicationContext. Course to write to.
+        files: list of (content, path, is_draft) tuples; content supports
+            read() and path is relative to the bundle root.
+        force_overwrite: boolean. Whether to replace files that exist.
+        verbose: boolean. Whether to log each file.
+    """
+    paths = [
+        os.path.join(appengine_config.BUNDLE_ROOT, path)
+        for _, path, _ in files]
+    to_put = []
+    for path, exists, (content, _, is_draft) in zip(
+            paths, context.fs.impl.isfile_multi(paths), files):
+        description = _remove_bundle_root(path)
+        if exists and not path.endswith('/course.yaml'):
+            if force_overwrite:
+                _LOG.info('Overriding file %s', description)
+            else:
+                if verbose:
+                    _LOG.info('Not replacing existing file %s', description)
+                continue
         elif verbose:
-            _LOG.info('Not replacing existing file %s', description)
-    else:
-        do_put = True
-        if verbose:
             _LOG.info('Uploading file %s', description)
+        to_put.append((path, content, is_draft))
 
-    if do_put:
-        context.fs.impl.non_transactional_put(
-            os.path.join(appengine_config.BUNDLE_ROOT, path), content.read(),
-            is_draft=is_draft)
+    if to_put:
+        context.fs.impl.put_multi_async(to_put)()
 
 
 def _raw_input(message):
@@ -1360,6 +1696,8 @@ def _upload_course(context, params):
 
     _LOG.info('Uploading files')
     count = 0
+    batch = []
+    batch_bytes = 0
     for entity in archive.manifest.entities:
         if not _can_upload_entity_to_course(entity):
             _LOG.info('Skipping file ' + entity.path)
@@ -1369,10 +1707,18 @@ def _upload_course(context, params):
                       ' due to --no_static_files')
             continue
         external_path = _AbstractArchive.get_external_path(entity.path)
-        _put(
-            context, _ReadWrapper(archive.get(entity.path)), external_path,
-            entity.is_draft, params.force_overwrite, params.verbose)
+        content = archive.get(entity.path)
+        batch.append((_ReadWrapper(content), external_path, entity.is_draft))
+        batch_bytes += len(content)
         count += 1
+        if (len(batch) >= _UPLOAD_FILES_BATCH_SIZE or
+            batch_bytes >= _UPLOAD_FILES_BATCH_BYTES):
+            _put_multi(
+                context, batch, params.force_overwrite, params.verbose)
+            batch = []
+            batch_bytes = 0
+    if batch:
+        _put_multi(context, batch, params.force_overwrite, params.verbose)
     _LOG.info('Uploaded %d files.', count)
 
 
@@ -1468,24 +1814,20 @@ def _upload_datastore(params, included_type_names):
         _LOG.info('-------------------------------------------------------')
         _LOG.info('Adding entities of type %s', entity_class.__name__)
 
-        # Get JSON contents from .zip file
         json_path = _AbstractArchive.get_internal_path(
             '%s.json' % entity_class.__name__,
             prefix=_ARCHIVE_PATH_PREFIX_MODELS)
-        _LOG.info('Fetching data from .zip archive')
-        json_text = archive.get(json_path)
-        if not json_text:
+        num_entities = _count_json_rows(archive, json_path)
+        if num_entities is None:
             _LOG.info(
                 'Unable to find data file %s for entity %s; skipping',
                 json_path, entity_class.__name__)
             continue
-        _LOG.info('Parsing data into JSON')
-        json_object = transforms.loads(json_text)
         schema = (entity_transforms
                   .get_schema_for_entity(entity_class)
                   .get_json_schema_dict())
         total_count += _upload_entities_for_class(
-            entity_class, schema, json_object['rows'], params)
+            entity_class, schema, archive, json_path, num_entities, params)
     _LOG.info('Flushing all caches')
     memcache.flush_all()
     total_end = time.time()
@@ -1495,8 +1837,80 @@ def _upload_datastore(params, included_type_names):
         'y' if total_count == 1 else 'ies', int(total_end - total_start))
 
 
-def _upload_entities_for_class(entity_class, schema, entities, params):
-    num_entities = len(entities)
+def _iter_json_rows(stream, parse=True, start=0):
+    """Yields the rows of a transforms.JsonFile one at a time.
+
+    JsonFile writes one serialized row per line, so only the row being parsed
+    is held in memory. Files not in that layout are parsed in one piece.
+
+    Args:
+        stream: file-like object positioned at the start of the file.
+        parse: boolean. Whether to deserialize rows written one per line; if
+            False their JSON text is yielded instead, which is cheaper when
+            only counting.
+        start: int. Index of the first row to yield; rows before it are
+            skipped without being deserialized.
+
+    Yields:
+        Deserialized row objects, in file order.
+    """
+    # pylint: disable=protected-access
+    first_line = stream.readline()
+    if first_line.rstrip('\r\n') != transforms.JsonFile._PREFIX:
+        for row in transforms.loads(first_line + stream.read())['rows'][start:]:
+            yield row
+        return
+    index = 0
+    for line in stream:
+        line = line.strip()
+        if line == transforms.JsonFile._SUFFIX.strip():
+            return
+        if line.endswith(','):
+            line = line[:-1]
+        if line:
+            if index >= start:
+                yield transforms.loads(line) if parse else line
+            index += 1
+
+
+def _read_json_rows(archive, path, start, count):
+    """Returns up to count rows of the JsonFile at path from index start."""
+    stream = archive.get_stream(path)
+    try:
+        return list(itertools.islice(
+            _iter_json_rows(stream, start=start), count))
+    finally:
+        stream.close()
+
+
+def _count_json_rows(archive, path):
+    """Returns number of rows in the JsonFile at path, or None if missing."""
+    stream = archive.get_stream(path)
+    if stream is None:
+        return None
+    try:
+        return sum(1 for _ in _iter_json_rows(stream, parse=False))
+    finally:
+        stream.close()
+
+
+def _iter_batches(iterable, batch_size):
+    """Yields successive lists of at most batch_size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _upload_entities_for_class(
+    entity_class, schema, archive, json_path, num_entities, params):
+    """Uploads the rows of the JsonFile at json_path, a batch at a time.
+
+    Rows are streamed from the archive rather than loaded whole; finding where
+    to resume re-reads the file up to each probed row instead.
+    """
     i = 0
     is_first_batch_after_resume = False
 
@@ -1509,7 +1923,8 @@ def _upload_entities_for_class(entity_class, schema, entities, params):
             guess = (start + end) / 2
             if params.verbose:
                 _LOG.info('Checking whether instance %d exists', guess)
-            key, _ = _get_entity_key(entity_class, entities[guess])
+            entity = _read_json_rows(archive, json_path, guess, 1)[0]
+            key, _ = _get_entity_key(entity_class, entity)
             if db.get(key):
                 start = guess + 1
             else:
@@ -1524,9 +1939,10 @@ def _upload_entities_for_class(entity_class, schema, entities, params):
         # chunk back from where we are planning on restarting the upload.
         if params.batch_size > 1 and i > 0:
             start = max(0, i - params.batch_size)
-            end = min(start + params.batch_size, len(entities))
             is_first_batch_after_resume = True
-            existing = _find_existing_items(entity_class, entities, start, end)
+            existing = _find_existing_items(
+                entity_class, _read_json_rows(
+                    archive, json_path, start, params.batch_size))
             if None in existing:
                 if start > 0:
                     _LOG.info('Previous chunk only partially completed; '
@@ -1545,25 +1961,30 @@ def _upload_entities_for_class(entity_class, schema, entities, params):
     # pylint: disable=protected-access
     progress = etl_lib._ProgressReporter(
         _LOG, 'Uploaded', entity_class.__name__, _UPLOAD_CHUNK_SIZE,
-        len(entities) - i)
+        num_entities - i)
     if i < num_entities:
         _LOG.info('Starting upload of entities')
-        while i < num_entities:
-            quantity = _upload_batch(entity_class, schema, entities, i,
-                                     is_first_batch_after_resume, params)
-            progress.count(quantity)
-            i += quantity
-            is_first_batch_after_resume = False
+        stream = archive.get_stream(json_path)
+        try:
+            for batch in _iter_batches(
+                _iter_json_rows(stream, start=i), params.batch_size):
+                quantity = _upload_batch(entity_class, schema, batch, i,
+                                         is_first_batch_after_resume, params)
+                progress.count(quantity)
+                i += quantity
+                is_first_batch_after_resume = False
+        finally:
+            stream.close()
 
         progress.report()
         _LOG.info('Upload of %s complete', entity_class.__name__)
     return progress.get_count()
 
 
-def _find_existing_items(entity_class, entities, start, end):
+def _find_existing_items(entity_class, entities):
     keys = []
-    for i in xrange(start, end):
-        key, _ = _get_entity_key(entity_class, entities[i])
+    for entity in entities:
+        key, _ = _get_entity_key(entity_class, entity)
         keys.append(key)
     return db.get(keys)
 
@@ -1571,23 +1992,23 @@ def _find_existing_items(entity_class, entities, start, end):
 @_retry(message='Uploading batch of entities failed; retrying')
 def _upload_batch(entity_class, schema, entities, start,
                   is_first_batch_after_resume, params):
-    end = min(start + params.batch_size, len(entities))
-
     # See what elements we want to upload already exist in the datastore.
     if params.force_overwrite:
         existing = []
     else:
-        existing = _find_existing_items(entity_class, entities, start, end)
+        existing = _find_existing_items(entity_class, entities)
 
-    # Build up array of things to batch-put to DB.
+    # Build up array of things to batch-put to DB.  Objects are numbered from
+    # start, their position in the whole upload.
     to_put = []
-    for i in xrange(start, end):
-        key, id_or_name = _get_entity_key(entity_class, entities[i])
+    for offset, entity in enumerate(entities):
+        i = start + offset
+        key, id_or_name = _get_entity_key(entity_class, entity)
         if params.force_overwrite:
             if params.verbose:
                 _LOG.info('Forcing write of object #%d with key %s',
                           i, id_or_name)
-        elif existing[i - start]:
+        elif existing[offset]:
             if is_first_batch_after_resume:
                 if params.verbose:
                     _LOG.info('Not overwriting object #%d with key %s '
@@ -1600,11 +2021,11 @@ def _upload_batch(entity_class, schema, entities, start,
         else:
             if params.verbose:
                 _LOG.info('Adding new object #%d with key %s', i, id_or_name)
-        to_put.append(_build_entity(entity_class, schema, entities[i], key))
+        to_put.append(_build_entity(entity_class, schema, entity, key))
     if params.verbose:
-        _LOG.info('Sending batch of %d objects to DB', end - start)
+        _LOG.info('Sending batch of %d objects to DB', len(entities))
     db.put(to_put)
-    return end - start
+    return len(entities)
 
 
 def _get_entity_key(entity_class, entity):
@@ -1622,12 +2043,12 @@ def _build_entity(entity_class, schema, entity, key):
 
 def _validate_arguments(parsed_args):
     """Validate parsed args for additional constraints."""
-    if (parsed_args.mode in {_MODE_DOWNLOAD, _MODE_UPLOAD}
+    if (parsed_args.mode in {_MODE_DOWNLOAD, _MODE_MERGE, _MODE_UPLOAD}
         and not parsed_args.archive_path):
         _die('--archive_path missing')
     if parsed_args.batch_size < 1:
         _die('--batch_size must be a positive value')
-    if (parsed_args.mode == _MODE_DOWNLOAD and
+    if (parsed_args.mode in {_MODE_DOWNLOAD, _MODE_MERGE} and
         os.path.exists(parsed_args.archive_path) and
         not parsed_args.force_overwrite and
         not parsed_args.resume):
@@ -1658,6 +2079,22 @@ def _validate_arguments(parsed_args):
     if parsed_args.resume and parsed_args.mode not in (_MODE_UPLOAD,
                                                        _MODE_DOWNLOAD):
         _die('--resume flag is only supported for uploading.')
+    if (parsed_args.since or parsed_args.since_archive) and not (
+            parsed_args.mode == _MODE_DOWNLOAD and
+            parsed_args.type == _TYPE_DATASTORE):
+        _die(
+            '--since and --since_archive supported only if mode is %s and '
+            'type is %s' % (_MODE_DOWNLOAD, _TYPE_DATASTORE))
+    if parsed_args.since and parsed_args.since_archive:
+        _die('Pass only one of --since and --since_archive')
+    if parsed_args.mode == _MODE_MERGE and (
+            parsed_args.type != _TYPE_DATASTORE or
+            len(parsed_args.merge_archives) < 2):
+        _die(
+            'Mode %s needs type %s and at least two --merge_archives' % (
+                _MODE_MERGE, _TYPE_DATASTORE))
+    if parsed_args.merge_archives and parsed_args.mode != _MODE_MERGE:
+        _die('--merge_archives supported only if mode is ' + _MODE_MERGE)
 
 
 def _write_model_to_json_file(json_file, privacy_transform_fn, model):
@@ -1677,6 +2114,11 @@ def main(parsed_args, testing=False):
     _set_env_vars_from_app_yaml()
     _import_entity_modules()
 
+    if parsed_args.mode == _MODE_MERGE:
+        # Merging only reads and writes local archives.
+        _merge(parsed_args)
+        return
+
     environment = remote.Environment(
         parsed_args.server, port=parsed_args.port, testing=testing)
     _LOG.info('Mode is %s', parsed_args.mode)
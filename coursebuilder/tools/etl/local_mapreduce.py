@@ -0,0 +1,430 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs models.jobs.MapReduceJob subclasses locally, without the pipeline.
+
+The App Engine map/reduce pipeline is the only way our analytics jobs run
+on a deployment.  This module runs the same static map(), combine() and
+reduce() functions in a local pool of worker processes, so that analytics can
+be recomputed offline on a multi-core machine and so that the cost of a job's
+functions can be measured apart from the cost of the pipeline.
+
+Input entities are read either from the datastore (the remote server, or the
+local datastore stub when etl.py is given --disable_remote) or from the
+models/ section of an archive written by "etl.py download datastore".
+
+The run mimics what the pipeline does for the job:
+- build_additional_mapper_params() is merged into the mapper and reducer
+  params, which map() and reduce() see via mapreduce.context.get();
+- a 'filters' param is applied to the input, as DatastoreInputReader does;
+- keys and values emitted by map() and combine() are converted to strings;
+- mapped values are hash-partitioned by key, and each partition's keys are
+  sorted before being handed to reduce();
+- mapreduce.operation instances yielded by map() or reduce() (e.g.
+  operation.db.Put) are applied in the parent process;
+- other reduce() output goes through repr() and ast.literal_eval(), as the
+  pipeline's output writer and StoreMapReduceResults do, and complete() is
+  called with the results.
+
+Work sent to worker processes must be picklable, and worker processes do not
+share a datastore stub with their parent, so jobs whose map() or reduce()
+write to the datastore directly (rather than by yielding operations) should
+be run with --processes 1 against a local stub.
+"""
+
+import ast
+import logging
+import multiprocessing
+import operator
+import os
+import sys
+import time
+import uuid
+import zlib
+
+from mapreduce import context
+from mapreduce import model as mapreduce_model
+from mapreduce import operation
+
+from models import entity_transforms
+from models import jobs
+from models import transforms
+from tools.etl import etl_lib
+from google.appengine.ext import db
+
+_LOG = logging.getLogger('coursebuilder.tools.etl')
+
+# Comparison functions for the operators permitted in 'filters' params.
+_FILTER_OPERATORS = {
+    '=': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# Number of entities fetched per datastore round trip.
+_READ_BATCH_SIZE = 500
+
+
+def _set_context(mapreduce_id, params):
+    """Make params visible to job functions via mapreduce.context.get()."""
+    mapper_spec = mapreduce_model.MapperSpec(
+        None, 'mapreduce.input_readers.DatastoreInputReader', params, 1)
+    mapreduce_spec = mapreduce_model.MapreduceSpec(
+        'local', mapreduce_id, mapper_spec.to_json(), params=params)
+    ctx = context.Context(mapreduce_spec, None)
+    context.Context._set(ctx)  # pylint: disable=protected-access
+    return ctx
+
+
+def _partition_of(key, num_partitions):
+    return zlib.crc32(key) % num_partitions
+
+
+def _map_shard(args):
+    """Map and combine one shard of input; runs in a worker process.
+
+    Returns:
+        A 2-tuple of a list of num_partitions dicts mapping keys to lists of
+        values, and a list of the operations yielded by map().
+    """
+    job_class, mapreduce_id, params, items, num_partitions = args
+    _set_context(mapreduce_id, params)
+    partitions = [{} for _ in xrange(num_partitions)]
+    ops = []
+    for item in items:
+        for output in job_class.map(item) or []:
+            if isinstance(output, operation.Operation):
+                ops.append(output)
+                continue
+            key, value = output
+            key = str(key)
+            partition = partitions[_partition_of(key, num_partitions)]
+            partition.setdefault(key, []).append(str(value))
+    if LocalMapReduceRunner.has_combine(job_class):
+        for partition in partitions:
+            for key, values in partition.iteritems():
+                partition[key] = [
+                    str(value) for value in job_class.combine(key, values, [])]
+    return partitions, ops
+
+
+def _reduce_partition(args):
+    """Reduce one partition of sorted (key, values) items; runs in a worker.
+
+    Returns:
+        A 2-tuple of the list of results yielded by reduce() and the list of
+        operations yielded by reduce().
+    """
+    job_class, mapreduce_id, params, items = args
+    _set_context(mapreduce_id, params)
+    results = []
+    ops = []
+    for key, values in items:
+        for output in job_class.reduce(key, values) or []:
+            if isinstance(output, operation.Operation):
+                ops.append(output)
+            elif isinstance(output, basestring):
+                results.append(ast.literal_eval(str(output)))
+            else:
+                results.append(ast.literal_eval(repr(output)))
+    return results, ops
+
+
+class LocalMapReduceRunner(object):
+    """Runs a MapReduceJob's map, combine and reduce in local processes."""
+
+    def __init__(self, job, processes=1):
+        """Constructs a new runner.
+
+        Args:
+            job: jobs.MapReduceJob. The job to run; constructed with the
+                app_context of the course to run against.
+            processes: int. Number of worker processes.  With 1, all work is
+                done in the calling process.
+        """
+        if processes < 1:
+            raise ValueError('processes must be positive')
+        self._job = job
+        self._processes = processes
+        self._mapreduce_id = 'local-%s' % uuid.uuid4().hex
+        self.num_items = 0
+        self.timings = {}
+
+    @classmethod
+    def has_combine(cls, job_class):
+        return job_class.combine != jobs.MapReduceJob.combine
+
+    @classmethod
+    def has_complete(cls, job_class):
+        return job_class.complete != jobs.MapReduceJob.complete
+
+    def build_kwargs(self):
+        """Builds the parameters the pipeline would give this job.
+
+        Returns:
+            A dict with the same 'mapper_params' and 'reducer_params' items
+            MapReduceJob.non_transactional_submit() passes to the pipeline.
+        """
+        # pylint: disable=protected-access
+        mapper_params = self._job.build_additional_mapper_params(
+            self._job._app_context)
+        entity_class = self._job.entity_class()
+        mapper_params.update({
+            'entity_kind': '%s.%s' % (
+                entity_class.__module__, entity_class.__name__),
+            'namespace': self._job._namespace,
+        })
+        reducer_params = {}
+        reducer_params.update(mapper_params)
+        return {
+            'job_name': self._job.name,
+            'mapper_params': mapper_params,
+            'reducer_params': reducer_params,
+        }
+
+    def _timed(self, phase, fn, *args):
+        start = time.time()
+        ret = fn(*args)
+        self.timings[phase] = time.time() - start
+        return ret
+
+    def _split(self, items, num_shards):
+        shard_size = (len(items) + num_shards - 1) / num_shards or 1
+        return [items[i:i + shard_size]
+                for i in xrange(0, len(items), shard_size)]
+
+    def _map(self, pool, items, params):
+        job_class = self._job.__class__
+        tasks = [
+            (job_class, self._mapreduce_id, params, shard, self._processes)
+            for shard in self._split(items, self._processes)]
+        return pool.map(_map_shard, tasks) if pool else map(_map_shard, tasks)
+
+    def _shuffle(self, mapped):
+        partitions = [{} for _ in xrange(self._processes)]
+        for shard_partitions, _ in mapped:
+            for merged, partition in zip(partitions, shard_partitions):
+                for key, values in partition.iteritems():
+                    merged.setdefault(key, []).extend(values)
+        return [sorted(partition.iteritems()) for partition in partitions]
+
+    def _reduce(self, pool, partitions, params):
+        job_class = self._job.__class__
+        tasks = [(job_class, self._mapreduce_id, params, partition)
+                 for partition in partitions]
+        return (pool.map(_reduce_partition, tasks) if pool
+                else map(_reduce_partition, tasks))
+
+    def _apply(self, params, ops):
+        ctx = _set_context(self._mapreduce_id, params)
+        for op in ops:
+            op(ctx)
+        ctx.flush()
+
+    def run(self, read_items):
+        """Runs the job.
+
+        Args:
+            read_items: callable. Given the list of (property name, operator,
+                value) filters from the job's 'filters' param (possibly
+                empty), returns the list of entities of the job's
+                entity_class() to map over.
+
+        Returns:
+            The list of results, as MapReduceJob.get_results() would give for
+            a run of the job in the pipeline.  Time spent in each phase is
+            left in self.timings.
+        """
+        self.timings = {}
+        kwargs = self.build_kwargs()
+        job_class = self._job.__class__
+        items = self._timed(
+            'read', read_items, kwargs['mapper_params'].get('filters', []))
+        pool = None
+        if self._processes > 1:
+            pool = multiprocessing.Pool(self._processes)
+        try:
+            mapped = self._timed(
+                'map', self._map, pool, items, kwargs['mapper_params'])
+            partitions = self._timed('shuffle', self._shuffle, mapped)
+            reduced = self._timed(
+                'reduce', self._reduce, pool, partitions,
+                kwargs['reducer_params'])
+            if pool:
+                pool.close()
+                pool.join()
+                pool = None
+            self._timed(
+                'map_ops', self._apply, kwargs['mapper_params'],
+                [op for _, ops in mapped for op in ops])
+            self._timed(
+                'reduce_ops', self._apply, kwargs['reducer_params'],
+                [op for _, ops in reduced for op in ops])
+        finally:
+            if pool:
+                pool.terminate()
+            context.Context._set(None)  # pylint: disable=protected-access
+        self.num_items = len(items)
+        results = [result for results, _ in reduced for result in results]
+        if self.has_complete(job_class):
+            self._timed('complete', job_class.complete, kwargs, results)
+        return results
+
+
+def _matches_filters(entity, filters):
+    for name, op, value in filters:
+        if not _FILTER_OPERATORS[op](getattr(entity, name), value):
+            return False
+    return True
+
+
+def read_datastore_entities(entity_class, filters=None):
+    """Reads entities of entity_class from the current namespace."""
+    query = entity_class.all()
+    for name, op, value in filters or []:
+        query.filter('%s %s' % (name, op), value)
+    return list(query.run(batch_size=_READ_BATCH_SIZE))
+
+
+def read_archive_entities(archive_path, entity_class, filters=None):
+    """Reads entities of entity_class from an etl.py datastore archive.
+
+    Entity keys are built in the current namespace.  Archives written with
+    --privacy hold transformed values, so results computed from them will
+    differ from results computed from the datastore.
+    """
+    # Imported here; etl.py is normally run as __main__.
+    from tools.etl import etl
+    # pylint: disable=protected-access
+    if os.path.isdir(archive_path):
+        archive = etl._init_archive(archive_path, etl.ARCHIVE_TYPE_DIRECTORY)
+    else:
+        archive = etl._init_archive(archive_path, etl.ARCHIVE_TYPE_ZIP)
+    archive.open('r')
+    try:
+        json_text = archive.get(os.path.join(
+            etl._ARCHIVE_PATH_PREFIX_MODELS, entity_class.__name__ + '.json'))
+    finally:
+        archive.close()
+    if not json_text:
+        raise ValueError('Archive %s has no entities of type %s' % (
+            archive_path, entity_class.__name__))
+    schema = (entity_transforms
+              .get_schema_for_entity(entity_class)
+              .get_json_schema_dict())
+    ret = []
+    for row in transforms.loads(json_text)['rows']:
+        key = db.Key.from_path(
+            entity_class.kind(), row['key.id'] or row['key.name'])
+        entity = entity_class(key=key)
+        entity_transforms.dict_to_entity(entity, transforms.json_to_dict(
+            row, schema, permit_none_values=True))
+        if _matches_filters(entity, filters or []):
+            ret.append(entity)
+    return ret
+
+
+class RunMapReduceJob(etl_lib.CourseJob):
+    """Runs a MapReduceJob subclass over one course in local processes.
+
+    Usage:
+
+    etl.py run tools.etl.local_mapreduce.RunMapReduceJob /course \
+        server.appspot.com \
+        --job_args='path.to.MyMapReduceJob --processes 8 \
+            [--archive_path /path/to/archive.zip] \
+            [--output /path/to/results.json] [--save_results]'
+
+    Arguments to etl.py are documented in tools/etl/etl.py. You must do some
+    environment configuration (setting up imports, mostly) before you can run
+    etl.py; see the tools/etl/etl.py module-level docstring for details.
+    """
+
+    def _configure_parser(self):
+        self.parser.add_argument(
+            'job_class',
+            help='Full path of the jobs.MapReduceJob subclass to run',
+            type=str)
+        self.parser.add_argument(
+            '--processes', default=multiprocessing.cpu_count(),
+            help='Number of worker processes; 1 runs in-process', type=int)
+        self.parser.add_argument(
+            '--archive_path', default=None,
+            help=('Read input from this etl.py datastore archive rather than '
+                  'from the datastore'), type=str)
+        self.parser.add_argument(
+            '--output', default=None,
+            help='Absolute path of a file to write results to as JSON',
+            type=str)
+        self.parser.add_argument(
+            '--save_results', action='store_true',
+            help=('Record the results as the outcome of the job, as a run in '
+                  'the pipeline would'))
+
+    def _get_job_class(self):
+        try:
+            module_name, class_name = self.args.job_class.rsplit('.', 1)
+            module = __import__(module_name, globals(), locals(), [class_name])
+            job_class = getattr(module, class_name)
+        except (ImportError, AttributeError, ValueError):
+            sys.exit('Unable to import %s' % self.args.job_class)
+        if not (isinstance(job_class, type) and
+                issubclass(job_class, jobs.MapReduceJob)):
+            sys.exit('%s is not a %s' % (
+                self.args.job_class, jobs.MapReduceJob.__name__))
+        return job_class
+
+    def _save_results(self, job, results):
+        # pylint: disable=protected-access
+        sequence_num = db.run_in_transaction(
+            jobs.DurableJobEntity._create_job, job.name)
+        db.run_in_transaction(
+            jobs.DurableJobEntity._start_job, job.name, sequence_num)
+        db.run_in_transaction(
+            jobs.DurableJobEntity._complete_job, job.name, sequence_num,
+            jobs.MapReduceJob.build_output(None, results))
+
+    def main(self):
+        if self.args.processes < 1:
+            sys.exit('--processes must be positive')
+        if self.args.output and os.path.exists(self.args.output):
+            sys.exit('Cannot write results to %s; file exists' %
+                     self.args.output)
+        job_class = self._get_job_class()
+        job = job_class(
+            etl_lib.get_context(self.etl_args.course_url_prefix))
+        entity_class = job.entity_class()
+        if self.args.archive_path:
+            read_items = lambda filters: read_archive_entities(
+                self.args.archive_path, entity_class, filters)
+        else:
+            read_items = lambda filters: read_datastore_entities(
+                entity_class, filters)
+
+        runner = LocalMapReduceRunner(job, processes=self.args.processes)
+        results = runner.run(read_items)
+        _LOG.info(
+            'Ran %s over %d entities with %d processes; %s',
+            job_class.__name__, runner.num_items, self.args.processes,
+            ', '.join('%s: %.3fs' % (phase, sec)
+                      for phase, sec in sorted(runner.timings.iteritems())))
+        if self.args.save_results:
+            self._save_results(job, results)
+        if self.args.output:
+            with open(self.args.output, 'w') as f:
+                f.write(transforms.dumps(results))
+        else:
+            print transforms.dumps(results, indent=2)